@@ -0,0 +1,4 @@
+"""Benchmarks of the API (not part of the dashboard_api package).
+
+Run from the root directory of this project (needs the `test` extra).
+"""
@@ -0,0 +1,467 @@
+"""benchmarks.api: latency benchmark of the API endpoints.
+
+Requests are sent in-process to the ASGI app (no server, no network) against
+local fixture COGs of several sizes, an in-memory memcached stand-in and a
+mocked (moto) S3 bucket holding synthetic dataset and site metadata.
+
+Every scenario (route and fixture) runs twice: without cache, then with a
+warmed cache. Reported latencies are p50/p95/p99 in ms, throughput is in
+requests/s at the given concurrency. Results can be written to a JSON file
+and compared with the results of another commit:
+
+    python -m benchmarks.api --output before.json
+    git checkout my-branch
+    python -m benchmarks.api --compare before.json
+
+Run from the root directory of this project (needs the `test` extra).
+"""
+
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from urllib.parse import urlencode
+
+import mercantile
+import numpy
+import rasterio
+from rasterio.enums import Resampling
+from rasterio.shutil import copy as rio_copy
+from rasterio.transform import from_bounds
+
+from benchmarks.memcache import InMemoryMemcache
+from benchmarks.stats import summarize
+
+# Fixture COGs cover this area (EPSG:4326), so that /timelapse polygons can be
+# expressed in the raster CRS
+BOUNDS = (-10.0, 40.0, 0.0, 50.0)
+SIZES = [512, 2048, 8192]
+
+# Packages the cold start of endpoints which don't read rasters shouldn't load
+HEAVY_PACKAGES = [
+    "rasterio",
+    "rio_tiler",
+    "rio_color",
+    "rasterstats",
+    "shapely",
+    "numpy",
+    "boto3",
+    "jinja2",
+]
+
+Request = Tuple[str, str, Optional[bytes]]
+
+
+def make_cog(path: str, size: int, seed: int = 0):
+    """Write a `size`x`size` uint16 COG (512px blocks, with overviews)."""
+    rng = numpy.random.default_rng(seed)
+    y, x = numpy.mgrid[0:size, 0:size] / size
+    data = 500 + 400 * numpy.sin(6 * x) * numpy.cos(4 * y)
+    data = (data + rng.normal(0, 20, (size, size))).astype("uint16")
+
+    profile = dict(
+        driver="GTiff",
+        width=size,
+        height=size,
+        count=1,
+        dtype="uint16",
+        nodata=0,
+        crs="EPSG:4326",
+        transform=from_bounds(*BOUNDS, size, size),
+        tiled=True,
+        blockxsize=512,
+        blockysize=512,
+        compress="deflate",
+    )
+    with tempfile.NamedTemporaryFile(suffix=".tif") as tmp:
+        with rasterio.open(tmp.name, "w", **profile) as dst:
+            dst.write(data, 1)
+            factors = []
+            while size // 2 ** (len(factors) + 1) >= 256:
+                factors.append(2 ** (len(factors) + 1))
+            if factors:
+                dst.build_overviews(factors, Resampling.average)
+
+        rio_copy(
+            tmp.name,
+            path,
+            copy_src_overviews=True,
+            driver="GTiff",
+            tiled=True,
+            blockxsize=512,
+            blockysize=512,
+            compress="deflate",
+        )
+
+
+def make_datasets_metadata(
+    site_ids: Sequence[str], n_datasets: int = 10, n_dates: int = 365
+) -> Dict:
+    """Synthetic output of the dataset metadata generator."""
+    start = datetime.datetime(2019, 1, 1)
+    domain = [
+        (start + datetime.timedelta(days=i)).strftime("%Y-%m-%dT%H:%M:%SZ")
+        for i in range(n_dates)
+    ]
+    datasets = {
+        f"dataset-{i}": dict(
+            id=f"dataset-{i}",
+            name=f"Dataset {i}",
+            type="raster-timeseries",
+            time_unit="day",
+            is_periodic=False,
+            domain=domain,
+            source=dict(
+                type="raster",
+                tiles=[
+                    "{api_url}/{z}/{x}/{y}@1x?url=s3://bucket/dataset-%d/{spotlightId}_{date}.tif"
+                    % i
+                ],
+            ),
+        )
+        for i in range(n_datasets)
+    }
+    metadata = {"_all": datasets, "global": datasets}
+    metadata.update({site_id: datasets for site_id in site_ids})
+    return metadata
+
+
+async def _call(
+    app, method: str, path: str, body: Optional[bytes] = None
+) -> Tuple[int, Dict[str, str]]:
+    """Send a request to an ASGI app, return its status and headers."""
+    path, _, query = path.partition("?")
+    headers = [(b"host", b"benchmark"), (b"accept-encoding", b"gzip")]
+    if body is not None:
+        headers.append((b"content-type", b"application/json"))
+        headers.append((b"content-length", str(len(body)).encode()))
+    scope = {
+        "type": "http",
+        "http_version": "1.1",
+        "method": method,
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "root_path": "",
+        "query_string": query.encode(),
+        "headers": headers,
+        "client": ("127.0.0.1", 0),
+        "server": ("benchmark", 80),
+    }
+    response: Dict[str, Any] = {}
+    done = asyncio.Event()
+    sent = False
+
+    async def receive():
+        nonlocal sent
+        if not sent:
+            sent = True
+            return {"type": "http.request", "body": body or b"", "more_body": False}
+        await done.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            response["status"] = message["status"]
+            response["headers"] = {
+                k.decode().lower(): v.decode() for k, v in message["headers"]
+            }
+        elif message["type"] == "http.response.body" and not message.get("more_body"):
+            done.set()
+
+    await app(scope, receive, send)
+    return response["status"], response["headers"]
+
+
+async def _run_requests(
+    app, requests: List[Request], concurrency: int
+) -> Tuple[List[float], float, Dict[str, int]]:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+    counts: Dict[str, int] = {}
+
+    async def one(request: Request):
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                status, headers = await _call(app, *request)
+            except Exception:
+                # unhandled errors are re-raised by the app after the 500
+                status, headers = 500, {}
+            latencies.append(time.perf_counter() - start)
+            if status != 200:
+                counts["errors"] = counts.get("errors", 0) + 1
+            if headers.get("x-cache") == "HIT":
+                counts["hits"] = counts.get("hits", 0) + 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*[one(r) for r in requests])
+    return latencies, time.perf_counter() - start, counts
+
+
+def scenarios(
+    cog_dir: str, sizes: Sequence[int], site_ids: Sequence[str], n_tiles: int
+) -> Dict[str, List[Request]]:
+    """Requests of each scenario."""
+    west, south, east, north = BOUNDS
+    polygon = {
+        "type": "Feature",
+        "properties": {},
+        "geometry": {
+            "type": "Polygon",
+            "coordinates": [
+                [[-6, 44], [-4, 44], [-4, 46], [-6, 46], [-6, 44]],
+            ],
+        },
+    }
+
+    result: Dict[str, List[Request]] = {}
+    for size in sizes:
+        url = os.path.join(cog_dir, f"{size}.tif")
+        # zooms up to the native resolution of the COG
+        maxzoom = max(1, int(numpy.log2(size / 256 * 360 / (east - west))))
+        tiles = list(
+            mercantile.tiles(west, south, east, north, range(maxzoom - 2, maxzoom + 1))
+        )
+        step = max(1, len(tiles) // n_tiles)
+        qs = urlencode(dict(url=url, rescale="0,1000", color_map="viridis"))
+        result[f"tiles-{size}"] = [
+            ("GET", f"/v1/{t.z}/{t.x}/{t.y}@1x?{qs}", None) for t in tiles[::step]
+        ][:n_tiles]
+        result[f"metadata-{size}"] = [
+            ("GET", f"/v1/metadata?{urlencode(dict(url=url))}", None)
+        ]
+        result[f"tilejson-{size}"] = [
+            ("GET", f"/v1/tilejson.json?{urlencode(dict(url=url))}", None)
+        ]
+        body = dict(month=str(size), type="mean", geojson=polygon)
+        result[f"timelapse-{size}"] = [
+            ("POST", "/v1/timelapse", json.dumps(body).encode())
+        ]
+
+    result["datasets"] = [("GET", "/v1/datasets", None)]
+    result["datasets-spotlight"] = [
+        ("GET", f"/v1/datasets/{site_id}", None) for site_id in site_ids
+    ]
+    result["sites"] = [("GET", "/v1/sites", None)]
+    result["sites-id"] = [("GET", f"/v1/sites/{site_id}", None) for site_id in site_ids]
+    return result
+
+
+def import_report(module: str = "dashboard_api.main", top: int = 10) -> Dict:
+    """
+    Import `module` in a new interpreter with `-X importtime`.
+
+    Returns the total import time (ms), the packages taking the most time to
+    import (self time of all their modules) and the heavy packages loaded.
+
+    """
+    code = (
+        f"import sys, json; import {module}; "
+        f"print(json.dumps([p for p in {HEAVY_PACKAGES!r} if p in sys.modules]))"
+    )
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        check=True,
+    )
+
+    packages: Dict[str, int] = {}
+    for line in process.stderr.decode().splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, _, name = line[len("import time:") :].split("|")
+        package = name.strip().split(".")[0]
+        packages[package] = packages.get(package, 0) + int(self_us)
+
+    slowest = sorted(packages.items(), key=lambda item: item[1], reverse=True)
+    return dict(
+        module=module,
+        total=round(sum(packages.values()) / 1000, 1),
+        slowest={name: round(us / 1000, 1) for name, us in slowest[:top]},
+        heavy_packages=json.loads(process.stdout.decode().splitlines()[-1]),
+    )
+
+
+def _git_revision() -> Optional[str]:
+    try:
+        return (
+            subprocess.check_output(
+                ["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL
+            )
+            .decode()
+            .strip()
+        )
+    except Exception:
+        return None
+
+
+def run(
+    sizes: Sequence[int] = SIZES,
+    n_tiles: int = 50,
+    repeat: int = 5,
+    concurrency: int = 1,
+    only: Optional[Sequence[str]] = None,
+) -> Dict:
+    """Run the benchmark, return the results by cache mode and scenario."""
+    os.environ.setdefault("AWS_ACCESS_KEY_ID", "benchmark")
+    os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "benchmark")
+    os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+    os.environ.pop("ENV", None)
+
+    from moto import mock_s3
+
+    with mock_s3(), tempfile.TemporaryDirectory() as cog_dir:
+        from dashboard_api import main
+        from dashboard_api.api.api_v1.endpoints import timelapse
+        from dashboard_api.api.utils import get_zonal_stat
+        from dashboard_api.core import config
+        from dashboard_api.db import memcache
+        from dashboard_api.db.utils import s3_client
+
+        with open("example-site-metadata.json") as f:
+            sites = json.load(f)
+        site_ids = [site["id"] for site in sites["sites"]]
+
+        s3 = s3_client()
+        s3.create_bucket(Bucket=config.BUCKET)
+        s3.put_object(
+            Bucket=config.BUCKET,
+            Key=config.SITE_METADATA_FILENAME,
+            Body=json.dumps(sites).encode(),
+        )
+        s3.put_object(
+            Bucket=config.BUCKET,
+            Key=config.DATASET_METADATA_FILENAME,
+            Body=json.dumps(make_datasets_metadata(site_ids)).encode(),
+        )
+
+        for size in sizes:
+            make_cog(os.path.join(cog_dir, f"{size}.tif"), size)
+
+        # /timelapse reads `{month}.tif` from a public bucket, read the fixture instead
+        timelapse.get_zonal_stat = lambda geojson, raster: get_zonal_stat(
+            geojson, os.path.join(cog_dir, os.path.basename(raster))
+        )
+
+        requests = scenarios(cog_dir, sizes, site_ids, n_tiles)
+        if only:
+            requests = {
+                k: v for k, v in requests.items() if any(k.startswith(o) for o in only)
+            }
+
+        results: Dict[str, Any] = dict(
+            revision=_git_revision(),
+            python=platform.python_version(),
+            params=dict(
+                sizes=list(sizes), tiles=n_tiles, repeat=repeat, concurrency=concurrency
+            ),
+            imports=import_report(),
+            results={},
+        )
+        loop = asyncio.get_event_loop()
+        for mode in ["nocache", "cache"]:
+            main.cache = memcache.CacheLayer("benchmark") if mode == "cache" else None
+            if main.cache:
+                main.cache.client = InMemoryMemcache()
+
+            for name, scenario in requests.items():
+                # warm up (in-process caches, GDAL block cache, memcached)
+                loop.run_until_complete(_run_requests(main.app, scenario, concurrency))
+                latencies, elapsed, counts = loop.run_until_complete(
+                    _run_requests(main.app, scenario * repeat, concurrency)
+                )
+                summary = summarize(latencies, elapsed)
+                summary["hit_rate"] = round(counts.get("hits", 0) / len(latencies), 2)
+                summary["errors"] = counts.get("errors", 0)
+                results["results"].setdefault(mode, {})[name] = summary
+
+        main.cache = None
+
+    return results
+
+
+def format_results(results: Dict, baseline: Optional[Dict] = None) -> str:
+    """Format results as a table, with the p50/p95 change from a baseline."""
+    lines = [
+        f"revision: {results['revision']}, params: {json.dumps(results['params'])}"
+    ]
+    if baseline:
+        lines.append(f"baseline: {baseline['revision']}")
+    imports = results["imports"]
+    line = f"import {imports['module']}: {imports['total']}ms"
+    if baseline and baseline.get("imports"):
+        before = baseline["imports"]["total"]
+        line += f" ({(imports['total'] - before) / before:+.1%})"
+    lines.append(line)
+    lines.append(
+        "  slowest: " + ", ".join(f"{k} {v}ms" for k, v in imports["slowest"].items())
+    )
+    heavy = ", ".join(imports["heavy_packages"]) or "none"
+    lines.append(f"  heavy packages loaded: {heavy}")
+    header = f"{'mode':<8} {'scenario':<22} {'p50':>9} {'p95':>9} {'p99':>9} {'req/s':>8} {'hits':>5}"
+    if baseline:
+        header += f" {'p50 diff':>9} {'p95 diff':>9}"
+    lines.append(header)
+
+    for mode, scenarios in results["results"].items():
+        for name, r in scenarios.items():
+            line = f"{mode:<8} {name:<22} {r['p50']:>9} {r['p95']:>9} {r['p99']:>9} {r['throughput']:>8} {r['hit_rate']:>5}"
+            if r["errors"]:
+                line += f" ({r['errors']} errors)"
+            before = (baseline or {}).get("results", {}).get(mode, {}).get(name)
+            if before:
+                line += "".join(
+                    f" {(r[p] - before[p]) / before[p]:>+9.1%}" for p in ["p50", "p95"]
+                )
+            lines.append(line)
+    return "\n".join(lines)
+
+
+def main(argv: Optional[List[str]] = None):
+    """Run the benchmark and print the results."""
+    parser = argparse.ArgumentParser(description="Benchmark the API endpoints.")
+    parser.add_argument(
+        "--sizes",
+        default=",".join(map(str, SIZES)),
+        help="Coma (',') delimited sizes (px) of the fixture COGs.",
+    )
+    parser.add_argument("--tiles", type=int, default=50, help="Tiles per COG.")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per scenario.")
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument(
+        "--only", action="append", help="Only run scenarios with this prefix."
+    )
+    parser.add_argument("--output", help="Write the results to this JSON file.")
+    parser.add_argument("--compare", help="JSON results of a previous run.")
+    args = parser.parse_args(argv)
+
+    results = run(
+        sizes=[int(s) for s in args.sizes.split(",")],
+        n_tiles=args.tiles,
+        repeat=args.repeat,
+        concurrency=args.concurrency,
+        only=args.only,
+    )
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print(format_results(results, baseline))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
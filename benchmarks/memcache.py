@@ -0,0 +1,51 @@
+"""benchmarks.memcache: in-memory memcached stand-in (benchmarks and tests)."""
+
+import pickle
+from typing import Dict
+
+
+class InMemoryMemcache(object):
+    """
+    Minimal in-memory stand-in for `bmemcached.Client`.
+
+    Values are pickled like bmemcached does, so that serialization is part of
+    the measured cache hits.
+
+    """
+
+    def __init__(self, *args, **kwargs):
+        """Init client."""
+        self.store: Dict[str, bytes] = {}
+
+    def get(self, key):
+        """Get a value."""
+        value = self.store.get(key)
+        return pickle.loads(value) if value is not None else None
+
+    def get_multi(self, keys):
+        """Get several values."""
+        return {k: pickle.loads(self.store[k]) for k in keys if k in self.store}
+
+    def set(self, key, value, time=0):
+        """Set a value."""
+        self.store[key] = pickle.dumps(value)
+        return True
+
+    def add(self, key, value, time=0):
+        """Set a value if the key doesn't exist."""
+        if key in self.store:
+            return False
+        return self.set(key, value)
+
+    def incr(self, key, value):
+        """Increment a counter."""
+        counter = int(self.get(key) or 0) + value
+        self.set(key, counter)
+        return counter
+
+    def delete(self, key):
+        """Delete a value."""
+        return self.store.pop(key, None) is not None
+
+    def disconnect_all(self):
+        """Close connections (noop)."""
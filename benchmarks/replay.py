@@ -0,0 +1,276 @@
+"""benchmarks.replay: replay production access logs against an API instance.
+
+Reads the request stream of the `/v1` endpoints from access logs, then
+replays it against a (local) instance at the logged pace, divided by
+`--speedup`, with `--workers` concurrent workers. Reports latency
+percentiles (ms), error counts and cache hit rates (`X-Cache` header) by
+route, as well as how late requests were sent when workers can't keep up.
+
+Supported logs (plain or gzipped, one request per line):
+- ALB access logs
+- JSON access logs with `httpMethod`, `path`, an optional `queryString` and
+  `requestTimeEpoch` (ms) or `requestTime`, e.g API Gateway access logs.
+  API Gateway can't log query strings, so tiles requests can't be replayed
+  from them
+- the request lines logged by the API when `LOG_METRICS` is set (CloudWatch
+  exports of the lambda logs)
+
+    python -m benchmarks.replay --target http://localhost:8000 --speedup 10 \
+        --workers 16 logs/*.log.gz
+
+Run from the root directory of this project.
+"""
+
+import argparse
+import datetime
+import gzip
+import json
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from benchmarks.stats import summarize
+from dashboard_api.api.api_v1.api import api_router
+from dashboard_api.core import config
+
+from starlette.routing import Match
+
+ALB_PATTERN = re.compile(
+    r'^\S+ (?P<time>\S+) (?:\S+ ){10}"(?P<method>\S+) (?P<url>\S+) [^"]*"'
+)
+
+
+class LoggedRequest(NamedTuple):
+    """Request found in an access log."""
+
+    time: float
+    method: str
+    url: str
+    route: str
+
+
+class Result(NamedTuple):
+    """Response to a replayed request."""
+
+    route: str
+    latency: float
+    lag: float
+    status: int
+    cache: Optional[str]
+
+
+def match_route(method: str, path: str) -> Optional[str]:
+    """Return the endpoint name of a `/v1` request (as in the API metrics)."""
+    if not path.startswith(config.API_VERSION_STR):
+        return None
+    scope = {
+        "type": "http",
+        "method": method,
+        "path": path[len(config.API_VERSION_STR) :],
+    }
+    for route in api_router.routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return route.endpoint.__name__
+    return None
+
+
+def _parse_time(value: str) -> float:
+    for fmt in ["%Y-%m-%dT%H:%M:%S.%fZ", "%d/%b/%Y:%H:%M:%S %z"]:
+        try:
+            date = datetime.datetime.strptime(value, fmt)
+        except ValueError:
+            continue
+        if date.tzinfo is None:
+            date = date.replace(tzinfo=datetime.timezone.utc)
+        return date.timestamp()
+    raise ValueError(f"Unknown time format: {value}")
+
+
+def parse_line(line: str) -> Optional[LoggedRequest]:
+    """Parse an access log line (None if it's not a request to a `/v1` endpoint)."""
+    try:
+        start = line.find("{")
+        if start >= 0:
+            entry = json.loads(line[start:])
+            method = entry.get("method") or entry["httpMethod"]
+            path = entry["path"]
+            query = entry.get("query") or entry.get("queryString") or ""
+            if "time" in entry:
+                timestamp = float(entry["time"])
+            elif "requestTimeEpoch" in entry:
+                timestamp = float(entry["requestTimeEpoch"]) / 1000
+            else:
+                timestamp = _parse_time(entry["requestTime"])
+        else:
+            match = ALB_PATTERN.match(line)
+            if not match:
+                return None
+            method = match.group("method")
+            url = urlsplit(match.group("url"))
+            path, query = url.path, url.query
+            timestamp = _parse_time(match.group("time"))
+    except (KeyError, TypeError, ValueError):
+        return None
+
+    route = match_route(method, path)
+    if not route:
+        return None
+    return LoggedRequest(timestamp, method, f"{path}?{query}" if query else path, route)
+
+
+def read_logs(paths: Iterable[str]) -> Iterator[LoggedRequest]:
+    """Yield the `/v1` requests of access log files."""
+    for path in paths:
+        opener = gzip.open if path.endswith(".gz") else open
+        with opener(path, "rt") as f:  # type: ignore
+            for line in f:
+                request = parse_line(line)
+                if request:
+                    yield request
+
+
+def replay(
+    logged: List[LoggedRequest],
+    target: str,
+    speedup: float = 1,
+    workers: int = 8,
+    timeout: float = 30,
+) -> List[Result]:
+    """
+    Replay requests against `target`.
+
+    Requests are sent at their logged time (relative to the first request)
+    divided by `speedup`, or as fast as possible if `speedup` is 0.
+
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=workers)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+
+    target = target.rstrip("/")
+    first = logged[0].time
+    results: List[Result] = []
+    lock = threading.Lock()
+    start = time.perf_counter()
+
+    def send(request: LoggedRequest):
+        due = (request.time - first) / speedup if speedup else 0
+        delay = due - (time.perf_counter() - start)
+        if delay > 0:
+            time.sleep(delay)
+
+        sent = time.perf_counter()
+        try:
+            response = session.request(
+                request.method, target + request.url, timeout=timeout
+            )
+            status, cache = response.status_code, response.headers.get("X-Cache")
+        except requests.RequestException:
+            status, cache = 0, None
+        result = Result(
+            request.route,
+            time.perf_counter() - sent,
+            max(0, sent - start - due),
+            status,
+            cache,
+        )
+        with lock:
+            results.append(result)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(send, logged))
+
+    return results
+
+
+def report(results: List[Result], elapsed: float) -> Dict[str, Dict]:
+    """Return latency percentiles, errors, hit rate and lag by route."""
+    routes: Dict[str, List[Result]] = {"all": results}
+    for result in results:
+        routes.setdefault(result.route, []).append(result)
+
+    summary = {}
+    for route, route_results in sorted(routes.items()):
+        stats = summarize([r.latency for r in route_results], elapsed)
+        stats["errors"] = sum(1 for r in route_results if not 200 <= r.status < 400)
+        stats["hit_rate"] = round(
+            sum(1 for r in route_results if r.cache == "HIT") / len(route_results), 2
+        )
+        stats["max_lag"] = round(max(r.lag for r in route_results) * 1000, 2)
+        summary[route] = stats
+    return summary
+
+
+def main(argv: Optional[List[str]] = None):
+    """Replay access logs and print the results."""
+    parser = argparse.ArgumentParser(description="Replay access logs.")
+    parser.add_argument("logs", nargs="+", help="Access log files (or .gz).")
+    parser.add_argument(
+        "--target", default="http://localhost:8000", help="API base URL."
+    )
+    parser.add_argument(
+        "--speedup",
+        type=float,
+        default=1,
+        help="Replay speed factor (0: as fast as possible).",
+    )
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--limit", type=int, help="Only replay the first requests.")
+    parser.add_argument(
+        "--route", action="append", help="Only replay requests to this endpoint."
+    )
+    parser.add_argument("--output", help="Write the results to this JSON file.")
+    args = parser.parse_args(argv)
+
+    logged = sorted(read_logs(args.logs))
+    if args.route:
+        logged = [r for r in logged if r.route in args.route]
+    logged = logged[: args.limit]
+    if not logged:
+        parser.error("No /v1 requests found in the logs.")
+
+    duration = logged[-1].time - logged[0].time
+    print(f"Replaying {len(logged)} requests logged over {duration:.1f}s")
+    start = time.perf_counter()
+    results = replay(logged, args.target, args.speedup, args.workers)
+    elapsed = time.perf_counter() - start
+    summary = report(results, elapsed)
+
+    print(
+        f"{'route':<20} {'requests':>8} {'p50':>9} {'p95':>9} {'p99':>9} "
+        f"{'req/s':>8} {'errors':>6} {'hits':>5} {'max lag':>9}"
+    )
+    for route, r in summary.items():
+        print(
+            f"{route:<20} {r['requests']:>8} {r['p50']:>9} {r['p95']:>9} "
+            f"{r['p99']:>9} {r['throughput']:>8} {r['errors']:>6} "
+            f"{r['hit_rate']:>5} {r['max_lag']:>9}"
+        )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(
+                dict(
+                    params=dict(
+                        logs=args.logs,
+                        speedup=args.speedup,
+                        workers=args.workers,
+                        requests=len(logged),
+                    ),
+                    results=summary,
+                ),
+                f,
+                indent=2,
+            )
+
+
+if __name__ == "__main__":
+    main()
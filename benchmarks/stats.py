@@ -0,0 +1,18 @@
+"""benchmarks.stats: latency statistics shared by the benchmark and the replay."""
+
+from typing import Dict, Sequence
+
+import numpy
+
+
+def summarize(latencies: Sequence[float], elapsed: float) -> Dict[str, float]:
+    """Return latency percentiles (ms) and throughput (requests/s)."""
+    p50, p95, p99 = numpy.percentile(numpy.array(latencies) * 1000, [50, 95, 99])
+    return dict(
+        requests=len(latencies),
+        p50=round(p50, 2),
+        p95=round(p95, 2),
+        p99=round(p99, 2),
+        mean=round(float(numpy.mean(latencies)) * 1000, 2),
+        throughput=round(len(latencies) / elapsed, 1),
+    )
@@ -1,5 +1,11 @@
 """dashboard_api."""
 
-import pkg_resources
+try:
+    from importlib.metadata import version as _version
+except ImportError:  # python < 3.8
+    # pkg_resources scans every installed distribution on import (slow)
+    import pkg_resources
 
-version = pkg_resources.get_distribution(__package__).version
+    version = pkg_resources.get_distribution(__package__).version
+else:
+    version = _version(__package__)
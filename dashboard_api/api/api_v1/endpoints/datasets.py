@@ -1,12 +1,13 @@
 """Dataset endpoints."""
 from dashboard_api.api import utils
-from dashboard_api.core import config
-from dashboard_api.db.memcache import CacheLayer
+from dashboard_api.core import config, timing
+from dashboard_api.db.memcache import CacheLayer, DATASETS_NAMESPACE, site_namespace
 from dashboard_api.db.static.datasets import datasets
 from dashboard_api.db.static.errors import InvalidIdentifier
 from dashboard_api.models.static import Datasets
+from dashboard_api.ressources.enums import DomainFormat
 
-from fastapi import APIRouter, Depends, HTTPException, Response
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
 
 from starlette.requests import Request
 
@@ -21,15 +22,21 @@ router = APIRouter()
 def get_datasets(
     request: Request,
     response: Response,
+    domain_format: DomainFormat = Query(
+        DomainFormat.list,
+        description="Domains as lists of dates or run-length encoded (rle).",
+    ),
     cache_client: CacheLayer = Depends(utils.get_cache),
 ):
     """Return a list of datasets."""
-    dataset_hash = utils.get_hash(spotlight_id="all")
+    dataset_hash = utils.get_hash(spotlight_id="all", domain_format=domain_format)
     content = None
     if cache_client:
+        dataset_hash = cache_client.versioned_key(dataset_hash, DATASETS_NAMESPACE)
         content = cache_client.get_dataset_from_cache(dataset_hash)
         if content:
-            content = Datasets.parse_raw(content)
+            with timing.stage("parse"):
+                content = Datasets.parse_raw(content)
             response.headers["X-Cache"] = "HIT"
     if not content:
         scheme = request.url.scheme
@@ -37,10 +44,15 @@ def get_datasets(
         if config.API_VERSION_STR:
             host += config.API_VERSION_STR
 
-        content = datasets.get_all(api_url=f"{scheme}://{host}")
+        datasets.sync(cache_client)
+        content = datasets.get_all(
+            api_url=f"{scheme}://{host}", domain_format=domain_format.value
+        )
 
         if cache_client and content:
-            cache_client.set_dataset_cache(dataset_hash, content)
+            cache_client.set_dataset_cache(
+                dataset_hash, content, config.DATASETS_CACHE_TTL
+            )
 
     return content
 
@@ -56,17 +68,27 @@ def get_dataset(
     request: Request,
     spotlight_id: str,
     response: Response,
+    domain_format: DomainFormat = Query(
+        DomainFormat.list,
+        description="Domains as lists of dates or run-length encoded (rle).",
+    ),
     cache_client: CacheLayer = Depends(utils.get_cache),
 ):
     """Return dataset info for all datasets available for a given spotlight"""
     try:
-        dataset_hash = utils.get_hash(spotlight_id=spotlight_id)
+        dataset_hash = utils.get_hash(
+            spotlight_id=spotlight_id, domain_format=domain_format
+        )
         content = None
 
         if cache_client:
+            dataset_hash = cache_client.versioned_key(
+                dataset_hash, DATASETS_NAMESPACE, site_namespace(spotlight_id)
+            )
             content = cache_client.get_dataset_from_cache(dataset_hash)
             if content:
-                content = Datasets.parse_raw(content)
+                with timing.stage("parse"):
+                    content = Datasets.parse_raw(content)
                 response.headers["X-Cache"] = "HIT"
         if not content:
             scheme = request.url.scheme
@@ -74,10 +96,17 @@ def get_dataset(
             if config.API_VERSION_STR:
                 host += config.API_VERSION_STR
 
-            content = datasets.get(spotlight_id, api_url=f"{scheme}://{host}")
+            datasets.sync(cache_client)
+            content = datasets.get(
+                spotlight_id,
+                api_url=f"{scheme}://{host}",
+                domain_format=domain_format.value,
+            )
 
             if cache_client and content:
-                cache_client.set_dataset_cache(dataset_hash, content)
+                cache_client.set_dataset_cache(
+                    dataset_hash, content, config.DATASETS_CACHE_TTL
+                )
 
         return content
     except InvalidIdentifier:
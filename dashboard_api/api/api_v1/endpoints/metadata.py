@@ -1,29 +1,42 @@
 """API metadata."""
 
+import math
 import os
 import re
 from functools import partial
-from typing import Any, Dict, Optional, Union
+from typing import Any, Callable, Dict, Optional, Union
 from urllib.parse import urlencode
 
-import numpy
-from rio_tiler.io import cogeo
-
 from dashboard_api.api.utils import info as cogInfo
-from dashboard_api.core import config
+from dashboard_api.core import config, timing
+from dashboard_api.core.executors import run_io
 from dashboard_api.models.mapbox import TileJSON
 from dashboard_api.ressources.enums import ImageType
 
 from fastapi import APIRouter, Query
 
-from starlette.concurrency import run_in_threadpool
 from starlette.requests import Request
 from starlette.responses import Response
 
-_info = partial(run_in_threadpool, cogInfo)
-_bounds = partial(run_in_threadpool, cogeo.bounds)
-_metadata = partial(run_in_threadpool, cogeo.metadata)
-_spatial_info = partial(run_in_threadpool, cogeo.spatial_info)
+
+def _cogeo(name: str) -> Callable:
+    """Run a `rio_tiler.io.cogeo` function in the I/O executor.
+
+    rio-tiler (and rasterio) are imported on first use, see `dashboard_api.api.utils`.
+    """
+
+    async def _run(*args, **kwargs):
+        from rio_tiler.io import cogeo
+
+        return await run_io(getattr(cogeo, name), *args, **kwargs)
+
+    return _run
+
+
+_info = partial(run_io, cogInfo)
+_bounds = _cogeo("bounds")
+_metadata = _cogeo("metadata")
+_spatial_info = _cogeo("spatial_info")
 
 router = APIRouter()
 
@@ -72,7 +85,8 @@ async def tilejson(
     else:
         tile_url = f"{scheme}://{host}/{{z}}/{{x}}/{{y}}@{tile_scale}x?{qs}"
 
-    meta = await _spatial_info(url)
+    with timing.stage("read"):
+        meta = await _spatial_info(url)
     response.headers["Cache-Control"] = "max-age=3600"
     return dict(
         bounds=meta["bounds"],
@@ -93,7 +107,8 @@ async def bounds(
 ):
     """Handle /bounds requests."""
     response.headers["Cache-Control"] = "max-age=3600"
-    return await _bounds(url)
+    with timing.stage("read"):
+        return await _bounds(url)
 
 
 @router.get("/info", responses={200: {"description": "Return basic info on COG."}})
@@ -103,7 +118,8 @@ async def info(
 ):
     """Handle /info requests."""
     response.headers["Cache-Control"] = "max-age=3600"
-    return await _info(url)
+    with timing.stage("read"):
+        return await _info(url)
 
 
 @router.get(
@@ -139,7 +155,7 @@ async def metadata(
     indexes = tuple(int(s) for s in re.findall(r"\d+", bidx)) if bidx else None
 
     if nodata is not None:
-        nodata = numpy.nan if nodata == "nan" else float(nodata)
+        nodata = math.nan if nodata == "nan" else float(nodata)
 
     hist_options: Dict[str, Any] = dict()
     if histogram_bins:
@@ -148,12 +164,13 @@ async def metadata(
         hist_options.update(dict(range=list(map(float, histogram_range.split(",")))))
 
     response.headers["Cache-Control"] = "max-age=3600"
-    return await _metadata(
-        url,
-        pmin,
-        pmax,
-        nodata=nodata,
-        indexes=indexes,
-        hist_options=hist_options,
-        **kwargs,
-    )
+    with timing.stage("read"):
+        return await _metadata(
+            url,
+            pmin,
+            pmax,
+            nodata=nodata,
+            indexes=indexes,
+            hist_options=hist_options,
+            **kwargs,
+        )
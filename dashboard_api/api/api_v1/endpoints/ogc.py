@@ -1,25 +1,58 @@
 """API ogc."""
 
+from functools import lru_cache
+from typing import Optional, Tuple
 from urllib.parse import urlencode
 
-import rasterio
-from rasterio import warp
-from rio_tiler import constants
-from rio_tiler.mercator import get_zooms
-
-from dashboard_api.core import config
+from dashboard_api.api import footprint, utils
+from dashboard_api.core import config, timing
+from dashboard_api.core.executors import run_io
+from dashboard_api.db.memcache import CacheLayer, dataset_namespace
 from dashboard_api.ressources.common import mimetype
 from dashboard_api.ressources.enums import ImageType
-from dashboard_api.ressources.responses import XMLResponse
+from dashboard_api.ressources.responses import (
+    XMLResponse,
+    cache_control,
+    etag_matches,
+    get_etag,
+)
+from dashboard_api.ressources.templates import get_templates
 
-from fastapi import APIRouter, Query
+from fastapi import APIRouter, Depends, Header, Query
 
 from starlette.requests import Request
 from starlette.responses import Response
-from starlette.templating import Jinja2Templates
 
 router = APIRouter()
-templates = Jinja2Templates(directory="dashboard_api/templates")
+
+
+@lru_cache(maxsize=32)
+def _tile_matrices(minzoom: int, maxzoom: int, tile_scale: int) -> Tuple[str, ...]:
+    tilesize = tile_scale * 256
+    tileMatrix = []
+    for zoom in range(minzoom, maxzoom + 1):
+        tileMatrix.append(f"""<TileMatrix>
+                <ows:Identifier>{zoom}</ows:Identifier>
+                <ScaleDenominator>{559082264.02872 / 2 ** zoom / tile_scale}</ScaleDenominator>
+                <TopLeftCorner>-20037508.34278925 20037508.34278925</TopLeftCorner>
+                <TileWidth>{tilesize}</TileWidth>
+                <TileHeight>{tilesize}</TileHeight>
+                <MatrixWidth>{2 ** zoom}</MatrixWidth>
+                <MatrixHeight>{2 ** zoom}</MatrixHeight>
+            </TileMatrix>""")
+    return tuple(tileMatrix)
+
+
+async def _spatial_info(url: str, cache_client: Optional[CacheLayer]) -> dict:
+    """Return the bounds and zooms of a COG (shared with the tiles' footprints)."""
+    fp = await footprint.get_footprint(url, cache_client, mask=False)
+    if fp:
+        return dict(bounds=fp.bounds, minzoom=fp.minzoom, maxzoom=fp.maxzoom)
+
+    # imported on first use, see `dashboard_api.api.utils`
+    from rio_tiler.io import cogeo
+
+    return await run_io(cogeo.spatial_info, url)
 
 
 @router.get(
@@ -27,9 +60,8 @@ templates = Jinja2Templates(directory="dashboard_api/templates")
     responses={200: {"content": {"application/xml": {}}}},
     response_class=XMLResponse,
 )
-def wtms(
+async def wtms(
     request: Request,
-    response: Response,
     url: str = Query(..., description="Cloud Optimized GeoTIFF URL."),
     tile_format: ImageType = Query(
         ImageType.png, description="Output image type. Default is png."
@@ -37,6 +69,10 @@ def wtms(
     tile_scale: int = Query(
         1, gt=0, lt=4, description="Tile size scale. 1=256x256, 2=512x512..."
     ),
+    if_none_match: Optional[str] = Header(
+        None, description="ETag of the cached copy of the document (304 if matched)."
+    ),
+    cache_client: CacheLayer = Depends(utils.get_cache),
 ):
     """Wmts endpoit."""
     scheme = request.url.scheme
@@ -50,42 +86,49 @@ def wtms(
     kwargs.pop("tile_scale", None)
     qs = urlencode(list(kwargs.items()))
 
-    with rasterio.open(url) as src_dst:
-        bounds = list(
-            warp.transform_bounds(
-                src_dst.crs, constants.WGS84_CRS, *src_dst.bounds, densify_pts=21
-            )
+    # documents only depend on the COG and the request's URL
+    caps_hash = utils.get_hash(
+        endpoint=endpoint,
+        query_string=qs,
+        tile_format=tile_format.value,
+        tile_scale=tile_scale,
+    )
+    cached = None
+    if cache_client:
+        caps_hash = cache_client.versioned_key(
+            caps_hash, dataset_namespace(utils.get_dataset_folder(url))
         )
-        minzoom, maxzoom = get_zooms(src_dst)
+        cached = cache_client.get_capabilities_from_cache(caps_hash)
 
-    media_type = mimetype[tile_format.value]
-    tilesize = tile_scale * 256
-    tileMatrix = []
-    for zoom in range(minzoom, maxzoom + 1):
-        tileMatrix.append(
-            f"""<TileMatrix>
-                <ows:Identifier>{zoom}</ows:Identifier>
-                <ScaleDenominator>{559082264.02872 / 2 ** zoom / tile_scale}</ScaleDenominator>
-                <TopLeftCorner>-20037508.34278925 20037508.34278925</TopLeftCorner>
-                <TileWidth>{tilesize}</TileWidth>
-                <TileHeight>{tilesize}</TileHeight>
-                <MatrixWidth>{2 ** zoom}</MatrixWidth>
-                <MatrixHeight>{2 ** zoom}</MatrixHeight>
-            </TileMatrix>"""
+    if cached:
+        content, etag = cached
+    else:
+        with timing.stage("read"):
+            info = await _spatial_info(url, cache_client)
+
+        content = (
+            get_templates()
+            .get_template("wmts.xml")
+            .render(
+                endpoint=endpoint,
+                bounds=list(info["bounds"]),
+                tileMatrix=_tile_matrices(info["minzoom"], info["maxzoom"], tile_scale),
+                title="Cloud Optimized GeoTIFF",
+                query_string=qs,
+                tile_scale=tile_scale,
+                tile_format=tile_format.value,
+                media_type=mimetype[tile_format.value],
+            )
+            .encode()
         )
+        etag = get_etag(content)
+        if cache_client:
+            cache_client.set_capabilities_cache(caps_hash, (content, etag))
 
-    return templates.TemplateResponse(
-        "wmts.xml",
-        {
-            "request": request,
-            "endpoint": endpoint,
-            "bounds": bounds,
-            "tileMatrix": tileMatrix,
-            "title": "Cloud Optimized GeoTIFF",
-            "query_string": qs,
-            "tile_scale": tile_scale,
-            "tile_format": tile_format.value,
-            "media_type": media_type,
-        },
-        media_type="application/xml",
-    )
+    headers = {
+        "Cache-Control": cache_control(config.CAPABILITIES_MAX_AGE),
+        "ETag": etag,
+    }
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+    return XMLResponse(content, headers=headers)
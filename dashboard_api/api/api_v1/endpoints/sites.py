@@ -2,7 +2,7 @@
 
 from dashboard_api.api import utils
 from dashboard_api.db.static.sites import sites as sites_manager
-from dashboard_api.db.memcache import CacheLayer
+from dashboard_api.db.memcache import CacheLayer, SITES_NAMESPACE, site_namespace
 from dashboard_api.core import config
 from dashboard_api.models.static import Site, Sites
 
@@ -24,8 +24,10 @@ def get_sites(
     sites_hash = utils.get_hash(site_id="_all")
     sites = None
     if cache_client:
-        sites = cache_client.get_dataset_from_cache(sites_hash)
+        sites_hash = cache_client.versioned_key(sites_hash, SITES_NAMESPACE)
+        sites = cache_client.get_dataset_from_cache(sites_hash, keyspace="sites")
         if sites:
+            sites = Sites.parse_raw(sites)
             response.headers["X-Cache"] = "HIT"
     if not sites:
         scheme = request.url.scheme
@@ -36,7 +38,9 @@ def get_sites(
         sites = sites_manager.get_all(api_url=f"{scheme}://{host}")
 
         if cache_client and sites:
-            cache_client.set_dataset_cache(sites_hash, sites, 60)
+            cache_client.set_dataset_cache(
+                sites_hash, sites, config.SITES_CACHE_TTL, keyspace="sites"
+            )
 
     return sites
 
@@ -57,14 +61,20 @@ def get_site(
     site = None
 
     if cache_client:
-        site = cache_client.get_dataset_from_cache(site_hash)
+        site_hash = cache_client.versioned_key(
+            site_hash, SITES_NAMESPACE, site_namespace(site_id)
+        )
+        site = cache_client.get_dataset_from_cache(site_hash, keyspace="sites")
 
     if site:
+        site = Site.parse_raw(site)
         response.headers["X-Cache"] = "HIT"
     else:
         site = sites_manager.get(site_id, _api_url(request))
         if cache_client and site:
-            cache_client.set_dataset_cache(site_hash, site, 60)
+            cache_client.set_dataset_cache(
+                site_hash, site, config.SITES_CACHE_TTL, keyspace="sites"
+            )
 
     if not site:
         raise HTTPException(
@@ -1,31 +1,27 @@
 """API tiles."""
 
 import re
-from functools import partial
-from io import BytesIO
-from typing import Any, Dict, Optional, Union
-
-import numpy
-from rio_tiler.colormap import get_colormap
-from rio_tiler.io import cogeo
-from rio_tiler.profiles import img_profiles
-from rio_tiler.utils import geotiff_options, render
-
-from dashboard_api.api import utils
-from dashboard_api.db.memcache import CacheLayer
+from typing import Any, Dict, Optional, Tuple, Union
+
+from dashboard_api.api import encoding, footprint, utils
+from dashboard_api.core import config, timing
+from dashboard_api.core.executors import run_cpu_shared, run_io
+from dashboard_api.db.memcache import CacheLayer, dataset_namespace
+from dashboard_api.db.static.datasets import datasets
 from dashboard_api.ressources.common import drivers, mimetype
-from dashboard_api.ressources.enums import ImageType
-from dashboard_api.ressources.responses import TileResponse
+from dashboard_api.ressources.enums import ImageType, TileEncoding
+from dashboard_api.ressources.responses import (
+    TileResponse,
+    cache_control,
+    etag_matches,
+    get_etag,
+)
 
-from fastapi import APIRouter, Depends, Path, Query
+from fastapi import APIRouter, Depends, Header, Path, Query
 
+from starlette.background import BackgroundTask
 from starlette.concurrency import run_in_threadpool
 
-_tile = partial(run_in_threadpool, cogeo.tile)
-_render = partial(run_in_threadpool, render)
-_postprocess = partial(run_in_threadpool, utils.postprocess)
-
-
 router = APIRouter()
 responses = {
     200: {
@@ -68,11 +64,55 @@ async def tile(
     color_map: Optional[utils.ColorMapName] = Query(
         None, title="rio-tiler color map name"
     ),
+    x_tile_encoding: TileEncoding = Header(
+        None,
+        description="Encoder settings: fast (default) or compact, if enabled.",
+    ),
+    if_none_match: Optional[str] = Header(
+        None, description="ETags of the cached copies of the tile (304 if matched)."
+    ),
     cache_client: CacheLayer = Depends(utils.get_cache),
 ) -> TileResponse:
     """Handle /tiles requests."""
-    timings = []
     headers: Dict[str, str] = {}
+    background = None
+    folder = utils.get_dataset_folder(url)
+
+    async def _cache_policy() -> Tuple[int, str]:
+        # memcached TTL and Cache-Control header of the tile, only looked up
+        # on cache misses (cached tiles have their Cache-Control header)
+        policy = await run_in_threadpool(datasets.cache_policy, folder, url)
+        immutable = bool(policy and policy.immutable)
+        max_age = config.TILES_MAX_AGE
+        stale_while_revalidate = config.TILES_STALE_WHILE_REVALIDATE
+        cache_ttl = config.TILES_CACHE_TTL
+        if immutable:
+            # dated COGs never change: the tile URL always returns the same image
+            max_age = config.TILES_IMMUTABLE_MAX_AGE
+            stale_while_revalidate = 0
+            cache_ttl = config.TILES_IMMUTABLE_CACHE_TTL
+        if policy and policy.max_age is not None:
+            max_age = policy.max_age
+        if policy and policy.stale_while_revalidate is not None and not immutable:
+            stale_while_revalidate = policy.stale_while_revalidate
+        return cache_ttl, cache_control(max_age, stale_while_revalidate, immutable)
+
+    def _response(
+        content: bytes,
+        img_type: ImageType,
+        etag: str,
+        control: str,
+        background=None,
+    ) -> TileResponse:
+        return TileResponse(
+            content,
+            media_type=mimetype[img_type.value],
+            status_code=304 if etag_matches(if_none_match, etag) else 200,
+            headers=headers,
+            background=background,
+            etag=etag,
+            cache_control=control,
+        )
 
     tile_hash = utils.get_hash(
         **dict(
@@ -91,65 +131,123 @@ async def tile(
     )
     tilesize = scale * 256
 
-    content = None
-    if cache_client:
-        try:
-            content, ext = cache_client.get_image_from_cache(tile_hash)
-            headers["X-Cache"] = "HIT"
-        except Exception:
-            content = None
+    # the header is ignored unless enabled: compact encoding is slower, and
+    # tiles are cached whatever their encoding
+    profile = config.TILE_ENCODING
+    if x_tile_encoding and config.TILE_ENCODING_HEADER:
+        profile = x_tile_encoding
 
-    if not content:
-        indexes = tuple(int(s) for s in re.findall(r"\d+", bidx)) if bidx else None
+    def _options(driver: str) -> Dict[str, Any]:
+        return encoding.creation_options(driver, profile)
 
-        if nodata is not None:
-            nodata = numpy.nan if nodata == "nan" else float(nodata)
-
-        with utils.Timer() as t:
-            tile, mask = await _tile(
-                url, x, y, z, indexes=indexes, tilesize=tilesize, nodata=nodata
-            )
-        timings.append(("Read", t.elapsed))
-
-        if not ext:
-            ext = ImageType.jpg if mask.all() else ImageType.png
-
-        with utils.Timer() as t:
-            tile = await _postprocess(
-                tile, mask, rescale=rescale, color_formula=color_formula
-            )
-        timings.append(("Post-process", t.elapsed))
+    def _empty(reason: str) -> TileResponse:
+        # shared transparent tile: not rendered, not cached
+        footprint.EMPTY_TILES.inc(reason=reason)
+        img_type = ext or ImageType.png
+        driver = drivers[img_type.value]
+        content = encoding.empty_tile(driver, tilesize, **_options(driver))
+        return _response(content, img_type, get_etag(content), control)
 
-        if color_map:
-            if color_map.value.startswith("custom_"):
-                color_map = utils.get_custom_cmap(color_map.value)  # type: ignore
-            else:
-                color_map = get_colormap(color_map.value)  # type: ignore
-
-        with utils.Timer() as t:
-            if ext == ImageType.npy:
-                sio = BytesIO()
-                numpy.save(sio, (tile, mask))
-                sio.seek(0)
-                content = sio.getvalue()
+    content = None
+    if cache_client:
+        tile_hash = cache_client.versioned_key(tile_hash, dataset_namespace(folder))
+        cached = cache_client.get_image_from_cache(tile_hash, use_store=False)
+        if cached:
+            # tiles cached before ETags (or Cache-Control headers) were added
+            # have none
+            content, ext, *extra = cached
+            etag = extra[0] if extra else get_etag(content)
+            if len(extra) > 1:
+                control = extra[1]
             else:
-                driver = drivers[ext.value]
-                options = img_profiles.get(driver.lower(), {})
-                if ext == ImageType.tif:
-                    options = geotiff_options(x, y, z, tilesize=tilesize)
-
-                content = await _render(
-                    tile, mask, img_format=driver, colormap=color_map, **options
-                )
-
-        timings.append(("Format", t.elapsed))
-
-        if cache_client and content:
-            cache_client.set_image_cache(tile_hash, (content, ext))
+                _, control = await _cache_policy()
+            headers["X-Cache"] = "HIT"
+            return _response(content, ext, etag, control)
 
-    if timings:
-        headers["X-Server-Timings"] = "; ".join(
-            ["{} - {:0.2f}".format(name, time * 1000) for (name, time) in timings]
+    cache_ttl, control = await _cache_policy()
+    if cache_client and cache_client.store:
+        # the store is slow (e.g S3), don't block the event loop
+        cached = await run_io(
+            cache_client.get_persistent_image, tile_hash, cache_ttl, control
         )
+        if cached:
+            content, ext, etag, *_ = cached
+            headers["X-Cache"] = "HIT"
+            return _response(content, ext, etag, control)
+
+    # tiles outside the data footprint of the COG are empty (only looked up
+    # on cache misses: cache hits don't load GDAL)
+    if ext not in [ImageType.npy, ImageType.tif]:
+        with timing.stage("footprint"):
+            fp = await footprint.get_footprint(url, cache_client)
+        if fp and not fp.intersects(x, y, z, use_mask=False):
+            return _empty("bounds")
+        # the internal mask doesn't apply if nodata is overwritten
+        if fp and nodata is None and not fp.intersects(x, y, z):
+            return _empty("mask")
+
+    # imported on first use, see `dashboard_api.api.utils`
+    import numpy
+    from rio_tiler.errors import TileOutsideBounds
+    from rio_tiler.io import cogeo
+    from rio_tiler.utils import geotiff_options
+
+    indexes = tuple(int(s) for s in re.findall(r"\d+", bidx)) if bidx else None
+
+    if nodata is not None:
+        nodata = numpy.nan if nodata == "nan" else float(nodata)
+
+    try:
+        with timing.stage("read"):
+            tile, mask = await run_io(
+                cogeo.tile,
+                url,
+                x,
+                y,
+                z,
+                indexes=indexes,
+                tilesize=tilesize,
+                nodata=nodata,
+            )
+    except TileOutsideBounds:
+        if ext in [ImageType.npy, ImageType.tif]:
+            raise
+        return _empty("bounds")
+
+    if not ext:
+        ext = ImageType.jpg if mask.all() else ImageType.png
+
+    driver, options = None, {}
+    if ext != ImageType.npy:
+        driver = drivers[ext.value]
+        options = _options(driver)
+        if ext == ImageType.tif:
+            options = geotiff_options(x, y, z, tilesize=tilesize)
+
+    # postprocess, colormap and encoding, in a rendering process if enabled
+    with timing.stage("render"):
+        content = await run_cpu_shared(
+            utils.render_tile,
+            [tile, mask],
+            img_format=driver,
+            colormap=color_map.value if color_map else None,
+            rescale=rescale,
+            color_formula=color_formula,
+            **options,
+        )
+    etag = get_etag(content)
+
+    if cache_client and content:
+        cache_client.set_image_cache(
+            tile_hash,
+            (content, ext),
+            timeout=cache_ttl,
+            etag=etag,
+            cache_control=control,
+        )
+        if cache_client.store:
+            background = BackgroundTask(
+                cache_client.set_persistent_image_cache, tile_hash, (content, ext)
+            )
 
-    return TileResponse(content, media_type=mimetype[ext.value], headers=headers)
+    return _response(content, ext, etag, control, background=background)
@@ -0,0 +1,250 @@
+"""dashboard_api.api.footprint: data footprints of COGs.
+
+A footprint holds the bounds and zoom levels of a COG and a low resolution
+mask of its valid data (`FOOTPRINT_SIZE` pixels wide at most). Each pixel of
+the mask is valid if any pixel of the full resolution mask it covers is
+valid: decimated overviews could miss small valid areas. The full resolution
+mask is read block by block, only for COGs up to `FOOTPRINT_MAX_PIXELS`
+pixels (larger ones get their bounds checked only). Tiles that don't
+intersect the footprint are empty:
+they are served without reading the COG, rendering or caching them (see
+`endpoints/tiles.py`). The bounds and zoom levels are also the spatial
+metadata of the WMTS capabilities (see `endpoints/ogc.py`).
+
+Reading the full resolution mask is much slower than rendering a tile: the
+first request of a COG only gets its bounds (read from the COG header), and
+the mask is computed in the background executor. Footprints are kept in
+memory and in the cache layer once complete, versioned by the dataset's
+cache generation. Failures are kept in memory for `FOOTPRINT_FAILURE_TTL`
+seconds, so that tiles of a COG that can't be opened don't retry it on every
+request.
+"""
+
+import math
+import threading
+from typing import TYPE_CHECKING, Any, Dict, NamedTuple, Optional, Set, Tuple
+
+from cachetools import TTLCache
+
+from dashboard_api.core import config, metrics
+from dashboard_api.core.executors import run_background, run_io
+from dashboard_api.db.memcache import CacheLayer, dataset_namespace
+
+if TYPE_CHECKING:
+    import numpy as np
+
+EMPTY_TILES = metrics.registry.counter(
+    "tiles_empty_total", "Empty tiles served without reading the COG, by reason."
+)
+
+# complete footprints, and footprints without their mask (yet)
+_footprints: TTLCache = TTLCache(256, 3600)
+_bounds: TTLCache = TTLCache(256, 3600)
+_failures: TTLCache = TTLCache(256, config.FOOTPRINT_FAILURE_TTL)
+# COGs whose mask is being computed, the caches are also updated by the
+# background executor
+_pending: Set[str] = set()
+_lock = threading.Lock()
+
+
+class Footprint(NamedTuple):
+    """Bounds (WGS84), zooms and valid data mask of a COG (None if all valid)."""
+
+    bounds: Tuple[float, float, float, float]
+    minzoom: int
+    maxzoom: int
+    crs: str
+    transform: Tuple[float, ...]
+    mask: Optional["np.ndarray"]
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Serialize the footprint (bit packed mask)."""
+        import numpy
+
+        mask = None
+        if self.mask is not None:
+            mask = dict(shape=self.mask.shape, bits=numpy.packbits(self.mask).tobytes())
+        return dict(self._asdict(), mask=mask)
+
+    @classmethod
+    def from_dict(cls, value: Dict[str, Any]) -> "Footprint":
+        """Deserialize a footprint."""
+        import numpy
+
+        mask = None
+        if value["mask"] is not None:
+            shape = tuple(value["mask"]["shape"])
+            bits = numpy.frombuffer(value["mask"]["bits"], dtype="uint8")
+            mask = numpy.unpackbits(bits)[: shape[0] * shape[1]].reshape(shape)
+            mask = mask.astype(bool)
+        return cls(
+            bounds=tuple(value["bounds"]),
+            minzoom=value["minzoom"],
+            maxzoom=value["maxzoom"],
+            crs=value["crs"],
+            transform=tuple(value["transform"]),
+            mask=mask,
+        )
+
+    def intersects(self, x: int, y: int, z: int, use_mask: bool = True) -> bool:
+        """Check if a mercator tile may contain valid data."""
+        import mercantile
+        from rasterio.warp import transform_bounds
+        from rasterio.windows import from_bounds
+        from rio_tiler.utils import tile_exists
+
+        if not tile_exists(self.bounds, z, x, y):
+            return False
+        if self.mask is None or not use_mask:
+            return True
+
+        from affine import Affine
+
+        tile_bounds = transform_bounds(
+            "EPSG:3857",
+            self.crs,
+            *mercantile.xy_bounds(mercantile.Tile(x, y, z)),
+            densify_pts=21,
+        )
+        if not all(map(math.isfinite, tile_bounds)):
+            return True
+
+        window = from_bounds(*tile_bounds, transform=Affine(*self.transform))
+        height, width = self.mask.shape
+        row_min = max(0, math.floor(window.row_off))
+        row_max = min(height, math.ceil(window.row_off + window.height))
+        col_min = max(0, math.floor(window.col_off))
+        col_max = min(width, math.ceil(window.col_off + window.width))
+        if row_min >= row_max or col_min >= col_max:
+            return False
+        return bool(self.mask[row_min:row_max, col_min:col_max].any())
+
+
+def compute(
+    url: str,
+    size: int = config.FOOTPRINT_SIZE,
+    max_pixels: int = config.FOOTPRINT_MAX_PIXELS,
+) -> Footprint:
+    """Compute the footprint of a COG (bounds only if `size` is 0)."""
+    import numpy
+    import rasterio
+    from rasterio.enums import MaskFlags
+    from rasterio.warp import transform_bounds
+    from rasterio.windows import Window
+    from rio_tiler.mercator import get_zooms
+
+    with rasterio.open(url) as src:
+        # as `rio_tiler.io.cogeo.spatial_info`
+        bounds = transform_bounds(src.crs, "EPSG:4326", *src.bounds, densify_pts=21)
+        minzoom, maxzoom = get_zooms(src)
+        crs = src.crs.to_string()
+        all_valid = all(flags == [MaskFlags.all_valid] for flags in src.mask_flag_enums)
+        if all_valid or not size or src.width * src.height > max_pixels:
+            return Footprint(
+                bounds, minzoom, maxzoom, crs, tuple(src.transform)[:6], None
+            )
+
+        # each mask pixel covers `scale` x `scale` full resolution pixels
+        scale = max(1, math.ceil(max(src.width, src.height) / size))
+        height = math.ceil(src.height / scale)
+        width = math.ceil(src.width / scale)
+        mask = numpy.zeros((height, width), dtype=bool)
+        # strips of whole blocks, and of whole mask rows
+        block_height = src.block_shapes[0][0]
+        strip = scale * max(1, math.ceil(block_height / scale))
+        for row in range(0, src.height, strip):
+            rows = min(strip, src.height - row)
+            valid = src.dataset_mask(window=Window(0, row, src.width, rows)) > 0
+            padded = numpy.zeros(
+                (math.ceil(rows / scale) * scale, width * scale), dtype=bool
+            )
+            padded[:rows, : src.width] = valid
+            mask[row // scale : (row + rows - 1) // scale + 1] = padded.reshape(
+                -1, scale, width, scale
+            ).any(axis=(1, 3))
+        transform = src.transform * src.transform.scale(scale, scale)
+
+    return Footprint(bounds, minzoom, maxzoom, crs, tuple(transform)[:6], mask)
+
+
+def _compute_mask(url: str, key: Optional[str], cache: Optional[CacheLayer]):
+    """Compute the complete footprint of a COG (in the background executor)."""
+    try:
+        footprint = compute(url)
+    except Exception as e:
+        # the bounds are still checked
+        print(f"Unable to compute the footprint mask of {url}: {e!r}")
+        return
+    finally:
+        with _lock:
+            _pending.discard(url)
+
+    with _lock:
+        _footprints[url] = footprint
+        _bounds.pop(url, None)
+    if cache:
+        cache.set_footprint_cache(key, footprint.to_dict())
+
+
+async def get_footprint(
+    url: str, cache: Optional[CacheLayer] = None, mask: bool = True
+) -> Optional[Footprint]:
+    """
+    Return the footprint of a COG (None if it can't be computed).
+
+    Until its mask is computed, the footprint of a COG only has its bounds.
+    The mask is computed in the background, unless `mask` is False (e.g for
+    the bounds and zoom levels only).
+
+    """
+    from dashboard_api.api import utils
+
+    with _lock:
+        footprint = _footprints.get(url)
+        if footprint is not None or url in _failures:
+            return footprint
+
+    key = utils.get_hash(
+        footprint=url,
+        size=config.FOOTPRINT_SIZE,
+        max_pixels=config.FOOTPRINT_MAX_PIXELS,
+        fields=Footprint._fields,
+    )
+    if cache:
+        key = cache.versioned_key(key, dataset_namespace(utils.get_dataset_folder(url)))
+        value = cache.get_footprint_from_cache(key)
+        if value is not None:
+            footprint = Footprint.from_dict(value)
+            with _lock:
+                _footprints[url] = footprint
+            return footprint
+
+    with _lock:
+        footprint = _bounds.get(url)
+    if footprint is None:
+        try:
+            footprint = await run_io(compute, url, 0)
+        except Exception as e:
+            print(f"Unable to compute the footprint of {url}: {e!r}")
+            with _lock:
+                _failures[url] = True
+            return None
+
+        if not config.FOOTPRINT_SIZE:
+            # the bounds are the complete footprint
+            with _lock:
+                _footprints[url] = footprint
+            if cache:
+                cache.set_footprint_cache(key, footprint.to_dict())
+            return footprint
+
+        with _lock:
+            _bounds[url] = footprint
+
+    with _lock:
+        schedule = mask and url not in _pending
+        if schedule:
+            _pending.add(url)
+    if schedule:
+        run_background(_compute_mask, url, key, cache)
+    return footprint
@@ -1,31 +1,27 @@
 """dashboard_api.api.utils."""
 
+import functools
 import hashlib
 import json
+import os
 import re
-import time
 from enum import Enum
-from typing import Any, Dict, Optional, Tuple
-
-import numpy as np
-
-# Temporary
-import rasterio
-from rasterio import features
-from rasterio.warp import transform_bounds
-from rasterstats.io import bounds_window
-from rio_color.operations import parse_operations
-from rio_color.utils import scale_dtype, to_math_type
-from rio_tiler import constants
-from rio_tiler.mercator import get_zooms
-from rio_tiler.utils import _chunks, has_alpha_band, has_mask_band, linear_rescale
-from shapely.geometry import box, shape
+from io import BytesIO
+from typing import TYPE_CHECKING, Any, Dict, Optional, Tuple
+from urllib.parse import urlparse
 
+from dashboard_api.core import timing
 from dashboard_api.db.memcache import CacheLayer
 from dashboard_api.models.timelapse import Feature
 
 from starlette.requests import Request
 
+# rasterio, rio-tiler, rio-color, rasterstats and shapely (and GDAL) are
+# imported by the functions using them, so that the cold start of endpoints
+# which don't read rasters (e.g /datasets) doesn't pay for them.
+if TYPE_CHECKING:
+    import numpy as np
+
 
 def get_cache(request: Request) -> CacheLayer:
     """Get Memcached Layer."""
@@ -37,13 +33,29 @@ def get_hash(**kwargs: Any) -> str:
     return hashlib.sha224(json.dumps(kwargs, sort_keys=True).encode()).hexdigest()
 
 
+def get_dataset_folder(url: str) -> str:
+    """
+    Return the top level folder of a COG URL.
+
+    e.g `s3://covid-eo-data/xco2-mean/xco2_16day_mean.2019_01_01.tif` -> `xco2-mean`,
+    which matches the dataset's `s3_location`.
+
+    """
+    return os.path.dirname(urlparse(url).path).strip("/").split("/")[0]
+
+
 def postprocess(
-    tile: np.ndarray,
-    mask: np.ndarray,
+    tile: "np.ndarray",
+    mask: "np.ndarray",
     rescale: Optional[str] = None,
     color_formula: Optional[str] = None,
-) -> np.ndarray:
+) -> "np.ndarray":
     """Post-process tile data."""
+    import numpy as np
+    from rio_color.operations import parse_operations
+    from rio_color.utils import scale_dtype, to_math_type
+    from rio_tiler.utils import _chunks, linear_rescale
+
     if rescale:
         rescale_arr = list(map(float, rescale.split(",")))
         rescale_arr = list(_chunks(rescale_arr, 2))
@@ -70,6 +82,30 @@ def postprocess(
     return tile
 
 
+def render_tile(
+    tile: "np.ndarray",
+    mask: "np.ndarray",
+    img_format: Optional[str] = None,
+    colormap: Optional[str] = None,
+    rescale: Optional[str] = None,
+    color_formula: Optional[str] = None,
+    **options: Any,
+) -> bytes:
+    """Post-process, apply a colormap (name) and encode a tile (npy if no format)."""
+    tile = postprocess(tile, mask, rescale=rescale, color_formula=color_formula)
+
+    if not img_format:
+        import numpy as np
+
+        sio = BytesIO()
+        np.save(sio, (tile, mask))
+        return sio.getvalue()
+
+    from dashboard_api.api import encoding
+
+    return encoding.encode(tile, mask, img_format, colormap=colormap, **options)
+
+
 # from rio-tiler 2.0a5
 def info(address: str) -> Dict:
     """
@@ -85,6 +121,12 @@ def info(address: str) -> Dict:
     out : dict.
 
     """
+    import rasterio
+    from rasterio.warp import transform_bounds
+    from rio_tiler import constants
+    from rio_tiler.mercator import get_zooms
+    from rio_tiler.utils import has_alpha_band, has_mask_band
+
     with rasterio.open(address) as src_dst:
         minzoom, maxzoom = get_zooms(src_dst)
         bounds = transform_bounds(
@@ -137,31 +179,11 @@ def info(address: str) -> Dict:
         )
 
 
-# This code is copied from marblecutter
-#  https://github.com/mojodna/marblecutter/blob/master/marblecutter/stats.py
-# License:
-# Original work Copyright 2016 Stamen Design
-# Modified work Copyright 2016-2017 Seth Fitzsimmons
-# Modified work Copyright 2016 American Red Cross
-# Modified work Copyright 2016-2017 Humanitarian OpenStreetMap Team
-# Modified work Copyright 2017 Mapzen
-class Timer(object):
-    """Time a code block."""
-
-    def __enter__(self):
-        """Starts timer."""
-        self.start = time.time()
-        return self
-
-    def __exit__(self, ty, val, tb):
-        """Stops timer."""
-        self.end = time.time()
-        self.elapsed = self.end - self.start
-
-
 # from https://gist.github.com/perrygeo/721040f8545272832a42#file-pctcover-png
 # author: @perrygeo
 def _rasterize_geom(geom, shape, affinetrans, all_touched):
+    from rasterio import features
+
     indata = [(geom, 1)]
     rv_array = features.rasterize(
         indata, out_shape=shape, transform=affinetrans, fill=0, all_touched=all_touched
@@ -171,6 +193,9 @@ def _rasterize_geom(geom, shape, affinetrans, all_touched):
 
 def rasterize_pctcover(geom, atrans, shape):
     """Rasterize features."""
+    import numpy as np
+    from shapely.geometry import box
+
     alltouched = _rasterize_geom(geom, shape, atrans, all_touched=True)
     exterior = _rasterize_geom(geom.exterior, shape, atrans, all_touched=True)
 
@@ -203,16 +228,25 @@ def rasterize_pctcover(geom, atrans, shape):
 
 def get_zonal_stat(geojson: Feature, raster: str) -> Tuple[float, float]:
     """Return zonal statistics."""
+    import numpy as np
+    import rasterio
+    from rasterstats.io import bounds_window
+    from shapely.geometry import shape
+
     geom = shape(geojson.geometry.dict())
     with rasterio.open(raster) as src:
         # read the raster data matching the geometry bounds
-        window = bounds_window(geom.bounds, src.transform)
-        # store our window information & read
-        window_affine = src.window_transform(window)
-        data = src.read(window=window)
+        with timing.stage("read"):
+            window = bounds_window(geom.bounds, src.transform)
+            # store our window information & read
+            window_affine = src.window_transform(window)
+            data = src.read(window=window)
 
         # calculate the coverage of pixels for weighting
-        pctcover = rasterize_pctcover(geom, atrans=window_affine, shape=data.shape[1:])
+        with timing.stage("rasterize"):
+            pctcover = rasterize_pctcover(
+                geom, atrans=window_affine, shape=data.shape[1:]
+            )
 
         return (
             np.average(data[0], weights=pctcover),
@@ -505,6 +539,17 @@ def get_custom_cmap(cname) -> Dict:
     return COLOR_MAPS[name]
 
 
+@functools.lru_cache(maxsize=None)
+def get_cmap(cname: str) -> Dict:
+    """Return a colormap (loaded once per process, see `dashboard_api.warmup`)."""
+    if cname.startswith("custom_"):
+        return get_custom_cmap(cname)
+
+    from rio_tiler.colormap import get_colormap
+
+    return get_colormap(cname)
+
+
 COLOR_MAP_NAMES = [
     "accent",
     "accent_r",
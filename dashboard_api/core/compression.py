@@ -0,0 +1,42 @@
+"""dashboard_api.core.compression: gzip responses, except bodyless ones."""
+
+from starlette.datastructures import Headers
+from starlette.middleware import gzip
+from starlette.types import Message, Receive, Scope, Send
+
+# responses which must not have a body (nor a Content-Encoding)
+BODYLESS_STATUS_CODES = {204, 304}
+
+
+class GZipResponder(gzip.GZipResponder):
+    """Send bodyless responses (e.g 304 Not Modified) as is."""
+
+    async def send_with_gzip(self, message: Message) -> None:
+        """Compress the body of the response, unless it has none."""
+        if (
+            message["type"] == "http.response.body"
+            and not self.started
+            and (
+                self.initial_message.get("status") in BODYLESS_STATUS_CODES
+                or not (message.get("body") or message.get("more_body"))
+            )
+        ):
+            self.started = True
+            await self.send(self.initial_message)
+            await self.send(message)
+            return
+        await super().send_with_gzip(message)
+
+
+class GZipMiddleware(gzip.GZipMiddleware):
+    """`starlette.middleware.gzip.GZipMiddleware` without gzipped empty bodies."""
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        """Compress the responses of clients accepting gzip."""
+        if scope["type"] == "http":
+            headers = Headers(scope=scope)
+            if "gzip" in headers.get("Accept-Encoding", ""):
+                responder = GZipResponder(self.app, self.minimum_size)
+                await responder(scope, receive, send)
+                return
+        await self.app(scope, receive, send)
@@ -4,8 +4,10 @@ import os
 
 import yaml
 
+# the C loader (libyaml) is much faster, when available
 config_object = yaml.load(
-    open(f"{os.path.abspath('.')}/stack/config.yml", "r"), Loader=yaml.FullLoader
+    open(f"{os.path.abspath('.')}/stack/config.yml", "r"),
+    Loader=getattr(yaml, "CSafeLoader", yaml.SafeLoader),
 )
 
 STAGE = os.environ.get("STAGE", config_object["STAGE"])
@@ -33,6 +35,92 @@ MEMCACHE_PORT = int(os.environ.get("MEMCACHE_PORT", 11211))
 MEMCACHE_USERNAME = os.environ.get("MEMCACHE_USERNAME")
 MEMCACHE_PASSWORD = os.environ.get("MEMCACHE_PASSWORD")
 
+# encoder settings of tiles requested without a `X-Tile-Encoding` header
+# (see `dashboard_api.api.encoding`): fast or compact
+TILE_ENCODING = os.environ.get("TILE_ENCODING", "fast")
+# honour the `X-Tile-Encoding` header of tile requests. The encoding isn't part
+# of the cache key (seeded compact tiles are served to every client): only
+# enable it where clients can be trusted, e.g a deployment seeding the cache
+TILE_ENCODING_HEADER = bool(os.environ.get("TILE_ENCODING_HEADER"))
+
+# Width (px) of the valid data masks used to skip tiles outside the data
+# footprint of COGs (see `dashboard_api.api.footprint`), 0: check bounds only
+FOOTPRINT_SIZE = int(os.environ.get("FOOTPRINT_SIZE", 1024))
+# Masks are read at full resolution, in the background (tiles only get their
+# bounds checked until then): larger COGs only get their bounds checked
+FOOTPRINT_MAX_PIXELS = int(os.environ.get("FOOTPRINT_MAX_PIXELS", 64000000))
+# COGs whose footprint can't be computed are retried after this delay (s)
+FOOTPRINT_FAILURE_TTL = int(os.environ.get("FOOTPRINT_FAILURE_TTL", 60))
+
+# Cache entries are invalidated by bumping namespace generations
+# (see `python -m dashboard_api.db.memcache --help`), so TTLs can be long.
+TILES_CACHE_TTL = int(os.environ.get("TILES_CACHE_TTL", 2592000))
+DATASETS_CACHE_TTL = int(os.environ.get("DATASETS_CACHE_TTL", 86400))
+SITES_CACHE_TTL = int(os.environ.get("SITES_CACHE_TTL", 60))
+FOOTPRINTS_CACHE_TTL = int(os.environ.get("FOOTPRINTS_CACHE_TTL", 2592000))
+CAPABILITIES_CACHE_TTL = int(os.environ.get("CAPABILITIES_CACHE_TTL", 86400))
+# Cache-Control max-age (s) of the WMTS capabilities documents
+CAPABILITIES_MAX_AGE = int(os.environ.get("CAPABILITIES_MAX_AGE", 3600))
+
+# HTTP caching of tiles (`Cache-Control`), unless set by the dataset's
+# `cache_control` metadata: max-age and stale-while-revalidate (s, 0: not sent)
+TILES_MAX_AGE = int(os.environ.get("TILES_MAX_AGE", 3600))
+TILES_STALE_WHILE_REVALIDATE = int(os.environ.get("TILES_STALE_WHILE_REVALIDATE", 0))
+# tiles of immutable (dated) COGs: `immutable` max-age and memcached TTL
+TILES_IMMUTABLE_MAX_AGE = int(os.environ.get("TILES_IMMUTABLE_MAX_AGE", 31536000))
+TILES_IMMUTABLE_CACHE_TTL = int(os.environ.get("TILES_IMMUTABLE_CACHE_TTL", 31536000))
+
+# Log a structured line with the metrics recorded while handling each request
+# (defaults to on in AWS Lambda, where a container handles one request at a time)
+LOG_METRICS = bool(
+    os.environ.get("LOG_METRICS", os.environ.get("AWS_LAMBDA_FUNCTION_NAME"))
+)
+
+# `/metrics` requires a `Authorization: Bearer {METRICS_TOKEN}` header (e.g the
+# `authorization` setting of a Prometheus scrape job), not found (404) if unset
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN")
+
+# Profile a sample of the requests, or requests with a `X-Profile-Signature`
+# header (see `python -m dashboard_api.core.profiling --help`), and write
+# speedscope profiles to PROFILE_LOCATION (e.g `s3://bucket/profiles` or `/tmp`)
+PROFILE_LOCATION = os.environ.get("PROFILE_LOCATION")
+PROFILE_SAMPLE_RATE = float(os.environ.get("PROFILE_SAMPLE_RATE", 0))
+PROFILE_SECRET = os.environ.get("PROFILE_SECRET")
+PROFILE_INTERVAL = float(os.environ.get("PROFILE_INTERVAL", 0.005))
+# lifetime (s) of the signatures created by `python -m dashboard_api.core.profiling`
+PROFILE_SIGNATURE_TTL = int(os.environ.get("PROFILE_SIGNATURE_TTL", 3600))
+
+# Persistent tile store backing memcached, e.g `s3://bucket/tiles` or `/tmp/tiles`
+TILE_STORE = os.environ.get("TILE_STORE", config_object.get("TILE_STORE"))
+TILE_STORE_ENDPOINT_URL = os.environ.get("TILE_STORE_ENDPOINT_URL")
+
+# Executors of the tile and metadata endpoints (see `dashboard_api.core.executors`):
+# threads for the GDAL I/O, processes for rendering (0: render in the I/O threads)
+IO_WORKERS = int(os.environ.get("IO_WORKERS", 16))
+CPU_WORKERS = int(os.environ.get("CPU_WORKERS", 0))
+# threads for the work that requests don't wait for (e.g footprint masks)
+BACKGROUND_WORKERS = int(os.environ.get("BACKGROUND_WORKERS", 1))
+# tiles are sent to the rendering processes through shared memory, unless disabled
+DISABLE_SHARED_MEMORY = os.getenv("DISABLE_SHARED_MEMORY")
+
+# Steps run by `dashboard_api.warmup` when the lambda is initialized (or the
+# app starts): "all", "none" or a comma separated list of steps. Lambda init
+# phases delay the first request of every cold start: only the cheap steps run
+# by default, enable e.g `gdal,metadata` where SnapStart or provisioned
+# concurrency runs the init phase ahead of requests
+WARMUP = os.environ.get(
+    "WARMUP", "clients" if os.environ.get("AWS_LAMBDA_FUNCTION_NAME") else "all"
+)
+
+# Keep-warm pings (see `python -m dashboard_api.keepwarm --help`): number of
+# containers kept warm, derived from the function's concurrency metrics
+KEEP_WARM_MIN = int(os.environ.get("KEEP_WARM_MIN", 1))
+KEEP_WARM_MAX = int(os.environ.get("KEEP_WARM_MAX", 50))
+KEEP_WARM_FACTOR = float(os.environ.get("KEEP_WARM_FACTOR", 1))
+KEEP_WARM_LOOKBACK = int(os.environ.get("KEEP_WARM_LOOKBACK", 15))  # minutes
+KEEP_WARM_LOOKAHEAD = int(os.environ.get("KEEP_WARM_LOOKAHEAD", 30))  # minutes
+KEEP_WARM_HOLD = float(os.environ.get("KEEP_WARM_HOLD", 100))  # ms
+
 BUCKET = os.environ.get("BUCKET", config_object["BUCKET"])
 
 DATASET_METADATA_FILENAME = os.environ.get(
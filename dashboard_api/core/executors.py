@@ -0,0 +1,221 @@
+"""dashboard_api.core.executors: dedicated executors for GDAL I/O and rendering.
+
+Blocking calls of the tile and metadata endpoints don't run in the event
+loop's default executor, which is shared with the sync endpoints (e.g
+`/datasets`), but in:
+
+- the I/O executor (`IO_WORKERS` threads): COG reads (GDAL releases the GIL
+  while waiting on the network)
+- the CPU executor (`CPU_WORKERS` processes): postprocessing and rendering,
+  which hold the GIL for most of their run time. With `CPU_WORKERS=0` (the
+  default, e.g in AWS Lambda where processes can't communicate through
+  `/dev/shm`), CPU-bound work runs in the I/O executor.
+- the background executor (`BACKGROUND_WORKERS` threads): work that no
+  request waits for (e.g footprint masks), so that it can't delay COG reads.
+  In AWS Lambda, it only runs while the container handles requests.
+
+Functions sent to the CPU executor and their arguments must be picklable.
+If a worker process dies (e.g killed when out of memory), the process pool
+is broken: it is replaced, and the calls it failed are retried once.
+`run_cpu_shared` sends arrays (e.g tiles) to the CPU executor through shared
+memory, instead of pickling them (Python >= 3.8, unless `DISABLE_SHARED_MEMORY`).
+"""
+
+import asyncio
+import contextvars
+import functools
+import multiprocessing
+import time
+from concurrent.futures import (
+    Executor,
+    Future,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+)
+from concurrent.futures.process import BrokenProcessPool
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    TypeVar,
+)
+
+from dashboard_api.core import config, metrics
+
+try:
+    from multiprocessing import shared_memory
+except ImportError:  # Python < 3.8
+    shared_memory = None  # type: ignore
+
+if TYPE_CHECKING:
+    import numpy as np
+
+T = TypeVar("T")
+
+EXECUTOR_WAIT = metrics.registry.histogram(
+    "executor_wait_seconds", "Time spent by tasks waiting for an executor worker."
+)
+
+
+def _init_cpu_worker():
+    # load numpy, GDAL and its drivers before the first task
+    from dashboard_api.warmup import warm_up
+
+    warm_up(["gdal", "colormaps"])
+
+
+@functools.lru_cache(maxsize=1)
+def io_executor() -> Executor:
+    """Return the executor of the GDAL I/O (created on first use)."""
+    return ThreadPoolExecutor(
+        max_workers=config.IO_WORKERS, thread_name_prefix="gdal-io"
+    )
+
+
+@functools.lru_cache(maxsize=1)
+def background_executor() -> Executor:
+    """Return the executor of the background work (created on first use)."""
+    return ThreadPoolExecutor(
+        max_workers=config.BACKGROUND_WORKERS, thread_name_prefix="background"
+    )
+
+
+@functools.lru_cache(maxsize=1)
+def cpu_executor() -> Optional[Executor]:
+    """Return the process pool of the CPU-bound work (None if disabled)."""
+    if not config.CPU_WORKERS:
+        return None
+    # GDAL and boto3 are not fork safe (threads, open connections)
+    return ProcessPoolExecutor(
+        max_workers=config.CPU_WORKERS,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_cpu_worker,
+    )
+
+
+def _timed(submitted: float, func: Callable[..., T], *args: Any) -> Tuple[float, T]:
+    return time.time() - submitted, func(*args)
+
+
+async def _run(executor: Executor, name: str, func: Callable[..., T], *args: Any) -> T:
+    loop = asyncio.get_event_loop()
+    wait, result = await loop.run_in_executor(
+        executor, _timed, time.time(), func, *args
+    )
+    EXECUTOR_WAIT.observe(wait, executor=name)
+    return result
+
+
+async def _run_cpu(executor: Executor, func: Callable[..., T]) -> T:
+    try:
+        return await _run(executor, "cpu", func)
+    except BrokenProcessPool as e:
+        # concurrent calls fail together: only the first one replaces the pool
+        if cpu_executor() is executor:
+            print(f"CPU executor broken, restarting it: {e!r}")
+            cpu_executor.cache_clear()
+            executor.shutdown(wait=False)
+        return await _run(cpu_executor(), "cpu", func)
+
+
+async def run_io(func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """Run a blocking I/O call in the I/O executor (in the caller's context)."""
+    context = contextvars.copy_context()
+    child = functools.partial(func, *args, **kwargs)
+    return await _run(io_executor(), "io", context.run, child)
+
+
+def run_background(func: Callable[..., T], *args: Any, **kwargs: Any) -> "Future[T]":
+    """Run a blocking call in the background executor, without waiting for it."""
+    return background_executor().submit(func, *args, **kwargs)
+
+
+async def run_cpu(func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """Run a CPU-bound call in the CPU executor (the I/O executor if disabled)."""
+    executor = cpu_executor()
+    if executor is None:
+        return await run_io(func, *args, **kwargs)
+    return await _run_cpu(executor, functools.partial(func, *args, **kwargs))
+
+
+# (shape, dtype, offset) of the arrays in a shared memory block
+ArraySpec = Tuple[Tuple[int, ...], str, int]
+
+
+def _call_shared(
+    name: str, specs: List[ArraySpec], func: Callable[..., T], kwargs: dict
+) -> T:
+    import numpy
+
+    shm = shared_memory.SharedMemory(name=name)
+    try:
+        arrays = [
+            numpy.ndarray(shape, dtype, buffer=shm.buf, offset=offset)
+            for shape, dtype, offset in specs
+        ]
+        return func(*arrays, **kwargs)
+    finally:
+        arrays = []
+        try:
+            shm.close()
+        except BufferError:
+            # views still referenced (e.g by a traceback), unmapped when collected
+            pass
+
+
+async def run_cpu_shared(
+    func: Callable[..., T], arrays: Sequence["np.ndarray"], **kwargs: Any
+) -> T:
+    """
+    Run `func(*arrays, **kwargs)` in the CPU executor.
+
+    The arrays are copied to a shared memory block, from which the worker
+    process reads them, so only the result is pickled. `func` gets views of
+    the block: it may modify them in place but must not return them.
+    Falls back to `run_cpu` without a CPU executor or shared memory.
+
+    """
+    executor = cpu_executor()
+    if executor is None or shared_memory is None or config.DISABLE_SHARED_MEMORY:
+        return await run_cpu(func, *arrays, **kwargs)
+
+    import numpy
+
+    specs: List[ArraySpec] = []
+    size = 0
+    for array in arrays:
+        specs.append((array.shape, array.dtype.str, size))
+        # keep the arrays aligned
+        size += -(-array.nbytes // 64) * 64
+
+    shm = shared_memory.SharedMemory(create=True, size=max(size, 1))
+    try:
+        for array, (shape, dtype, offset) in zip(arrays, specs):
+            numpy.ndarray(shape, dtype, buffer=shm.buf, offset=offset)[...] = array
+        return await _run_cpu(
+            executor, functools.partial(_call_shared, shm.name, specs, func, kwargs)
+        )
+    finally:
+        shm.close()
+        shm.unlink()
+
+
+def start():
+    """Start the executors' workers."""
+    executor = cpu_executor()
+    if executor is not None:
+        # processes are started on submit, run one task per worker
+        list(executor.map(time.sleep, [0.1] * config.CPU_WORKERS))
+
+
+def shutdown():
+    """Shut the executors down (waits for the running tasks)."""
+    for get in [io_executor, cpu_executor, background_executor]:
+        executor = get()
+        if executor is not None:
+            executor.shutdown()
+        get.cache_clear()
@@ -0,0 +1,192 @@
+"""dashboard_api.core.metrics: in-process metrics (Prometheus text format)."""
+
+import threading
+from typing import Dict, Iterator, List, Sequence, Tuple
+
+Labels = Tuple[Tuple[str, str], ...]
+Sample = Tuple[str, Labels, float]
+
+LATENCY_BUCKETS = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+
+def _labels(labels: Dict[str, str]) -> Labels:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    values = ",".join(
+        '{}="{}"'.format(
+            k, v.replace("\\", r"\\").replace('"', r"\"").replace("\n", r"\n")
+        )
+        for k, v in labels
+    )
+    return f"{{{values}}}"
+
+
+def _format_value(value: float) -> str:
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class Metric(object):
+    """Base metric."""
+
+    type = "untyped"
+
+    def __init__(self, name: str, documentation: str):
+        """Init metric."""
+        self.name = name
+        self.documentation = documentation
+        self._lock = threading.Lock()
+
+    def samples(self) -> Iterator[Sample]:
+        """Yield (name, labels, value) samples."""
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    """Monotonic counter."""
+
+    type = "counter"
+
+    def __init__(self, name: str, documentation: str):
+        """Init counter."""
+        super().__init__(name, documentation)
+        self._values: Dict[Labels, float] = {}
+
+    def inc(self, value: float = 1, **labels: str):
+        """Increment counter."""
+        key = _labels(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + value
+
+    def samples(self) -> Iterator[Sample]:
+        """Yield counter samples."""
+        with self._lock:
+            values = list(self._values.items())
+        for labels, value in values:
+            yield self.name, labels, value
+
+
+class Gauge(Counter):
+    """Value that can go up and down."""
+
+    type = "gauge"
+
+    def set(self, value: float, **labels: str):
+        """Set gauge value."""
+        with self._lock:
+            self._values[_labels(labels)] = value
+
+
+class Histogram(Metric):
+    """Cumulative histogram."""
+
+    type = "histogram"
+
+    def __init__(
+        self, name: str, documentation: str, buckets: Sequence[float] = LATENCY_BUCKETS
+    ):
+        """Init histogram."""
+        super().__init__(name, documentation)
+        self.buckets = tuple(sorted(buckets))
+        self._values: Dict[Labels, List[float]] = {}
+
+    def observe(self, value: float, **labels: str):
+        """Record a value."""
+        key = _labels(labels)
+        with self._lock:
+            # one count per bucket, then +Inf count and sum
+            counts = self._values.setdefault(key, [0.0] * (len(self.buckets) + 2))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            counts[-2] += 1
+            counts[-1] += value
+
+    def samples(self) -> Iterator[Sample]:
+        """Yield `_bucket`, `_count` and `_sum` samples."""
+        with self._lock:
+            values = [(labels, list(counts)) for labels, counts in self._values.items()]
+        for labels, counts in values:
+            for bound, count in zip(self.buckets, counts):
+                yield f"{self.name}_bucket", labels + (("le", str(bound)),), count
+            yield f"{self.name}_bucket", labels + (("le", "+Inf"),), counts[-2]
+            yield f"{self.name}_count", labels, counts[-2]
+            yield f"{self.name}_sum", labels, counts[-1]
+
+
+class Registry(object):
+    """Metrics registry."""
+
+    def __init__(self):
+        """Init registry."""
+        self._metrics: Dict[str, Metric] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric: Metric) -> Metric:
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name: str, documentation: str) -> Counter:
+        """Get or create a counter."""
+        return self._register(Counter(name, documentation))  # type: ignore
+
+    def gauge(self, name: str, documentation: str) -> Gauge:
+        """Get or create a gauge."""
+        return self._register(Gauge(name, documentation))  # type: ignore
+
+    def histogram(
+        self, name: str, documentation: str, buckets: Sequence[float] = LATENCY_BUCKETS
+    ) -> Histogram:
+        """Get or create a histogram."""
+        return self._register(Histogram(name, documentation, buckets))  # type: ignore
+
+    def render(self) -> str:
+        """Render all metrics in the Prometheus text exposition format."""
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self) -> Dict[str, float]:
+        """Return counters, histogram counts and sums (no buckets) by sample."""
+        return {
+            f"{name}{_format_labels(labels)}": value
+            for metric in list(self._metrics.values())
+            if not isinstance(metric, Gauge)
+            for name, labels, value in metric.samples()
+            if not name.endswith("_bucket")
+        }
+
+
+def diff(before: Dict[str, float], after: Dict[str, float]) -> Dict[str, float]:
+    """Return the samples that changed between two snapshots."""
+    return {
+        k: round(v - before.get(k, 0), 6)
+        for k, v in after.items()
+        if v != before.get(k, 0)
+    }
+
+
+registry = Registry()
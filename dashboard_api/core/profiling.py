@@ -0,0 +1,224 @@
+"""dashboard_api.core.profiling: sampling profiler for individual requests."""
+
+import argparse
+import hashlib
+import hmac
+import json
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import quote, urlparse
+
+from dashboard_api.core import config
+
+SIGNATURE_HEADER = "x-profile-signature"
+
+# Innermost frames of threads that are waiting for work (idle threadpool
+# workers, idle event loop), these samples are dropped.
+IDLE_FRAMES = {
+    ("threading.py", "wait"),
+    ("selectors.py", "select"),
+    ("queue.py", "get"),
+}
+
+Frame = Tuple[str, str, int]
+
+
+class Sampler(threading.Thread):
+    """
+    Sample the stacks of all the other threads at a fixed interval.
+
+    Sync endpoints run in a threadpool, so every thread of the process is
+    sampled. Samples are grouped by thread name. Requests handled
+    concurrently by the same process will show up in the profile too.
+
+    """
+
+    def __init__(self, interval: float = 0.005):
+        """Init sampler."""
+        super().__init__(name="profiler", daemon=True)
+        self.interval = interval
+        self.frames: Dict[Frame, int] = {}
+        self.samples: Dict[str, List[Tuple[List[int], float]]] = {}
+        self._stop_event = threading.Event()
+
+    def _frame_index(self, frame: Frame) -> int:
+        return self.frames.setdefault(frame, len(self.frames))
+
+    def _sample(self, duration: float):
+        names = {t.ident: t.name for t in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == self.ident:
+                continue
+
+            code = frame.f_code
+            if (os.path.basename(code.co_filename), code.co_name) in IDLE_FRAMES:
+                continue
+
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(
+                    self._frame_index((code.co_name, code.co_filename, frame.f_lineno))
+                )
+                frame = frame.f_back
+            stack.reverse()
+
+            thread = names.get(ident, str(ident))
+            self.samples.setdefault(thread, []).append((stack, duration))
+
+    def run(self):
+        """Sample until stopped."""
+        last = time.perf_counter()
+        while not self._stop_event.wait(self.interval):
+            now = time.perf_counter()
+            self._sample(now - last)
+            last = now
+
+    def stop(self):
+        """Stop sampling."""
+        self._stop_event.set()
+        self.join()
+
+    def speedscope(self, name: str) -> Dict:
+        """Return the samples in the speedscope file format."""
+        frames = sorted(self.frames.items(), key=lambda item: item[1])
+        profiles = []
+        for thread, samples in self.samples.items():
+            total = sum(duration for _, duration in samples)
+            profiles.append(
+                {
+                    "type": "sampled",
+                    "name": f"{name} [{thread}]",
+                    "unit": "seconds",
+                    "startValue": 0,
+                    "endValue": total,
+                    "samples": [stack for stack, _ in samples],
+                    "weights": [duration for _, duration in samples],
+                }
+            )
+
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": name,
+            "exporter": "dashboard_api",
+            "activeProfileIndex": 0,
+            "shared": {
+                "frames": [
+                    {"name": func, "file": filename, "line": line}
+                    for (func, filename, line), _ in frames
+                ]
+            },
+            "profiles": profiles,
+        }
+
+
+def _digest(message: str, secret: Optional[str] = None) -> str:
+    secret = secret or config.PROFILE_SECRET or ""
+    return hmac.new(secret.encode(), message.encode(), hashlib.sha256).hexdigest()
+
+
+def sign(
+    path: str,
+    query: str = "",
+    secret: Optional[str] = None,
+    expires: Optional[int] = None,
+) -> str:
+    """
+    Return the signature to send in the `X-Profile-Signature` header.
+
+    Signatures are `{expires}.{hmac}`: they cover the expiration time (unix
+    time, `PROFILE_SIGNATURE_TTL` from now by default) and the request.
+
+    """
+    if expires is None:
+        expires = int(time.time()) + config.PROFILE_SIGNATURE_TTL
+    message = f"{expires}:{path}?{query}" if query else f"{expires}:{path}"
+    return f"{expires}.{_digest(message, secret)}"
+
+
+def verify(signature: str, path: str, query: str = "") -> bool:
+    """Check a signature (invalid once expired)."""
+    expires, _, _ = signature.partition(".")
+    if not expires.isdigit() or int(expires) < time.time():
+        return False
+    return hmac.compare_digest(signature, sign(path, query, expires=int(expires)))
+
+
+def should_profile(path: str, query: str, signature: Optional[str]) -> bool:
+    """Check if a request should be profiled (signed or randomly sampled)."""
+    if not config.PROFILE_LOCATION:
+        return False
+
+    if signature and config.PROFILE_SECRET:
+        return verify(signature, path, query)
+
+    return random.random() < config.PROFILE_SAMPLE_RATE
+
+
+def save_profile(profile: Dict, route: str, tags: Dict[str, str]) -> str:
+    """
+    Write a speedscope profile to `PROFILE_LOCATION` and return its location.
+
+    Profiles are written to `{location}/{route}/{time}-{id}.speedscope.json`,
+    tags are stored in the S3 object metadata (and in the profile name).
+
+    """
+    name = "{}-{}.speedscope.json".format(
+        time.strftime("%Y%m%dT%H%M%S", time.gmtime()), uuid.uuid4().hex[:8]
+    )
+    body = json.dumps(profile).encode()
+
+    parsed = urlparse(config.PROFILE_LOCATION)
+    if parsed.scheme == "s3":
+        key = "/".join(filter(None, [parsed.path.strip("/"), route, name]))
+        import boto3
+
+        boto3.client("s3").put_object(
+            Bucket=parsed.netloc,
+            Key=key,
+            Body=body,
+            ContentType="application/json",
+            # S3 user metadata is limited to 2KB, the full query is in the profile
+            Metadata={k: quote(v)[:256] for k, v in tags.items()},
+        )
+        return f"s3://{parsed.netloc}/{key}"
+
+    path = os.path.join(parsed.path, route, name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(body)
+    return path
+
+
+def main(argv: Optional[List[str]] = None):
+    """
+    Sign a request to have it profiled.
+
+    Usage: python -m dashboard_api.core.profiling "/v1/8/1/2@1x?url=s3://..."
+
+    """
+    parser = argparse.ArgumentParser(description="Sign a request for profiling.")
+    parser.add_argument("path", help="Request path, with its query string.")
+    parser.add_argument(
+        "--ttl",
+        type=int,
+        default=config.PROFILE_SIGNATURE_TTL,
+        help="Lifetime of the signature (s).",
+    )
+    args = parser.parse_args(argv)
+
+    if not config.PROFILE_SECRET:
+        parser.error("PROFILE_SECRET is not set.")
+
+    path, _, query = args.path.partition("?")
+    expires = int(time.time()) + args.ttl
+    print(f"X-Profile-Signature: {sign(path, query, expires=expires)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""dashboard_api.core.timing: request-scoped stage timings."""
+
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, List, Optional
+
+
+class Timings(object):
+    """
+    Durations (ns) of the stages of a request.
+
+    Stages with the same name (e.g `cache-get`) are summed.
+
+    """
+
+    def __init__(self):
+        """Init timings."""
+        self.start = time.perf_counter_ns()
+        self.stages: Dict[str, int] = {}
+
+    def add(self, name: str, duration: int):
+        """Add a stage duration (ns)."""
+        self.stages[name] = self.stages.get(name, 0) + duration
+
+    def elapsed(self) -> int:
+        """Return the time elapsed since the start of the request (ns)."""
+        return time.perf_counter_ns() - self.start
+
+    def header(self, total: Optional[int] = None) -> str:
+        """Return a `Server-Timing` header value (durations in ms)."""
+        metrics: List[str] = [
+            f"{name};dur={duration / 1e6:0.2f}"
+            for name, duration in self.stages.items()
+        ]
+        if total is not None:
+            metrics.append(f"total;dur={total / 1e6:0.2f}")
+        return ", ".join(metrics)
+
+
+_timings: ContextVar[Optional[Timings]] = ContextVar("timings", default=None)
+
+
+def start_request() -> Timings:
+    """Start recording timings for the current request."""
+    timings = Timings()
+    _timings.set(timings)
+    return timings
+
+
+def get_timings() -> Optional[Timings]:
+    """Return the timings of the current request (None outside of a request)."""
+    return _timings.get()
+
+
+def record(name: str, duration: int):
+    """Record a stage duration (ns) for the current request, if any."""
+    timings = _timings.get()
+    if timings is not None:
+        timings.add(name, duration)
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """Time a block of code as a stage of the current request."""
+    start = time.perf_counter_ns()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter_ns() - start)
@@ -0,0 +1,130 @@
+"""Run-length encoded dataset domains.
+
+A non periodic domain (list of dates) can be encoded as runs of dates
+separated by a constant step, e.g::
+
+    {
+        "encoding": "rle",
+        "runs": [
+            {
+                "start": "2020-01-01T00:00:00Z",
+                "end": "2020-03-31T00:00:00Z",
+                "step": 1,
+                "unit": "day",
+                "exceptions": ["2020-02-02T00:00:00Z"],
+            }
+        ],
+    }
+
+`unit` is `day` or `month` (dates on the first day of each month), and
+`exceptions` lists the dates missing from the run. The metadata generator
+encodes domains with `encode` (see `lambda/dataset_metadata_generator`): this
+module is shared with the generator, it must only depend on the standard
+library (and not import other `dashboard_api` modules).
+"""
+
+import datetime
+from typing import Dict, List, Optional, Union
+
+DT_FORMAT = "%Y-%m-%dT%H:%M:%SZ"
+
+# gaps of up to MAX_EXCEPTIONS missing dates are stored as exceptions rather
+# than by starting a new run
+MAX_EXCEPTIONS = 2
+
+Domain = Union[List[str], Dict]
+
+
+def _to_ordinal(date: datetime.datetime, unit: str) -> int:
+    if unit == "month":
+        return date.year * 12 + date.month - 1
+    return date.toordinal()
+
+
+def _from_ordinal(value: int, unit: str) -> str:
+    if unit == "month":
+        date = datetime.datetime(value // 12, value % 12 + 1, 1)
+    else:
+        date = datetime.datetime.fromordinal(value)
+    return date.strftime(DT_FORMAT)
+
+
+def is_encoded(domain: Optional[Domain]) -> bool:
+    """Check if a domain is run-length encoded."""
+    return isinstance(domain, dict) and domain.get("encoding") == "rle"
+
+
+def encode(dates: List[str]) -> Optional[Dict]:
+    """Run-length encode a list of dates (None if the dates can't be encoded)."""
+    try:
+        parsed = sorted({datetime.datetime.strptime(d, DT_FORMAT) for d in dates})
+    except (TypeError, ValueError):
+        return None
+    if any(d.time() != datetime.time() for d in parsed):
+        return None
+
+    unit = "month" if len(parsed) > 1 and all(d.day == 1 for d in parsed) else "day"
+    values = [_to_ordinal(d, unit) for d in parsed]
+
+    runs: List[Dict] = []
+    for value in values:
+        run = runs[-1] if runs else None
+        if run is not None:
+            gap = value - run["end"]
+            if run["step"] is None:
+                run["step"] = gap
+            if gap == run["step"] or (
+                gap % run["step"] == 0 and gap // run["step"] - 1 <= MAX_EXCEPTIONS
+            ):
+                run["exceptions"].extend(
+                    range(run["end"] + run["step"], value, run["step"])
+                )
+                run["end"] = value
+                continue
+
+        runs.append(dict(start=value, end=value, step=None, exceptions=[]))
+
+    encoded = []
+    for run in runs:
+        item = dict(
+            start=_from_ordinal(run["start"], unit),
+            end=_from_ordinal(run["end"], unit),
+            step=run["step"] or 1,
+            unit=unit,
+        )
+        if run["exceptions"]:
+            item["exceptions"] = [_from_ordinal(v, unit) for v in run["exceptions"]]
+        encoded.append(item)
+
+    return dict(encoding="rle", runs=encoded)
+
+
+def decode(domain: Dict) -> List[str]:
+    """Expand a run-length encoded domain to the list of its dates."""
+    dates = []
+    for run in domain["runs"]:
+        unit = run.get("unit", "day")
+        start, end = (
+            _to_ordinal(datetime.datetime.strptime(run[k], DT_FORMAT), unit)
+            for k in ["start", "end"]
+        )
+        exceptions = set(run.get("exceptions") or [])
+        for value in range(start, end + 1, run.get("step") or 1):
+            date = _from_ordinal(value, unit)
+            if date not in exceptions:
+                dates.append(date)
+    return dates
+
+
+def format_domain(
+    domain: Optional[Domain], domain_format: str = "list"
+) -> Optional[Domain]:
+    """Return a (non periodic) domain as a list of dates or run-length encoded."""
+    if domain_format == "rle":
+        if domain and not is_encoded(domain):
+            return encode(domain) or domain  # type: ignore
+        return domain
+
+    if is_encoded(domain):
+        return decode(domain)  # type: ignore
+    return domain
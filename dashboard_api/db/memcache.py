@@ -1,15 +1,102 @@
 """dashboard_api.cache.memcache: memcached layer."""
 
-from typing import Dict, Optional, Tuple, Union
+import argparse
+import time
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
 
 from bmemcached import Client
 
+from dashboard_api.core import config, metrics, timing
+from dashboard_api.db.store import TileStore, get_tile_store
 from dashboard_api.models.static import Datasets
 from dashboard_api.ressources.enums import ImageType
+from dashboard_api.ressources.responses import get_etag
+
+# Generation namespaces. Every cache key is suffixed with the current
+# generation of the namespaces it depends on, so bumping a namespace makes
+# all of its entries unreachable (they then simply age out of memcached).
+GLOBAL_NAMESPACE = "global"
+DATASETS_NAMESPACE = "datasets"
+SITES_NAMESPACE = "sites"
+
+
+# longest relative expiration time (30 days)
+MAX_RELATIVE_TTL = 2592000
+
+
+def _generation_seed() -> int:
+    return int(time.time() * 1000)
+
+
+def dataset_namespace(dataset: str) -> str:
+    """Return the generation namespace of a dataset (keyed by its S3 folder)."""
+    return f"dataset:{dataset}"
+
+
+def site_namespace(site_id: str) -> str:
+    """Return the generation namespace of a site."""
+    return f"site:{site_id}"
+
+
+CACHE_REQUESTS = metrics.registry.counter(
+    "cache_requests_total", "Cache lookups by keyspace, tier and result."
+)
+CACHE_WRITES = metrics.registry.counter(
+    "cache_writes_total", "Cache writes by keyspace, tier and result."
+)
+CACHE_LATENCY = metrics.registry.histogram(
+    "cache_operation_seconds", "Cache operation latency.", metrics.LATENCY_BUCKETS
+)
+CACHE_VALUE_SIZE = metrics.registry.histogram(
+    "cache_value_bytes", "Size of values written to the cache.", metrics.SIZE_BUCKETS
+)
+MEMCACHED_STATS = metrics.registry.gauge(
+    "memcached_stat", "memcached server statistics (see `stats` command)."
+)
+# memcached server stats exported on /metrics (`evictions` is server wide,
+# memcached does not report evictions per key prefix)
+SERVER_STATS = [
+    "bytes",
+    "limit_maxbytes",
+    "curr_items",
+    "evictions",
+    "reclaimed",
+    "get_hits",
+    "get_misses",
+    "curr_connections",
+]
+
+
+# cached tiles: image body + ext (+ ETag, for tiles cached since ETags were added)
+# (+ Cache-Control header, for tiles cached since it was added)
+TileBody = Union[
+    Tuple[bytes, ImageType],
+    Tuple[bytes, ImageType, str],
+    Tuple[bytes, ImageType, str, str],
+]
+
+
+def _observe(start: int, keyspace: str, operation: str):
+    """Record the duration of a cache operation started at `start` (ns)."""
+    duration = time.perf_counter_ns() - start
+    CACHE_LATENCY.observe(duration / 1e9, keyspace=keyspace, operation=operation)
+    stage = operation if operation.startswith("store") else f"cache_{operation}"
+    timing.record(stage.replace("_", "-"), duration)
 
 
 class CacheLayer(object):
-    """Memcache Wrapper."""
+    """
+    Memcache Wrapper.
+
+    Tiles can optionally be backed by a persistent `TileStore`: tiles missing
+    from memcached are looked up in the store and promoted back to memcached.
+
+    Every operation is recorded in `dashboard_api.core.metrics.registry` by
+    keyspace (tiles, datasets, sites, footprints, capabilities, generations).
+    Errors are recorded and logged, lookups then behave as misses and writes
+    return False.
+
+    """
 
     def __init__(
         self,
@@ -17,11 +104,111 @@ class CacheLayer(object):
         port: int = 11211,
         user: Optional[str] = None,
         password: Optional[str] = None,
+        store: Optional[TileStore] = None,
     ):
         """Init Cache Layer."""
         self.client = Client((f"{host}:{port}",), user, password)
+        self.store = store
+
+    def _get(self, key: Optional[str], keyspace: str) -> Any:
+        if key is None:
+            return None
+
+        start = time.perf_counter_ns()
+        try:
+            value = self.client.get(key)
+        except Exception as e:
+            CACHE_REQUESTS.inc(keyspace=keyspace, tier="memcached", result="error")
+            print(f"Cache error (get {keyspace}): {e!r}")
+            return None
+        finally:
+            _observe(start, keyspace, "get")
+
+        result = "miss" if value is None else "hit"
+        CACHE_REQUESTS.inc(keyspace=keyspace, tier="memcached", result=result)
+        return value
+
+    def _set(
+        self, key: Optional[str], value: Any, size: int, keyspace: str, timeout: int
+    ) -> bool:
+        if key is None:
+            return False
+
+        if timeout > MAX_RELATIVE_TTL:
+            # memcached reads longer expiration times as unix timestamps
+            timeout = int(time.time()) + timeout
+
+        start = time.perf_counter_ns()
+        try:
+            stored = bool(self.client.set(key, value, time=timeout))
+        except Exception as e:
+            CACHE_WRITES.inc(keyspace=keyspace, tier="memcached", result="error")
+            print(f"Cache error (set {keyspace}): {e!r}")
+            return False
+        finally:
+            _observe(start, keyspace, "set")
+
+        result = "stored" if stored else "not_stored"
+        CACHE_WRITES.inc(keyspace=keyspace, tier="memcached", result=result)
+        CACHE_VALUE_SIZE.observe(size, keyspace=keyspace)
+        return stored
+
+    @staticmethod
+    def _generation_key(namespace: str) -> str:
+        return f"generation:{namespace}"
+
+    def get_generations(self, *namespaces: str) -> List[int]:
+        """
+        Get the current generation of each namespace.
+
+        Missing counters (never set, or evicted) are seeded with the current
+        epoch time (ms) rather than 0 so that a lost counter can never go back
+        to a value that was already used to store entries.
+
+        """
+        keys = [self._generation_key(ns) for ns in namespaces]
+        start = time.perf_counter_ns()
+        values = self.client.get_multi(keys)
+        generations = []
+        for key in keys:
+            value = values.get(key)
+            result = "miss" if value is None else "hit"
+            CACHE_REQUESTS.inc(keyspace="generations", tier="memcached", result=result)
+            if value is None:
+                seed = _generation_seed()
+                self.client.add(key, seed, time=0)
+                value = self.client.get(key) or seed
+            generations.append(int(value))
+        _observe(start, "generations", "get")
+        return generations
+
+    def bump_generation(self, namespace: str) -> int:
+        """Invalidate every cache entry depending on `namespace`."""
+        key = self._generation_key(namespace)
+        seed = _generation_seed()
+        if self.client.add(key, seed, time=0):
+            return seed
+        return self.client.incr(key, 1)
+
+    def versioned_key(self, key: str, *namespaces: str) -> Optional[str]:
+        """
+        Fold namespace generations into a cache key.
+
+        The global namespace is always included. Returns None if the
+        generations can't be fetched, other methods then skip the cache.
+
+        """
+        try:
+            generations = self.get_generations(GLOBAL_NAMESPACE, *namespaces)
+        except Exception as e:
+            CACHE_REQUESTS.inc(keyspace="generations", tier="memcached", result="error")
+            print(f"Cache error (get generations): {e!r}")
+            return None
+        return "{}:{}".format(key, ".".join(map(str, generations)))
 
-    def get_image_from_cache(self, img_hash: str) -> Tuple[bytes, ImageType]:
+    def get_image_from_cache(
+        self, img_hash: Optional[str], use_store: bool = True
+    ) -> Optional[TileBody]:
         """
         Get image body from cache layer.
 
@@ -29,6 +216,10 @@ class CacheLayer(object):
         ----------
             img_hash : str
                 file url.
+            use_store : bool
+                look tiles missing from memcached up in the persistent store
+                (blocking, async callers should use `get_persistent_image` in
+                an executor instead).
 
         Returns
         -------
@@ -36,13 +227,61 @@ class CacheLayer(object):
                 image body.
             ext : str
                 image ext
+            etag : str
+                image ETag, if it was cached with the image (not for images
+                cached before ETags were added)
+            cache_control : str
+                Cache-Control header of the image, if it was cached with the
+                image
+            or None if the image is not cached.
 
         """
-        content, ext = self.client.get(img_hash)
-        return content, ext
+        body = self._get(img_hash, "tiles")
+        if body is None and use_store:
+            body = self.get_persistent_image(img_hash)
+
+        return body
+
+    def get_persistent_image(
+        self,
+        img_hash: Optional[str],
+        timeout: int = config.TILES_CACHE_TTL,
+        cache_control: Optional[str] = None,
+    ) -> Optional[TileBody]:
+        """
+        Get image body + ext + ETag (+ Cache-Control) from the persistent store.
+
+        The image is promoted to memcached for `timeout` seconds (the TTL of
+        the tile, e.g `TILES_IMMUTABLE_CACHE_TTL`), with its ETag and
+        `cache_control` so that memcached hits don't hash the image again nor
+        look its cache policy up.
+
+        """
+        if not self.store or img_hash is None:
+            return None
+
+        start = time.perf_counter_ns()
+        body = self.store.get(img_hash)
+        _observe(start, "tiles", "store_get")
+        result = "miss" if body is None else "hit"
+        CACHE_REQUESTS.inc(keyspace="tiles", tier="store", result=result)
+        if body is None:
+            return None
+        etag = get_etag(body[0])
+        self.set_image_cache(
+            img_hash, body, timeout=timeout, etag=etag, cache_control=cache_control
+        )
+        if cache_control:
+            return (*body, etag, cache_control)
+        return (*body, etag)
 
     def set_image_cache(
-        self, img_hash: str, body: Tuple[bytes, ImageType], timeout: int = 432000
+        self,
+        img_hash: Optional[str],
+        body: Tuple[bytes, ImageType],
+        timeout: int = 432000,
+        etag: Optional[str] = None,
+        cache_control: Optional[str] = None,
     ) -> bool:
         """
         Set base64 encoded image body in cache layer.
@@ -53,25 +292,180 @@ class CacheLayer(object):
                 file url.
             body : tuple
                 image body + ext
+            etag : str, optional
+                image ETag, computed when the image is rendered
+            cache_control : str, optional
+                Cache-Control header of the image (requires `etag`)
         Returns
         -------
             bool
 
         """
-        try:
-            return self.client.set(img_hash, body, time=timeout)
-        except Exception:
+        value: TileBody = body
+        if etag:
+            value = (*body, etag)  # type: ignore
+            if cache_control:
+                value = (*body, etag, cache_control)  # type: ignore
+        return self._set(img_hash, value, len(body[0]), "tiles", timeout)
+
+    def set_persistent_image_cache(
+        self, img_hash: str, body: Tuple[bytes, ImageType]
+    ) -> bool:
+        """
+        Set image body in the persistent tile store.
+
+        Stores can be slow, this is meant to be run as a background task.
+
+        """
+        if not self.store:
             return False
 
-    def get_dataset_from_cache(self, ds_hash: str) -> Union[Dict, bool]:
+        start = time.perf_counter_ns()
+        stored = self.store.set(img_hash, body)
+        _observe(start, "tiles", "store_set")
+        result = "stored" if stored else "error"
+        CACHE_WRITES.inc(keyspace="tiles", tier="store", result=result)
+        return stored
+
+    def get_dataset_from_cache(
+        self, ds_hash: Optional[str], keyspace: str = "datasets"
+    ) -> Union[Dict, bool]:
         """Get dataset response from cache layer"""
-        return self.client.get(ds_hash)
+        return self._get(ds_hash, keyspace)
 
     def set_dataset_cache(
-        self, ds_hash: str, body: Datasets, timeout: int = 3600
+        self,
+        ds_hash: Optional[str],
+        body: Datasets,
+        timeout: int = 3600,
+        keyspace: str = "datasets",
     ) -> bool:
         """Set dataset response in cache layer"""
-        try:
-            return self.client.set(ds_hash, body.json(), time=timeout)
-        except Exception:
-            return False
+        value = body.json()
+        return self._set(ds_hash, value, len(value), keyspace, timeout)
+
+    def get_footprint_from_cache(self, fp_hash: Optional[str]) -> Optional[Dict]:
+        """Get a COG footprint (see `dashboard_api.api.footprint`)."""
+        return self._get(fp_hash, "footprints")
+
+    def set_footprint_cache(
+        self,
+        fp_hash: Optional[str],
+        body: Dict,
+        timeout: int = config.FOOTPRINTS_CACHE_TTL,
+    ) -> bool:
+        """Set a COG footprint in cache layer."""
+        size = len(body["mask"]["bits"]) if body.get("mask") else 0
+        return self._set(fp_hash, body, size, "footprints", timeout)
+
+    def get_capabilities_from_cache(
+        self, caps_hash: Optional[str]
+    ) -> Optional[Tuple[bytes, str]]:
+        """Get a WMTS capabilities document + ETag from cache layer."""
+        return self._get(caps_hash, "capabilities")
+
+    def set_capabilities_cache(
+        self,
+        caps_hash: Optional[str],
+        body: Tuple[bytes, str],
+        timeout: int = config.CAPABILITIES_CACHE_TTL,
+    ) -> bool:
+        """Set a WMTS capabilities document + ETag in cache layer."""
+        return self._set(caps_hash, body, len(body[0]), "capabilities", timeout)
+
+    def update_server_stats(self):
+        """Update `memcached_stat` gauges from the servers `stats`."""
+        for server, stats in self.client.stats().items():
+            for stat in SERVER_STATS:
+                if stat in stats:
+                    MEMCACHED_STATS.set(float(stats[stat]), server=server, stat=stat)
+
+
+def get_cache_layer() -> Optional[CacheLayer]:
+    """Create a CacheLayer from the `MEMCACHE_*` settings (None if disabled)."""
+    if not config.MEMCACHE_HOST or config.DISABLE_CACHE:
+        return None
+
+    kwargs: Dict[str, Any] = {
+        k: v
+        for k, v in zip(
+            ["port", "user", "password"],
+            [config.MEMCACHE_PORT, config.MEMCACHE_USERNAME, config.MEMCACHE_PASSWORD],
+        )
+        if v
+    }
+    store = get_tile_store(config.TILE_STORE, config.TILE_STORE_ENDPOINT_URL)
+    return CacheLayer(config.MEMCACHE_HOST, store=store, **kwargs)
+
+
+def bump_generations(
+    cache: CacheLayer,
+    datasets: Sequence[str] = (),
+    sites: Sequence[str] = (),
+    all_datasets: bool = False,
+    all_sites: bool = False,
+    everything: bool = False,
+) -> Dict[str, int]:
+    """Bump the requested namespaces and return their new generations."""
+    namespaces = [dataset_namespace(ds) for ds in datasets]
+    namespaces += [site_namespace(site) for site in sites]
+    if all_datasets:
+        namespaces.append(DATASETS_NAMESPACE)
+    if all_sites:
+        namespaces.append(SITES_NAMESPACE)
+    if everything:
+        namespaces.append(GLOBAL_NAMESPACE)
+    return {ns: cache.bump_generation(ns) for ns in namespaces}
+
+
+def main(argv: Optional[List[str]] = None):
+    """
+    Invalidate cached responses.
+
+    Usage: python -m dashboard_api.db.memcache --dataset xco2-mean --site tk
+
+    """
+    parser = argparse.ArgumentParser(description="Bump cache generations.")
+    parser.add_argument(
+        "--dataset",
+        action="append",
+        default=[],
+        help="Dataset S3 folder whose tiles should be invalidated.",
+    )
+    parser.add_argument(
+        "--site",
+        action="append",
+        default=[],
+        help="Site id whose responses should be invalidated.",
+    )
+    parser.add_argument(
+        "--datasets",
+        action="store_true",
+        help="Invalidate all `/datasets` responses.",
+    )
+    parser.add_argument(
+        "--sites", action="store_true", help="Invalidate all `/sites` responses."
+    )
+    parser.add_argument(
+        "--all", action="store_true", help="Invalidate every cached response."
+    )
+    args = parser.parse_args(argv)
+
+    cache = get_cache_layer()
+    if not cache:
+        parser.error("Cache is disabled or MEMCACHE_HOST is not set.")
+
+    generations = bump_generations(
+        cache,
+        datasets=args.dataset,
+        sites=args.site,
+        all_datasets=args.datasets,
+        all_sites=args.sites,
+        everything=args.all,
+    )
+    for namespace, generation in generations.items():
+        print(f"{namespace}: {generation}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,21 +1,43 @@
 """ dashboard_api static datasets """
+import gzip
+import hashlib
 import json
 import os
-from typing import List
+import re
+import threading
+import time
+from typing import Dict, List, Optional, Pattern, Tuple
+from urllib.parse import parse_qs, urlparse
 
 import botocore
+from cachetools import LRUCache, TTLCache
 
 from dashboard_api.core.config import (DATASET_METADATA_FILENAME,
                                    BUCKET,
                                    VECTOR_TILESERVER_URL,
                                    TITILER_SERVER_URL)
+from dashboard_api.db import domains
+from dashboard_api.db.memcache import (
+    CacheLayer,
+    DATASETS_NAMESPACE,
+    GLOBAL_NAMESPACE,
+)
 from dashboard_api.db.static.errors import InvalidIdentifier
 from dashboard_api.db.static.sites import sites
 from dashboard_api.db.utils import invoke_lambda, s3_get
-from dashboard_api.models.static import DatasetInternal, Datasets, GeoJsonSource
+from dashboard_api.models.static import (
+    CachePolicy,
+    DatasetInternal,
+    Datasets,
+    GeoJsonSource,
+)
 
 data_dir = os.path.join(os.path.dirname(__file__))
 
+# cache policies and dated COG URL patterns by S3 folder
+Policies = Dict[str, Tuple[Optional[CachePolicy], List[Pattern]]]
+POLICIES_TTL = 60
+
 
 class DatasetManager(object):
     """Default Dataset holder."""
@@ -23,15 +45,202 @@ class DatasetManager(object):
     def __init__(self):
         """Load all datasets in a dict."""
 
-        pass
+        # the manifest (or the monolithic metadata file, without a manifest)
+        self.manifest_cache = TTLCache(2, 60)
+        # shards are named after their content hash, they never change
+        self.shards_cache = LRUCache(64)
+        # cache policies and dated COG URL patterns by S3 folder, looked up
+        # by tile requests: an (expiry, policies) tuple, read without the lock
+        # and swapped once rebuilt (see `cache_policy`)
+        self.policies: Optional[Tuple[float, Policies]] = None
+        # bumped when the policies are dropped, so that a rebuild started
+        # before isn't swapped in
+        self.policies_version = 0
+        # a single rebuild at a time
+        self.policies_lock = threading.Lock()
+        # cachetools caches are not thread safe (sync routes run in threads)
+        self.lock = threading.RLock()
+        # datasets cache generation the manifest was loaded for
+        self.generation: Optional[List[int]] = None
+
+    def sync(self, cache: Optional[CacheLayer]):
+        """
+        Drop the manifest (and the cache policies) if the datasets cache
+        generation changed since they were loaded: the metadata generator
+        bumps it after writing new metadata, responses cached for the new
+        generation must not be built from the previous manifest.
+        """
+        if not cache:
+            return
+        try:
+            generation = cache.get_generations(GLOBAL_NAMESPACE, DATASETS_NAMESPACE)
+        except Exception as e:
+            print(f"Cache error (get generations): {e!r}")
+            return
+        with self.lock:
+            if generation != self.generation:
+                self.manifest_cache.clear()
+                self.policies = None
+                self.policies_version += 1
+                self.generation = generation
 
     def _data(self):
-        dataset_objects = self._load_metadata_from_file()
+        # dataset definitions, without their domain (`_all` for files
+        # written before sharding)
+        dataset_objects = self._get_shard("_datasets", "_all")
         return {
             key: DatasetInternal.parse_obj(dataset)
-            for key, dataset in dataset_objects["_all"].items()
+            for key, dataset in dataset_objects.items()
         }
 
+    def _manifest_key(self) -> str:
+        return "{}/manifest.json".format(
+            os.path.splitext(DATASET_METADATA_FILENAME)[0]
+        )
+
+    def _load_manifest(self) -> Optional[dict]:
+        """
+        Load the manifest of the sharded metadata (None if the generator
+        didn't write it). The manifest lists one shard per spotlight (plus
+        `_all` and `_datasets`) with their key, sha256 and compression.
+        """
+        if os.environ.get('ENV') == 'local':
+            return None
+
+        with self.lock:
+            # entries can expire between a membership test and a lookup
+            manifest = self.manifest_cache.get("manifest", False)
+            if manifest is False:
+                try:
+                    manifest = json.loads(
+                        s3_get(bucket=BUCKET, key=self._manifest_key())
+                    )
+                except botocore.errorfactory.ClientError as e:
+                    if e.response["Error"]["Code"] not in ["NoSuchKey", "404"]:
+                        raise e
+                    manifest = None
+                self.manifest_cache["manifest"] = manifest
+            return manifest
+
+    def _get_shard(self, *names: str) -> Optional[dict]:
+        """
+        Get the metadata of a spotlight (or `_all`, `_datasets`, `global`),
+        the first of `names` found.
+
+        Shards are only downloaded on first access. Falls back to the
+        monolithic metadata file if there is no manifest.
+        """
+        manifest = self._load_manifest()
+        with self.lock:
+            if manifest is None:
+                data = self.manifest_cache.get("file")
+                if data is None:
+                    data = self._load_metadata_from_file()
+                    self.manifest_cache["file"] = data
+                return next((data[name] for name in names if name in data), None)
+
+            shard = next(
+                (manifest["shards"][name] for name in names if name in manifest["shards"]),
+                None,
+            )
+            if not shard:
+                return None
+
+            key = shard["key"]
+            data = self.shards_cache.get(key)
+            if data is None:
+                body = s3_get(bucket=BUCKET, key=key)
+                if shard.get("compression") == "gzip":
+                    body = gzip.decompress(body)
+                if hashlib.sha256(body).hexdigest() != shard["sha256"]:
+                    raise ValueError(f"Invalid checksum for s3://{BUCKET}/{key}")
+                data = json.loads(body)
+                self.shards_cache[key] = data
+            return data
+
+    def preload(self):
+        """
+        Load the manifest and the shards used by every request (see
+        `dashboard_api.warmup`). Spotlight shards are still loaded on first
+        access.
+        """
+        for name in ["_datasets", "_all", "global"]:
+            self._get_shard(name)
+        self.cache_policy("")
+
+    def _cache_policies(self) -> Policies:
+        policies: Policies = {}
+        for dataset in self._data().values():
+            if not dataset.s3_location:
+                continue
+            sources = [dataset.source]
+            if dataset.compare:
+                sources.append(dataset.compare.source)
+            patterns = [
+                _dated_url_pattern(template)
+                for source in sources
+                for template in getattr(source, "tiles", [])
+            ]
+            policies[dataset.s3_location] = (
+                dataset.cache_control,
+                [pattern for pattern in patterns if pattern],
+            )
+        return policies
+
+    def _reload_policies(self) -> Tuple[float, Policies]:
+        """Rebuild the cache policies, unless another thread just did."""
+        loaded = self.policies
+        if loaded is not None and loaded[0] >= time.monotonic():
+            return loaded
+
+        version = self.policies_version
+        try:
+            policies = self._cache_policies()
+        except Exception as e:
+            print(f"Unable to load the cache policies: {e!r}")
+            policies = {}
+        loaded = (time.monotonic() + POLICIES_TTL, policies)
+        with self.lock:
+            # dropped by `sync` during the rebuild
+            if version == self.policies_version:
+                self.policies = loaded
+        return loaded
+
+    def cache_policy(
+        self, folder: str, url: Optional[str] = None
+    ) -> Optional[CachePolicy]:
+        """
+        Return the cache policy of the tiles of a dataset, by S3 folder (see
+        `dashboard_api.api.utils.get_dataset_folder`), or None (defaults).
+
+        COG URLs matching a `{date}` tile template of the dataset (e.g
+        `s3://covid-eo-data/xco2-mean/xco2_16day_mean.{date}.tif`) are dated,
+        immutable, objects: their policy is `immutable`, unless the dataset's
+        `cache_control` sets `immutable` to false.
+
+        Metadata errors are logged (the defaults then apply until the policies
+        are reloaded).
+
+        The policies are reloaded every minute, without holding `self.lock`
+        (loading the metadata can download shards): lookups during a reload
+        use the expired policies, or wait for the reload if there are none.
+        """
+        loaded = self.policies
+        if loaded is None or loaded[0] < time.monotonic():
+            if self.policies_lock.acquire(blocking=loaded is None):
+                try:
+                    loaded = self._reload_policies()
+                finally:
+                    self.policies_lock.release()
+
+        policy, patterns = loaded[1].get(folder, (None, []))
+        if url and any(pattern.fullmatch(url) for pattern in patterns):
+            if policy is None:
+                return CachePolicy(immutable=True)
+            if policy.immutable is None:
+                return policy.copy(update={"immutable": True})
+        return policy
+
     def _load_metadata_from_file(self):
         if os.environ.get('ENV') == 'local':
             # Useful for local testing
@@ -51,7 +260,9 @@ class DatasetManager(object):
                 raise e
 
 
-    def get(self, spotlight_id: str, api_url: str) -> Datasets:
+    def get(
+        self, spotlight_id: str, api_url: str, domain_format: str = "list"
+    ) -> Datasets:
         """
         Fetches all the datasets available for a given spotlight. If the
         spotlight_id provided is "global" then this method will return
@@ -64,6 +275,8 @@ class DatasetManager(object):
         spotlight_id (str): spotlight id to return datasets for
         api_url(str): {scheme}://{host} of request originator in order
             to return correctly formated source urls
+        domain_format(str): "list" (all dates) or "rle" (run-length encoded
+            domains of non periodic datasets)
 
         Returns:
         -------
@@ -71,9 +284,10 @@ class DatasetManager(object):
         """
 
         global_datasets = self._process(
-            self._load_metadata_from_file()["global"],
+            self._get_shard("global") or {},
             api_url=api_url,
             spotlight_id="global",
+            domain_format=domain_format,
         )
 
         if spotlight_id == "global":
@@ -84,10 +298,13 @@ class DatasetManager(object):
         if not site:
             raise InvalidIdentifier()
 
-        spotlight_metadata = self._load_metadata_from_file().get(site.id)
+        spotlight_metadata = self._get_shard(site.id)
         if spotlight_metadata:
             spotlight_datasets = self._process(
-                spotlight_metadata, api_url=api_url, spotlight_id=site.id,
+                spotlight_metadata,
+                api_url=api_url,
+                spotlight_id=site.id,
+                domain_format=domain_format,
             )
         else:
             spotlight_datasets = []
@@ -98,11 +315,12 @@ class DatasetManager(object):
             ]
         )
 
-    def get_all(self, api_url: str) -> Datasets:
+    def get_all(self, api_url: str, domain_format: str = "list") -> Datasets:
         """Fetch all Datasets. Overload domain with S3 scanned domain"""
         datasets = self._process(
-            datasets_domains_metadata=self._load_metadata_from_file()["_all"],
+            datasets_domains_metadata=self._get_shard("_all") or {},
             api_url=api_url,
+            domain_format=domain_format,
         )
         return Datasets(datasets=[dataset.dict() for dataset in datasets])
 
@@ -121,7 +339,11 @@ class DatasetManager(object):
         ]
 
     def _process(
-        self, datasets_domains_metadata: dict, api_url: str, spotlight_id: str = None
+        self,
+        datasets_domains_metadata: dict,
+        api_url: str,
+        spotlight_id: str = None,
+        domain_format: str = "list",
     ):
         """
         Processes datasets to be returned to the API consumer:
@@ -137,6 +359,9 @@ class DatasetManager(object):
             prepend all tile source urls with.
         spotlight_id (Optional[str]):
             Spotlight ID (if requested), to be inserted into the source urls
+        domain_format (str):
+            "list" (all dates) or "rle" (run-length encoded), for non periodic
+            datasets. Periodic datasets domains are always [start, end].
 
         Returns:
         --------
@@ -153,6 +378,8 @@ class DatasetManager(object):
 
             # overload domain with domain returned from s3 file
             dataset.domain = datasets_domains_metadata[k].get("domain")
+            if not dataset.is_periodic:
+                dataset.domain = domains.format_domain(dataset.domain, domain_format)
 
             # format url to contain the correct API host and
             # spotlight id (if a spotlight was requested)
@@ -195,4 +422,29 @@ class DatasetManager(object):
         return output_datasets
 
 
+# dates in COG names, e.g 2019_01_01, 2019-01, 201901
+DATE_PATTERN = r"\d{4}(?:[-_.]?\d{2}){0,2}"
+
+
+def _dated_url_pattern(template: str) -> Optional[Pattern]:
+    """
+    Return a pattern of the COG URLs of a tile template (the `url` query
+    parameter), if the template is dated (None otherwise).
+    """
+    urls = parse_qs(urlparse(template).query).get("url")
+    if not urls or "{date}" not in urls[0]:
+        return None
+
+    pattern = ""
+    for part in re.split(r"(\{\w+\})", urls[0]):
+        if part == "{date}":
+            pattern += DATE_PATTERN
+        elif re.fullmatch(r"\{\w+\}", part):
+            # e.g {spotlightId}
+            pattern += r"[^/]+?"
+        else:
+            pattern += re.escape(part)
+    return re.compile(pattern)
+
+
 datasets = DatasetManager()
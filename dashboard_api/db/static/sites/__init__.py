@@ -25,49 +25,66 @@ class SiteManager(object):
 
     def get_all(self, api_url: str) -> Sites:
         """Fetch all Sites."""
-
-        sites = self.sites_cache.get("sites")
-
-        if sites:
-            cache_hit = True
-        else:
-            cache_hit = False
-            if os.environ.get('ENV') == 'local':
-                # Useful for local testing
-                example_sites = "example-site-metadata.json"
-                print(f"Loading {example_sites}")
-                s3_datasets = json.loads(open(example_sites).read())
-                sites = Sites(**s3_datasets)
-            else:    
-                try:
-                    print(f"Loading s3{BUCKET}/{SITE_METADATA_FILENAME}")
-                    s3_datasets = json.loads(
-                        s3_get(bucket=BUCKET, key=SITE_METADATA_FILENAME)
+        sites = self._load()
+        return Sites(
+            sites=[
+                site.copy(
+                    update=dict(
+                        links=site.links
+                        + [
+                            Link(
+                                href=f"{api_url}/sites/{site.id}",
+                                rel="self",
+                                type="application/json",
+                                title="Self",
+                            )
+                        ]
                     )
-                    print("sites json successfully loaded from S3")
+                )
+                for site in sites.sites
+            ]
+        )
 
-                except botocore.errorfactory.ClientError as e:
-                    if e.response["Error"]["Code"] in ["ResourceNotFoundException", "NoSuchKey"]:
-                        s3_datasets = json.loads(open("example-site-metadata.json").read())
-                    else:
-                        raise e
+    def preload(self):
+        """Load the sites and their indicators (see `dashboard_api.warmup`)."""
+        self._load()
 
-            sites = Sites(**s3_datasets)
+    def _load(self) -> Sites:
+        """Load the sites, with their indicators (cached for 60s).
 
-            indicators = indicator_folders()
-
-            for site in sites.sites:
-                site.links.append(Link(
-                    href=f"{api_url}/sites/{site.id}",
-                    rel="self",
-                    type="application/json",
-                    title="Self"
-                ))
-                site.indicators = [ind for ind in indicators if indicator_exists(site.id, ind)]
-
-        if not cache_hit and sites:
-            self.sites_cache["sites"] = sites
+        The sites are cached without their `self` link, which depends on the
+        URL of the API.
+        """
+        sites = self.sites_cache.get("sites")
+        if sites:
+            return sites
 
+        if os.environ.get('ENV') == 'local':
+            # Useful for local testing
+            example_sites = "example-site-metadata.json"
+            print(f"Loading {example_sites}")
+            s3_datasets = json.loads(open(example_sites).read())
+        else:
+            try:
+                print(f"Loading s3{BUCKET}/{SITE_METADATA_FILENAME}")
+                s3_datasets = json.loads(
+                    s3_get(bucket=BUCKET, key=SITE_METADATA_FILENAME)
+                )
+                print("sites json successfully loaded from S3")
+
+            except botocore.errorfactory.ClientError as e:
+                if e.response["Error"]["Code"] in ["ResourceNotFoundException", "NoSuchKey"]:
+                    s3_datasets = json.loads(open("example-site-metadata.json").read())
+                else:
+                    raise e
+
+        sites = Sites(**s3_datasets)
+
+        indicators = indicator_folders()
+        for site in sites.sites:
+            site.indicators = [ind for ind in indicators if indicator_exists(site.id, ind)]
+
+        self.sites_cache["sites"] = sites
         return sites
 
 
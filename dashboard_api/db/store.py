@@ -0,0 +1,133 @@
+"""dashboard_api.db.store: persistent tile stores (L3 cache)."""
+
+import abc
+import os
+from typing import Optional, Tuple
+from urllib.parse import urlparse
+
+from dashboard_api.ressources.enums import ImageType
+
+
+class TileStore(abc.ABC):
+    """
+    Persistent store for rendered tiles.
+
+    Tiles are stored under their cache key, which is a hash of the tile
+    parameters and of the cache generations (see `CacheLayer.versioned_key`),
+    so stored objects are never overwritten with different content.
+
+    """
+
+    @abc.abstractmethod
+    def get(self, key: str) -> Optional[Tuple[bytes, ImageType]]:
+        """Get image body + ext (None if the tile is not stored)."""
+
+    @abc.abstractmethod
+    def set(self, key: str, body: Tuple[bytes, ImageType]) -> bool:
+        """Store image body + ext."""
+
+    def reconnect(self):
+        """Drop open connections (e.g after a snapshot restore)."""
+
+
+class S3TileStore(TileStore):
+    """Store tiles in an S3 (or S3 compatible) bucket."""
+
+    def __init__(
+        self, bucket: str, prefix: str = "", endpoint_url: Optional[str] = None
+    ):
+        """Init S3 store."""
+        self.bucket = bucket
+        self.prefix = prefix.strip("/")
+        self.endpoint_url = endpoint_url
+        self.reconnect()
+
+    def reconnect(self):
+        """Create a new S3 client (and connection pool)."""
+        import boto3
+
+        self.client = boto3.client("s3", endpoint_url=self.endpoint_url)
+
+    def _key(self, key: str) -> str:
+        return "/".join(filter(None, [self.prefix, key[:2], key]))
+
+    def get(self, key: str) -> Optional[Tuple[bytes, ImageType]]:
+        """Get image body + ext from S3."""
+        try:
+            response = self.client.get_object(Bucket=self.bucket, Key=self._key(key))
+            ext = ImageType(response["Metadata"]["ext"])
+            return response["Body"].read(), ext
+        except Exception:
+            return None
+
+    def set(self, key: str, body: Tuple[bytes, ImageType]) -> bool:
+        """Put image body + ext in S3."""
+        content, ext = body
+        try:
+            self.client.put_object(
+                Bucket=self.bucket,
+                Key=self._key(key),
+                Body=content,
+                Metadata={"ext": ext.value},
+            )
+            return True
+        except Exception:
+            return False
+
+
+class FileTileStore(TileStore):
+    """Store tiles on the local filesystem (useful for local testing)."""
+
+    def __init__(self, path: str):
+        """Init filesystem store."""
+        self.path = path
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.path, key[:2], key)
+
+    def get(self, key: str) -> Optional[Tuple[bytes, ImageType]]:
+        """Read image body + ext from disk."""
+        try:
+            with open(self._path(key), "rb") as f:
+                ext, content = f.read().split(b"\n", 1)
+            return content, ImageType(ext.decode())
+        except (OSError, ValueError):
+            return None
+
+    def set(self, key: str, body: Tuple[bytes, ImageType]) -> bool:
+        """Write image body + ext to disk."""
+        content, ext = body
+        path = self._path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # write to a temporary file first so readers never see partial tiles
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(ext.value.encode() + b"\n" + content)
+            os.replace(tmp_path, path)
+            return True
+        except OSError:
+            return False
+
+
+def get_tile_store(
+    location: Optional[str], endpoint_url: Optional[str] = None
+) -> Optional[TileStore]:
+    """
+    Create a TileStore from a location.
+
+    `s3://bucket/prefix` creates an S3TileStore, `file:///path` or a plain
+    path creates a FileTileStore.
+
+    """
+    if not location:
+        return None
+
+    parsed = urlparse(location)
+    if parsed.scheme == "s3":
+        return S3TileStore(parsed.netloc, parsed.path, endpoint_url=endpoint_url)
+
+    if parsed.scheme in ["", "file"]:
+        return FileTileStore(parsed.path)
+
+    raise ValueError(f"Unsupported tile store location: {location}")
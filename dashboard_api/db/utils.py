@@ -3,23 +3,37 @@
 import csv
 import json
 from datetime import datetime
+from functools import lru_cache
 from typing import Dict, List
 
-import boto3
-from botocore import config
-
+from dashboard_api.core import timing
 from dashboard_api.core.config import DT_FORMAT, BUCKET
 from dashboard_api.models.static import IndicatorObservation
 
-s3 = boto3.client("s3")
 
-_lambda = boto3.client(
-    "lambda",
-    region_name="us-east-1",
-    config=config.Config(
-        read_timeout=900, connect_timeout=900, retries={"max_attempts": 0}
-    ),
-)
+# boto3 clients are created on first use: creating them (and importing boto3)
+# takes a significant part of the cold start of the lambda
+@lru_cache(maxsize=1)
+def s3_client():
+    """Return the S3 client."""
+    import boto3
+
+    return boto3.client("s3")
+
+
+@lru_cache(maxsize=1)
+def lambda_client():
+    """Return the Lambda client."""
+    import boto3
+    from botocore import config
+
+    return boto3.client(
+        "lambda",
+        region_name="us-east-1",
+        config=config.Config(
+            read_timeout=900, connect_timeout=900, retries={"max_attempts": 0}
+        ),
+    )
 
 
 def invoke_lambda(
@@ -81,13 +95,14 @@ def invoke_lambda(
     )
     if payload:
         lambda_invoke_params.update(dict(Payload=json.dumps(payload)))
-    return _lambda.invoke(**lambda_invoke_params)
+    return lambda_client().invoke(**lambda_invoke_params)
 
 
 def s3_get(bucket: str, key: str):
     """Get AWS S3 Object."""
-    response = s3.get_object(Bucket=bucket, Key=key)
-    return response["Body"].read()
+    with timing.stage("s3-get"):
+        response = s3_client().get_object(Bucket=bucket, Key=key)
+        return response["Body"].read()
 
 
 def get_indicator_site_metadata(identifier: str, folder: str) -> Dict:
@@ -101,28 +116,30 @@ def get_indicator_site_metadata(identifier: str, folder: str) -> Dict:
 
 def indicator_folders() -> List:
     """Get Indicator folders."""
-    response = s3.list_objects_v2(
-        Bucket=BUCKET, Prefix="indicators/", Delimiter="/",
-    )
+    with timing.stage("s3-list"):
+        response = s3_client().list_objects_v2(
+            Bucket=BUCKET, Prefix="indicators/", Delimiter="/",
+        )
     common_prefixes = response.get('CommonPrefixes')
     return [obj["Prefix"].split("/")[1] for obj in common_prefixes] if common_prefixes else []
 
 def indicator_exists(identifier: str, indicator: str):
     """Check if an indicator exists for a site"""
-    try:
-        s3.head_object(
-            Bucket=BUCKET, Key=f"indicators/{indicator}/{identifier}.csv",
-        )
-        return True
-    except Exception:
+    with timing.stage("s3-head"):
         try:
-            s3.head_object(
-                Bucket=BUCKET,
-                Key=f"indicators/{indicator}/{identifier}.json",
+            s3_client().head_object(
+                Bucket=BUCKET, Key=f"indicators/{indicator}/{identifier}.csv",
             )
             return True
         except Exception:
-            return False
+            try:
+                s3_client().head_object(
+                    Bucket=BUCKET,
+                    Key=f"indicators/{indicator}/{identifier}.json",
+                )
+                return True
+            except Exception:
+                return False
 
 
 def get_indicators(identifier) -> List:
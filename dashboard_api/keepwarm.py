@@ -0,0 +1,324 @@
+"""dashboard_api.keepwarm: keep lambda containers warm ahead of traffic.
+
+A scheduled (EventBridge) event `{"warmer": {"fanout": true}}` makes the
+lambda invoke itself N times concurrently with a warm ping. Each ping holds
+its container for `KEEP_WARM_HOLD` ms, so that concurrent pings are served
+by N different containers: cold containers run their init phase (see
+`dashboard_api.warmup`) then answer the ping, without doing real work.
+
+N is derived from the `ConcurrentExecutions` CloudWatch metric of the
+function: the peak concurrency of the last `KEEP_WARM_LOOKBACK` minutes and
+of the next `KEEP_WARM_LOOKAHEAD` minutes one day earlier (to anticipate
+daily ramps), times `KEEP_WARM_FACTOR`, between `KEEP_WARM_MIN` and
+`KEEP_WARM_MAX`. The pings are executions too: every fan out publishes its
+size (`WarmPings` metric), which is subtracted from the concurrency of the
+minute it happened in, so that N follows the traffic and not the pings.
+
+The ping is also served by the `/_warm` route (without holding the
+container: the route is public). To test locally:
+
+    python -m dashboard_api.keepwarm --target http://localhost:8000 -n 8
+    python -m dashboard_api.keepwarm --function my-function --dry-run
+"""
+
+import argparse
+import datetime
+import json
+import math
+import os
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+from dashboard_api.core import config
+
+WARM_EVENT_KEY = "warmer"
+
+# custom CloudWatch metric of the number of pings of each fan out
+PINGS_NAMESPACE = "dashboard_api"
+PINGS_METRIC = "WarmPings"
+
+# pings are not allowed to hold a container for longer
+MAX_HOLD = 1000
+
+_container = dict(id=uuid.uuid4().hex[:8], started=time.time(), pings=0)
+
+
+def is_warm_event(event: Any) -> bool:
+    """Check if a lambda event is a keep-warm event."""
+    return isinstance(event, dict) and WARM_EVENT_KEY in event
+
+
+def ping(hold: float = 0) -> Dict:
+    """
+    Answer a warm ping after holding the container for `hold` ms.
+
+    Returns the container id, whether it was cold (first ping since it
+    started) and its uptime.
+
+    """
+    _container["pings"] += 1
+    if hold:
+        time.sleep(min(hold, MAX_HOLD) / 1000)
+    return dict(
+        container=_container["id"],
+        cold=_container["pings"] == 1,
+        uptime=round(time.time() - _container["started"], 1),
+    )
+
+
+def target_concurrency(
+    recent: List[float],
+    previous_day: List[float],
+    minimum: int = config.KEEP_WARM_MIN,
+    maximum: int = config.KEEP_WARM_MAX,
+    factor: float = config.KEEP_WARM_FACTOR,
+) -> int:
+    """Number of containers to keep warm from concurrency datapoints."""
+    peak = max(recent + previous_day, default=0)
+    return min(max(minimum, math.ceil(peak * factor)), maximum)
+
+
+def _datapoints(
+    cloudwatch: Any,
+    namespace: str,
+    metric: str,
+    function_name: str,
+    start: datetime.datetime,
+    end: datetime.datetime,
+) -> Dict[datetime.datetime, float]:
+    """Maximum of a metric of a function, by minute."""
+    response = cloudwatch.get_metric_statistics(
+        Namespace=namespace,
+        MetricName=metric,
+        Dimensions=[{"Name": "FunctionName", "Value": function_name}],
+        StartTime=start,
+        EndTime=end,
+        Period=60,
+        Statistics=["Maximum"],
+    )
+    return {point["Timestamp"]: point["Maximum"] for point in response["Datapoints"]}
+
+
+def concurrency_datapoints(
+    function_name: str,
+    start: datetime.datetime,
+    end: datetime.datetime,
+    cloudwatch: Any = None,
+) -> List[float]:
+    """Peak concurrent executions of a function by minute, without its pings."""
+    if cloudwatch is None:
+        import boto3
+
+        cloudwatch = boto3.client("cloudwatch")
+
+    concurrency = _datapoints(
+        cloudwatch,
+        "AWS/Lambda",
+        "ConcurrentExecutions",
+        function_name,
+        start,
+        end,
+    )
+    pings = _datapoints(
+        cloudwatch, PINGS_NAMESPACE, PINGS_METRIC, function_name, start, end
+    )
+    return [
+        max(0, value - pings.get(timestamp, 0))
+        for timestamp, value in concurrency.items()
+    ]
+
+
+def publish_pings(
+    function_name: str,
+    n: int,
+    now: Optional[datetime.datetime] = None,
+    cloudwatch: Any = None,
+):
+    """Publish the size of a fan out (see `concurrency_datapoints`)."""
+    if cloudwatch is None:
+        import boto3
+
+        cloudwatch = boto3.client("cloudwatch")
+
+    cloudwatch.put_metric_data(
+        Namespace=PINGS_NAMESPACE,
+        MetricData=[
+            {
+                "MetricName": PINGS_METRIC,
+                "Dimensions": [{"Name": "FunctionName", "Value": function_name}],
+                "Timestamp": now or datetime.datetime.utcnow(),
+                "Value": n,
+                "Unit": "Count",
+            }
+        ],
+    )
+
+
+def concurrency_from_metrics(
+    function_name: str,
+    now: Optional[datetime.datetime] = None,
+    cloudwatch: Any = None,
+) -> int:
+    """Number of containers to keep warm from the function's metrics."""
+    now = now or datetime.datetime.utcnow()
+    lookback = datetime.timedelta(minutes=config.KEEP_WARM_LOOKBACK)
+    lookahead = datetime.timedelta(minutes=config.KEEP_WARM_LOOKAHEAD)
+    yesterday = now - datetime.timedelta(days=1)
+
+    recent = concurrency_datapoints(function_name, now - lookback, now, cloudwatch)
+    previous_day = concurrency_datapoints(
+        function_name, yesterday, yesterday + lookahead, cloudwatch
+    )
+    return target_concurrency(recent, previous_day)
+
+
+def fan_out(
+    n: int, send: Callable[[float], Optional[Dict]], hold: float = config.KEEP_WARM_HOLD
+) -> Dict:
+    """
+    Send `n` concurrent warm pings with `send(hold)`.
+
+    Returns the number of pings sent, the number of distinct containers
+    which answered, how many of them were cold, and the number of errors.
+
+    """
+    if n <= 0:
+        return dict(pings=0, containers=0, cold=0, errors=0)
+
+    def _send(_):
+        try:
+            return send(hold)
+        except Exception as e:
+            print(f"Warm ping failed: {e!r}")
+            return None
+
+    with ThreadPoolExecutor(max_workers=n) as executor:
+        responses = list(executor.map(_send, range(n)))
+
+    answered = {r["container"]: r for r in responses if r}
+    return dict(
+        pings=n,
+        containers=len(answered),
+        cold=sum(1 for r in answered.values() if r["cold"]),
+        errors=sum(1 for r in responses if not r),
+    )
+
+
+def lambda_sender(function_name: str, n: int) -> Callable[[float], Optional[Dict]]:
+    """Return a function invoking `function_name` with a warm ping."""
+    import boto3
+    from botocore.config import Config
+
+    client = boto3.client(
+        "lambda",
+        config=Config(max_pool_connections=max(n, 10), retries={"max_attempts": 0}),
+    )
+
+    def send(hold: float) -> Optional[Dict]:
+        response = client.invoke(
+            FunctionName=function_name,
+            Payload=json.dumps({WARM_EVENT_KEY: {"hold": hold}}).encode(),
+        )
+        if response.get("FunctionError"):
+            return None
+        return json.loads(response["Payload"].read())
+
+    return send
+
+
+def http_sender(target: str, n: int) -> Callable[[float], Optional[Dict]]:
+    """
+    Return a function sending a warm ping to the `/_warm` route of `target`.
+
+    The route doesn't hold the container: concurrent pings may be answered
+    by the same container.
+
+    """
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=n, pool_maxsize=n)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    url = f"{target.rstrip('/')}/_warm"
+
+    def send(hold: float) -> Optional[Dict]:
+        response = session.get(url, timeout=30)
+        response.raise_for_status()
+        return response.json()
+
+    return send
+
+
+def handle(event: Dict, context: Any = None) -> Dict:
+    """
+    Handle a keep-warm lambda event.
+
+    `{"warmer": {"hold": 100}}` is a warm ping; `{"warmer": {"fanout": true}}`
+    sends N concurrent pings to this function (one container is already
+    warm: the one handling the fan out).
+
+    """
+    options = event[WARM_EVENT_KEY] or {}
+    if not options.get("fanout"):
+        return ping(options.get("hold", 0))
+
+    function_name = getattr(context, "function_name", None) or os.environ.get(
+        "AWS_LAMBDA_FUNCTION_NAME"
+    )
+    if options.get("concurrency") is not None:
+        n = int(options["concurrency"])
+    else:
+        n = concurrency_from_metrics(function_name)
+
+    send = lambda_sender(function_name, n) if n > 1 else ping
+    start = datetime.datetime.utcnow()
+    result = dict(concurrency=n, **fan_out(n - 1, send))
+    print(json.dumps(dict(keepwarm=result)))
+    if function_name:
+        try:
+            publish_pings(function_name, n, now=start)
+        except Exception as e:
+            print(f"Unable to publish the warm pings: {e!r}")
+    return result
+
+
+def main(argv: Optional[List[str]] = None):
+    """Send concurrent warm pings and print a summary."""
+    parser = argparse.ArgumentParser(description="Send concurrent warm pings.")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--target", help="API base URL (pings `/_warm`).")
+    target.add_argument("--function", help="Lambda function name (invoked).")
+    parser.add_argument(
+        "-n",
+        "--concurrency",
+        type=int,
+        help="Number of pings (default: from the function's CloudWatch metrics).",
+    )
+    parser.add_argument("--hold", type=float, default=config.KEEP_WARM_HOLD)
+    parser.add_argument(
+        "--dry-run", action="store_true", help="Only print the number of pings."
+    )
+    args = parser.parse_args(argv)
+
+    n = args.concurrency
+    if n is None:
+        if not args.function:
+            parser.error("--concurrency is required with --target")
+        n = concurrency_from_metrics(args.function)
+    if args.dry_run:
+        print(json.dumps(dict(concurrency=n)))
+        return
+
+    if args.function:
+        send = lambda_sender(args.function, n)
+    else:
+        send = http_sender(args.target, n)
+    print(json.dumps(dict(concurrency=n, **fan_out(n, send, args.hold))))
+
+
+if __name__ == "__main__":
+    main()
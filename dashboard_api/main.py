@@ -1,33 +1,25 @@
 """dashboard_api app."""
-from typing import Any, Dict
 
-from dashboard_api import version
+import hmac
+import json
+import time
+from typing import Optional
+
+from dashboard_api import keepwarm, version, warmup
 from dashboard_api.api.api_v1.api import api_router
-from dashboard_api.core import config
-from dashboard_api.db.memcache import CacheLayer
+from dashboard_api.core import config, executors, metrics, profiling, timing
+from dashboard_api.core.compression import GZipMiddleware
+from dashboard_api.db.memcache import get_cache_layer
+from dashboard_api.ressources.templates import get_templates
 
-from fastapi import FastAPI
+from fastapi import FastAPI, Header, HTTPException
 
+from starlette.concurrency import run_in_threadpool
 from starlette.middleware.cors import CORSMiddleware
-from starlette.middleware.gzip import GZipMiddleware
 from starlette.requests import Request
-from starlette.responses import HTMLResponse
-from starlette.templating import Jinja2Templates
+from starlette.responses import HTMLResponse, PlainTextResponse
 
-templates = Jinja2Templates(directory="dashboard_api/templates")
-
-if config.MEMCACHE_HOST and not config.DISABLE_CACHE:
-    kwargs: Dict[str, Any] = {
-        k: v
-        for k, v in zip(
-            ["port", "user", "password"],
-            [config.MEMCACHE_PORT, config.MEMCACHE_USERNAME, config.MEMCACHE_PASSWORD],
-        )
-        if v
-    }
-    cache = CacheLayer(config.MEMCACHE_HOST, **kwargs)
-else:
-    cache = None
+cache = get_cache_layer()
 
 
 app = FastAPI(
@@ -51,6 +43,18 @@ if config.BACKEND_CORS_ORIGINS:
 app.add_middleware(GZipMiddleware, minimum_size=0)
 
 
+@app.on_event("startup")
+async def startup():
+    """Warm up the process (not run in AWS Lambda, see `lambda/handler.py`)."""
+    await run_in_threadpool(warmup.warm_up, cache=cache)
+
+
+@app.on_event("shutdown")
+def shutdown():
+    """Shut the tile and metadata executors down."""
+    executors.shutdown()
+
+
 @app.middleware("http")
 async def cache_middleware(request: Request, call_next):
     """Add cache layer."""
@@ -61,6 +65,92 @@ async def cache_middleware(request: Request, call_next):
     return response
 
 
+REQUEST_LATENCY = metrics.registry.histogram(
+    "http_request_duration_seconds", "Request latency by route."
+)
+STAGE_LATENCY = metrics.registry.histogram(
+    "http_request_stage_seconds", "Latency of request stages by route."
+)
+
+
+@app.middleware("http")
+async def timing_middleware(request: Request, call_next):
+    """Time request stages, add `Server-Timing` header and record metrics."""
+    if config.LOG_METRICS:
+        before = metrics.registry.snapshot()
+
+    timings = timing.start_request()
+    response = await call_next(request)
+    total = timings.elapsed()
+    response.headers["Server-Timing"] = timings.header(total)
+
+    # `endpoint` is set in the scope by the router
+    route = getattr(request.scope.get("endpoint"), "__name__", "unmatched")
+    REQUEST_LATENCY.observe(
+        total / 1e9,
+        route=route,
+        method=request.method,
+        status=str(response.status_code),
+    )
+    for name, duration in timings.stages.items():
+        STAGE_LATENCY.observe(duration / 1e9, route=route, stage=name)
+
+    if config.LOG_METRICS:
+        print(
+            json.dumps(
+                dict(
+                    time=time.time(),
+                    method=request.method,
+                    path=request.url.path,
+                    query=request.url.query,
+                    route=route,
+                    status=response.status_code,
+                    timings={k: v / 1e6 for k, v in timings.stages.items()},
+                    metrics=metrics.diff(before, metrics.registry.snapshot()),
+                )
+            )
+        )
+    return response
+
+
+@app.middleware("http")
+async def profiling_middleware(request: Request, call_next):
+    """Profile sampled or signed requests (see `dashboard_api.core.profiling`)."""
+    if not profiling.should_profile(
+        request.url.path,
+        request.url.query,
+        request.headers.get(profiling.SIGNATURE_HEADER),
+    ):
+        return await call_next(request)
+
+    sampler = profiling.Sampler(config.PROFILE_INTERVAL)
+    sampler.start()
+    try:
+        response = await call_next(request)
+    finally:
+        sampler.stop()
+
+    route = getattr(request.scope.get("endpoint"), "__name__", "unmatched")
+    tags = {
+        "route": route,
+        "method": request.method,
+        "path": request.url.path,
+        "query": request.url.query,
+        "status": str(response.status_code),
+        **{k: str(v) for k, v in request.scope.get("path_params", {}).items()},
+    }
+    name = f"{route} {request.method} {request.url.path}?{request.url.query}"
+    try:
+        location = await run_in_threadpool(
+            profiling.save_profile, sampler.speedscope(name), route, tags
+        )
+        print(f"Request profile written to {location}")
+    except Exception as e:
+        print(f"Unable to write request profile: {e!r}")
+
+    return response
+
+
 @app.get(
     "/",
     responses={200: {"content": {"text/html": {}}}},
@@ -79,7 +169,7 @@ def index(request: Request):
         host += config.API_VERSION_STR
     endpoint = f"{scheme}://{host}"
 
-    return templates.TemplateResponse(
+    return get_templates().TemplateResponse(
         "index.html", {"request": request, "endpoint": endpoint}, media_type="text/html"
     )
 
@@ -97,7 +187,7 @@ def simple(request: Request):
         host += config.API_VERSION_STR
     endpoint = f"{scheme}://{host}"
 
-    return templates.TemplateResponse(
+    return get_templates().TemplateResponse(
         "simple.html",
         {"request": request, "endpoint": endpoint},
         media_type="text/html",
@@ -110,4 +200,39 @@ def ping():
     return {"ping": "pong!"}
 
 
+@app.get("/_warm", include_in_schema=False)
+async def warm():
+    """Keep-warm ping (see `dashboard_api.keepwarm`), without hold."""
+    return keepwarm.ping()
+
+
+@app.get(
+    "/metrics",
+    description="Prometheus metrics",
+    responses={200: {"content": {"text/plain": {}}}},
+    response_class=PlainTextResponse,
+    include_in_schema=False,
+)
+def get_metrics(authorization: Optional[str] = Header(None)):
+    """Return metrics in the Prometheus text format (see `METRICS_TOKEN`)."""
+    if not config.METRICS_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not hmac.compare_digest(authorization or "", f"Bearer {config.METRICS_TOKEN}"):
+        raise HTTPException(
+            status_code=401,
+            detail="Invalid token",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+
+    if cache:
+        try:
+            cache.update_server_stats()
+        except Exception as e:
+            print(f"Unable to get memcached stats: {e!r}")
+
+    return PlainTextResponse(
+        metrics.registry.render(), media_type="text/plain; version=0.0.4"
+    )
+
+
 app.include_router(api_router, prefix=config.API_VERSION_STR)
@@ -91,6 +91,23 @@ class CirclePaint(Paint):
     circle_color: Optional[dict]
     circle_stroke_color: Optional[str]
 
+class DomainRun(BaseModel):
+    """Dates from `start` to `end` every `step` days/months, except `exceptions`."""
+
+    start: str
+    end: str
+    step: int = 1
+    unit: str = "day"
+    exceptions: Optional[List[str]]
+
+
+class RunLengthDomain(BaseModel):
+    """Run-length encoded domain (see `dashboard_api.db.domains`)."""
+
+    encoding: str = "rle"
+    runs: List[DomainRun]
+
+
 class Dataset(BaseModel):
     """Dataset Model."""
 
@@ -99,7 +116,7 @@ class Dataset(BaseModel):
     type: str
     is_periodic: bool = False
     time_unit: Optional[str] = ""
-    domain: Optional[List[str]] = []
+    domain: Optional[Union[List[str], RunLengthDomain]] = []
     source: Union[NonGeoJsonSource, GeoJsonSource]
     background_source: Optional[Union[NonGeoJsonSource, GeoJsonSource]]
     exclusive_with: Optional[List[str]] = []
@@ -121,10 +138,20 @@ class DatasetExternal(Dataset):
         allow_population_by_field_name = True
 
 
+class CachePolicy(BaseModel):
+    """HTTP caching of a dataset's tiles (`Cache-Control` max-age, in seconds)."""
+
+    max_age: Optional[int]
+    stale_while_revalidate: Optional[int]
+    # tiles of dated COGs are immutable, unless set to false
+    immutable: Optional[bool]
+
+
 class DatasetInternal(Dataset):
     """ Private dataset model (includes the dataset's location in s3) """
 
     s3_location: Optional[str]
+    cache_control: Optional[CachePolicy]
 
 
 class Datasets(BaseModel):
@@ -3,6 +3,20 @@
 from enum import Enum
 
 
+class DomainFormat(str, Enum):
+    """Dataset domain formats."""
+
+    list = "list"
+    rle = "rle"
+
+
+class TileEncoding(str, Enum):
+    """Tile encoder settings (see `dashboard_api.api.encoding`)."""
+
+    fast = "fast"
+    compact = "compact"
+
+
 class ImageType(str, Enum):
     """Image Type Enums."""
 
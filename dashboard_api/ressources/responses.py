@@ -1,9 +1,39 @@
 """Common response models."""
 
+import hashlib
+from typing import Optional
+
 from starlette.background import BackgroundTask
 from starlette.responses import Response
 
 
+def get_etag(content: bytes) -> str:
+    """Return the (strong) ETag of a response body: a hash of its content."""
+    return '"{}"'.format(hashlib.blake2b(content, digest_size=16).hexdigest())
+
+
+def etag_matches(if_none_match: Optional[str], etag: Optional[str]) -> bool:
+    """Check an `If-None-Match` header against an ETag (weak comparison)."""
+    if not if_none_match or not etag:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in tags or etag in [
+        tag[2:] if tag.startswith("W/") else tag for tag in tags
+    ]
+
+
+def cache_control(
+    max_age: int, stale_while_revalidate: int = 0, immutable: bool = False
+) -> str:
+    """Return a `Cache-Control` header value for public responses."""
+    directives = ["public", f"max-age={max_age}"]
+    if stale_while_revalidate:
+        directives.append(f"stale-while-revalidate={stale_while_revalidate}")
+    if immutable:
+        directives.append("immutable")
+    return ", ".join(directives)
+
+
 class XMLResponse(Response):
     """XML Response"""
 
@@ -11,7 +41,13 @@ class XMLResponse(Response):
 
 
 class TileResponse(Response):
-    """Tiler's response."""
+    """
+    Tiler's response.
+
+    With `status_code=304` (the client's copy matches `etag`), the body is
+    dropped and only the validator and caching headers are sent.
+
+    """
 
     def __init__(
         self,
@@ -21,13 +57,19 @@ class TileResponse(Response):
         headers: dict = {},
         background: BackgroundTask = None,
         ttl: int = 3600,
+        etag: Optional[str] = None,
+        cache_control: Optional[str] = None,
     ) -> None:
         """Init tiler response."""
-        headers.update({"Content-Type": media_type})
-        if ttl:
-            headers.update({"Cache-Control": "max-age=3600"})
-        self.body = self.render(content)
-        self.status_code = 200
+        headers = dict(headers, **{"Content-Type": media_type})
+        if cache_control:
+            headers["Cache-Control"] = cache_control
+        elif ttl:
+            headers["Cache-Control"] = f"max-age={ttl}"
+        if etag:
+            headers["ETag"] = etag
+        self.body = b"" if status_code == 304 else self.render(content)
+        self.status_code = status_code
         self.media_type = media_type
         self.background = background
         self.init_headers(headers)
@@ -0,0 +1,15 @@
+"""dashboard_api.ressources.templates: Jinja2 templates."""
+
+from functools import lru_cache
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from starlette.templating import Jinja2Templates
+
+
+@lru_cache(maxsize=1)
+def get_templates() -> "Jinja2Templates":
+    """Return the templates (jinja2 is imported on first use)."""
+    from starlette.templating import Jinja2Templates
+
+    return Jinja2Templates(directory="dashboard_api/templates")
@@ -0,0 +1,152 @@
+"""dashboard_api.warmup: initialization of a new process (lambda init phase).
+
+Runs the work otherwise done by the first requests handled by a process:
+
+- `gdal`: load GDAL, register its drivers and read the GDAL/VSI settings
+  (`GDAL_*`, `VSI_*` and `CPL_*` environment variables) by rendering a blank
+  tile
+- `colormaps`: load the colormaps (`utils.get_cmap`)
+- `clients`: create the S3 client and fetch the global cache generation
+- `metadata`: load the dataset metadata shards and the sites
+- `executors`: start the rendering processes (`CPU_WORKERS`)
+
+Called from the lambda handler at import (init phase) and on the app startup
+(uvicorn). `WARMUP` selects the steps (only `clients` on Lambda by default,
+see `core/config.py`). A failing step is logged and skipped: requests then do
+the work themselves.
+
+The initialized process can be snapshotted (e.g Lambda SnapStart):
+`after_restore` drops the connections opened before the snapshot, which are
+stale after a restore, and reseeds the random number generators.
+"""
+
+import json
+import random
+import time
+from typing import Callable, Dict, Iterable, List, Optional
+
+from dashboard_api.core import config
+from dashboard_api.db.memcache import GLOBAL_NAMESPACE, CacheLayer
+
+
+def _gdal(cache: Optional[CacheLayer]):
+    import numpy
+    import rasterio
+    from rio_tiler.utils import render
+
+    with rasterio.Env():
+        tile = numpy.zeros((1, 256, 256), dtype="uint8")
+        mask = numpy.zeros((256, 256), dtype="uint8")
+        for driver in ["PNG", "JPEG"]:
+            render(tile, mask, img_format=driver)
+
+
+def _colormaps(cache: Optional[CacheLayer]):
+    from dashboard_api.api import utils
+
+    for name in utils.COLOR_MAP_NAMES:
+        utils.get_cmap(name)
+
+
+def _clients(cache: Optional[CacheLayer]):
+    from dashboard_api.db.utils import s3_client
+
+    s3_client()
+    if cache:
+        cache.get_generations(GLOBAL_NAMESPACE)
+
+
+def _metadata(cache: Optional[CacheLayer]):
+    from dashboard_api.db.static.datasets import datasets
+    from dashboard_api.db.static.sites import sites
+
+    datasets.preload()
+    sites.preload()
+
+
+def _executors(cache: Optional[CacheLayer]):
+    from dashboard_api.core import executors
+
+    executors.start()
+
+
+STEPS: Dict[str, Callable[[Optional[CacheLayer]], None]] = {
+    "gdal": _gdal,
+    "colormaps": _colormaps,
+    "clients": _clients,
+    "metadata": _metadata,
+    "executors": _executors,
+}
+
+
+def get_steps(setting: Optional[str] = None) -> List[str]:
+    """Return the steps selected by a `WARMUP` setting (default: `WARMUP`)."""
+    setting = (config.WARMUP if setting is None else setting).strip().lower()
+    if setting == "all":
+        return list(STEPS)
+    if setting in ["", "none", "false", "0"]:
+        return []
+    steps = [step.strip() for step in setting.split(",") if step.strip()]
+    unknown = set(steps) - set(STEPS)
+    if unknown:
+        raise ValueError(f"Unknown warm up steps: {', '.join(sorted(unknown))}")
+    return steps
+
+
+def warm_up(
+    steps: Optional[Iterable[str]] = None, cache: Optional[CacheLayer] = None
+) -> Dict[str, Optional[float]]:
+    """
+    Run the warm up steps (default: `WARMUP`).
+
+    Returns the duration of each step (ms), None for failed steps. The
+    durations are also logged as a JSON line.
+
+    """
+    if steps is None:
+        steps = get_steps()
+
+    durations: Dict[str, Optional[float]] = {}
+    for step in steps:
+        start = time.perf_counter()
+        try:
+            STEPS[step](cache)
+        except Exception as e:
+            print(f"Warm up step {step} failed: {e!r}")
+            durations[step] = None
+            continue
+        durations[step] = round((time.perf_counter() - start) * 1000, 2)
+
+    if cache:
+        # don't keep the memcached connections opened during the init phase
+        cache.client.disconnect_all()
+
+    print(json.dumps(dict(warmup=durations)))
+    return durations
+
+
+def after_restore(cache: Optional[CacheLayer] = None):
+    """Drop the connections and reseed the random generators after a restore."""
+    from dashboard_api.db.utils import lambda_client, s3_client
+
+    # clients (and their connection pools) are recreated on first use
+    s3_client.cache_clear()
+    lambda_client.cache_clear()
+    if cache:
+        cache.client.disconnect_all()
+        if cache.store:
+            cache.store.reconnect()
+
+    # restored processes share the state of the snapshot
+    random.seed()
+
+
+def register_snapshot_hooks(cache: Optional[CacheLayer] = None) -> bool:
+    """Run `after_restore` after a SnapStart restore (False without SnapStart)."""
+    try:
+        from snapshot_restore_py import register_after_restore
+    except ImportError:
+        return False
+
+    register_after_restore(after_restore, cache)
+    return True
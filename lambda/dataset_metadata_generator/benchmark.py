@@ -0,0 +1,228 @@
+"""Benchmark of the dataset metadata generator against a moto (in memory) S3.
+
+Populates a mocked bucket with synthetic dataset keys, runs `handler`
+end-to-end (a full scan, then an incremental run after new keys were added)
+and reports, for each run, the wall time, the number of S3 API calls by
+operation and the peak memory allocated by Python (`tracemalloc`, includes
+moto's own allocations).
+
+Can be run with:
+python -m lambda.dataset_metadata_generator.benchmark --keys 20000 --sites 10
+From the root directory of this project (needs the `test` extra).
+"""
+
+import argparse
+import datetime
+import json
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+from collections import Counter
+from typing import Dict, List, Tuple
+
+from moto import mock_s3
+
+BUCKET = "benchmark-bucket"
+
+
+def _synthetic_datasets(
+    n_datasets: int, date_pattern: str, rng: random.Random
+) -> List[dict]:
+    """Datasets metadata, half of them spotlight specific"""
+    datasets = []
+    for i in range(n_datasets):
+        if date_pattern == "mixed":
+            time_unit = rng.choice(["day", "month"])
+        else:
+            time_unit = date_pattern
+        spotlight = i % 2 == 1
+        filename = "{spotlightId}_{date}.tif" if spotlight else "{date}.tif"
+        datasets.append(
+            {
+                "id": f"dataset-{i}",
+                "name": f"Dataset {i}",
+                "type": "raster-timeseries",
+                "time_unit": time_unit,
+                "is_periodic": i % 3 == 0,
+                "s3_location": f"dataset-{i}",
+                "source": {
+                    "type": "raster",
+                    "tiles": [
+                        f"{{api_url}}/{{z}}/{{x}}/{{y}}@1x?url=s3://{BUCKET}/dataset-{i}/cog_{filename}"
+                    ],
+                },
+            }
+        )
+    return datasets
+
+
+def _key(dataset: dict, site_id: str, date: datetime.datetime) -> str:
+    """Key of a dataset file, with the dataset's date format"""
+    date_format = "%Y%m" if dataset["time_unit"] == "month" else "%Y_%m_%d"
+    name = date.strftime(date_format)
+    if "{spotlightId}" in dataset["source"]["tiles"][0]:
+        name = f"{site_id}_{name}"
+    return f"{dataset['s3_location']}/cog_{name}.tif"
+
+
+def _synthetic_keys(
+    datasets: List[dict], site_ids: List[str], n_keys: int, rng: random.Random
+) -> List[str]:
+    """Keys spread evenly across datasets, with one date per key. The first
+    site has no keys yet (its keys are added by the incremental run)"""
+    keys = set()
+    site_ids = site_ids[1:] or site_ids
+    start = datetime.datetime(2015, 1, 1)
+    per_dataset = max(1, n_keys // len(datasets))
+    for dataset in datasets:
+        for _ in range(per_dataset):
+            date = start + datetime.timedelta(days=rng.randrange(4000))
+            keys.add(_key(dataset, rng.choice(site_ids), date))
+    return sorted(keys)
+
+
+def _write_json(dirpath: str, objects: List[dict]) -> List[str]:
+    filenames = []
+    for obj in objects:
+        filename = f"{obj['id']}.json"
+        with open(os.path.join(dirpath, filename), "w") as f:
+            json.dump(obj, f)
+        filenames.append(filename)
+    return filenames
+
+
+def _run(main, event: dict, calls: Counter) -> Tuple[Dict, Dict]:
+    """Runs the handler, returns its measurements and its metadata"""
+    calls.clear()
+    tracemalloc.start()
+    start = time.perf_counter()
+    metadata = main.handler(event, {})
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return (
+        {
+            "wall_time_s": round(elapsed, 3),
+            "s3_calls": dict(calls),
+            "s3_calls_total": sum(calls.values()),
+            "peak_memory_mb": round(peak / 1e6, 1),
+        },
+        metadata,
+    )
+
+
+def benchmark(
+    n_keys: int = 20000,
+    n_sites: int = 10,
+    n_datasets: int = 10,
+    date_pattern: str = "mixed",
+    new_keys: int = 100,
+    seed: int = 0,
+) -> Dict:
+    """Runs the generator (full scan then incremental) on a synthetic bucket.
+
+    The metadata of the incremental run is checked against the metadata of a
+    full scan of the same keys.
+    """
+    os.environ.setdefault("AWS_ACCESS_KEY_ID", "benchmark")
+    os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "benchmark")
+    os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+    os.environ["DATA_BUCKET_NAME"] = BUCKET
+    os.environ.setdefault(
+        "DATASET_METADATA_FILENAME", "benchmark-dataset-metadata.json"
+    )
+
+    rng = random.Random(seed)
+    site_ids = [f"site{i}" for i in range(n_sites)]
+    datasets = _synthetic_datasets(n_datasets, date_pattern, rng)
+    keys = _synthetic_keys(datasets, site_ids, n_keys, rng)
+
+    with mock_s3(), tempfile.TemporaryDirectory() as tmpdir:
+        # imported within the mock, see https://github.com/spulec/moto#what-about-those-pesky-imports
+        from .src import main
+
+        client = main.s3.meta.client
+        client.create_bucket(Bucket=BUCKET)
+        for key in keys:
+            client.put_object(Bucket=BUCKET, Key=key, Body=b"")
+
+        datasets_dir = os.path.join(tmpdir, "datasets")
+        sites_dir = os.path.join(tmpdir, "sites")
+        os.makedirs(datasets_dir)
+        os.makedirs(sites_dir)
+        main.DATASETS_JSON_FILEPATH = datasets_dir
+        main.SITES_JSON_FILEPATH = sites_dir
+        main.STAC_API_URL = None
+        main.config["DATASETS"] = {"STATIC": _write_json(datasets_dir, datasets)}
+        _write_json(sites_dir, [{"id": site_id} for site_id in site_ids])
+
+        calls: Counter = Counter()
+        client.meta.events.register(
+            "before-call.s3", lambda model, **kwargs: calls.update([model.name])
+        )
+
+        results = {
+            "params": dict(
+                keys=len(keys),
+                sites=n_sites,
+                datasets=n_datasets,
+                date_pattern=date_pattern,
+                new_keys=new_keys,
+            ),
+        }
+        results["full_scan"], _ = _run(main, {"full_scan": True}, calls)
+
+        # keys for new dates, of every site: most of them sort before the
+        # last key of their dataset folder, and the keys of the first site
+        # are new series (e.g. a new spotlight)
+        for i in range(new_keys):
+            dataset = datasets[i % len(datasets)]
+            date = datetime.datetime(2027, 1, 1) + datetime.timedelta(days=i)
+            key = _key(dataset, site_ids[i % len(site_ids)], date)
+            client.put_object(Bucket=BUCKET, Key=key, Body=b"")
+        results["incremental"], incremental = _run(main, {}, calls)
+
+        _, full_scan = _run(main, {"full_scan": True}, calls)
+        if incremental != full_scan:
+            raise AssertionError("Incremental and full scan metadata differ")
+
+    return results
+
+
+def main():
+    """Runs the benchmark and prints the results as JSON"""
+    parser = argparse.ArgumentParser(description="Benchmark the metadata generator.")
+    parser.add_argument("--keys", type=int, default=20000, help="Number of keys.")
+    parser.add_argument("--sites", type=int, default=10, help="Number of sites.")
+    parser.add_argument("--datasets", type=int, default=10, help="Number of datasets.")
+    parser.add_argument(
+        "--date-pattern", default="mixed", choices=["day", "month", "mixed"]
+    )
+    parser.add_argument(
+        "--new-keys",
+        type=int,
+        default=100,
+        help="Keys added before the incremental run.",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Also write the results to this JSON file.")
+    args = parser.parse_args()
+
+    results = benchmark(
+        n_keys=args.keys,
+        n_sites=args.sites,
+        n_datasets=args.datasets,
+        date_pattern=args.date_pattern,
+        new_keys=args.new_keys,
+        seed=args.seed,
+    )
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+""" Invalidation of the API's cached responses and tiles.
+
+The API suffixes its cache keys with the generation of the namespaces they
+depend on (see `dashboard_api/db/memcache.py`): bumping a generation makes
+the entries of its namespace unreachable. The generator bumps the `/datasets`
+responses namespace and the namespaces of the dataset folders that changed.
+The key and namespace names below must match the API's.
+"""
+import os
+import time
+from typing import TYPE_CHECKING, Dict, Iterable, Optional
+
+if TYPE_CHECKING:
+    from bmemcached import Client
+
+GENERATION_KEY = "generation:{}"
+DATASETS_NAMESPACE = "datasets"
+
+
+def dataset_namespace(folder: str) -> str:
+    """Returns the namespace of the tiles of a dataset folder (keyed by the top
+    level folder of the COG URLs, e.g `xco2-mean`)"""
+    return f"dataset:{folder.strip('/').split('/')[0]}"
+
+
+def get_client() -> Optional["Client"]:
+    """Returns a client of the API's memcached cluster (None if `MEMCACHE_HOST`
+    isn't set or the cache is disabled)"""
+    host = os.environ.get("MEMCACHE_HOST")
+    if not host or os.environ.get("DISABLE_CACHE"):
+        return None
+    from bmemcached import Client
+
+    port = os.environ.get("MEMCACHE_PORT", "11211")
+    return Client(
+        (f"{host}:{port}",),
+        os.environ.get("MEMCACHE_USERNAME"),
+        os.environ.get("MEMCACHE_PASSWORD"),
+    )
+
+
+def bump_generations(client: "Client", namespaces: Iterable[str]) -> Dict[str, int]:
+    """Bumps the generation of each namespace and returns the new generations.
+    Missing generations are seeded with the current epoch time (ms), as the
+    API does, so that they never go back to a value already used."""
+    generations = {}
+    for namespace in namespaces:
+        key = GENERATION_KEY.format(namespace)
+        seed = int(time.time() * 1000)
+        if client.add(key, seed, time=0):
+            generations[namespace] = seed
+        else:
+            generations[namespace] = int(client.incr(key, 1))
+    return generations
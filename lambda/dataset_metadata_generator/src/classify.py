@@ -0,0 +1,149 @@
+""" S3 key classification: dates and spotlight ids found in dataset keys.
+
+Can be benchmarked with:
+python -m lambda.dataset_metadata_generator.src.classify --keys 1000000
+From the root directory of this project.
+"""
+import argparse
+import datetime
+import random
+import re
+import time
+from functools import lru_cache
+from typing import Dict, FrozenSet, Iterable, Optional, Pattern, Tuple
+
+# (date, spotlight ids) found in a S3 key
+KeyInfo = Tuple[Optional[str], FrozenSet[str]]
+
+# matches either dates like: YYYYMM (month) or YYYY_MM_DD (day)
+DATE_PATTERNS = {
+    "day": r"(?P<YEAR>\d{4})[_|.](?P<MONTH>\d{2})[_|.](?P<DAY>\d{2})",
+    "month": r"(?P<YEAR>\d{4})(?P<MONTH>\d{2})",
+}
+
+# Some files happen to have 6 consecutive digits (likely an ID of sorts)
+# that sometimes gets matched as a date. This further restriction of
+# matched timestamps will reduce the number of "false" positives (although
+# ID's between 201011 and 203011 will slip by)
+MIN_DATE = datetime.datetime(2010, 1, 1)
+MAX_DATE = datetime.datetime(2030, 1, 1)
+
+
+class KeyClassifier(object):
+    """
+    Finds the date and the spotlight ids of S3 keys in a single scan.
+
+    Dates and spotlight ids are "words" of the key: they must be surrounded by
+    non alphanumeric characters. Only the first date of a key is considered
+    and spotlight ids are matched case insensitively.
+    """
+
+    def __init__(self, time_unit: Optional[str] = "day", spotlight_ids: Iterable[str] = ()):
+        """Compiles the pattern of a time unit (`day` or `month`) and a set of
+        spotlight ids"""
+        self.spotlight_ids = {i.lower(): i for i in spotlight_ids}
+        self.pattern = self._compile(time_unit, sorted(self.spotlight_ids))
+        # parsed dates by matched text, listings have many keys per date
+        self._dates: Dict[str, Optional[str]] = {}
+
+    @staticmethod
+    def _compile(time_unit: Optional[str], spotlight_ids: Iterable[str]) -> Pattern:
+        date = DATE_PATTERNS["month" if time_unit == "month" else "day"]
+        words = [f"(?P<DATE>{date})"]
+        # longest ids first, so that an id that is the prefix of another one
+        # doesn't prevent the longer one from matching
+        ids = sorted(spotlight_ids, key=len, reverse=True)
+        if ids:
+            words.append("(?P<SPOTLIGHT>{})".format("|".join(map(re.escape, ids))))
+        return re.compile(
+            r"(?<![a-zA-Z0-9])(?:{})(?![a-zA-Z0-9])".format("|".join(words)),
+            re.IGNORECASE,
+        )
+
+    def classify(self, key: str) -> KeyInfo:
+        """Returns the date (formatted as `%Y-%m-%dT%H:%M:%SZ`, or None if the
+        key contains no valid date) and the spotlight ids found in a key"""
+        date = None
+        date_found = False
+        spotlights = set()
+        for match in self.pattern.finditer(key):
+            spotlight = match.group("SPOTLIGHT") if self.spotlight_ids else None
+            if spotlight:
+                spotlights.add(self.spotlight_ids[spotlight.lower()])
+            elif not date_found:
+                date_found = True
+                text = match.group("DATE")
+                if text not in self._dates:
+                    self._dates[text] = _parse_date(match)
+                date = self._dates[text]
+
+        return date, frozenset(spotlights)
+
+    def series(self, key: str) -> Optional[str]:
+        """Returns the part of a key before its first date (or None if the key
+        contains no date): the keys of a series sort by date"""
+        for match in self.pattern.finditer(key):
+            if not self.spotlight_ids or not match.group("SPOTLIGHT"):
+                return key[: match.start()]
+        return None
+
+
+def _parse_date(match) -> Optional[str]:
+    try:
+        date = datetime.datetime(
+            int(match.group("YEAR")),
+            int(match.group("MONTH")),
+            int(match.groupdict().get("DAY") or 1),
+        )
+    except ValueError:
+        # Invalid date value matched - skip date
+        return None
+
+    if not MIN_DATE < date < MAX_DATE:
+        return None
+
+    return date.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+@lru_cache(maxsize=32)
+def get_classifier(
+    time_unit: Optional[str] = "day", spotlight_ids: FrozenSet[str] = frozenset()
+) -> KeyClassifier:
+    """Returns a (cached) classifier for a time unit and a set of spotlight ids"""
+    return KeyClassifier(time_unit, spotlight_ids)
+
+
+def main():
+    """Benchmarks the classification of a synthetic listing"""
+    parser = argparse.ArgumentParser(description="Benchmark S3 key classification.")
+    parser.add_argument("--keys", type=int, default=1000000, help="Number of keys.")
+    parser.add_argument("--time-unit", default="day", choices=["day", "month"])
+    args = parser.parse_args()
+
+    spotlight_ids = ["be", "du", "gh", "la", "ny", "sf", "tk", "EUPorts", "togo"]
+    date_format = "%Y%m" if args.time_unit == "month" else "%Y_%m_%d"
+    start_date = datetime.datetime(2015, 1, 1)
+    rng = random.Random(0)
+    keys = [
+        "bm_500m_daily/VNP46A2_V011_{}_{}_cog.tif".format(
+            rng.choice(spotlight_ids),
+            (start_date + datetime.timedelta(days=rng.randrange(3000))).strftime(
+                date_format
+            ),
+        )
+        for _ in range(args.keys)
+    ]
+
+    classifier = get_classifier(args.time_unit, frozenset(spotlight_ids))
+    start = time.perf_counter()
+    for key in keys:
+        classifier.classify(key)
+    elapsed = time.perf_counter() - start
+    print(
+        f"{args.keys} keys classified in {elapsed:.2f}s "
+        f"({args.keys / elapsed:,.0f} keys/s)"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,24 @@
 """ Dataset metadata generator lambda. """
+import copy
 import datetime
+import gzip
+import hashlib
 import json
 import os
 import re
-import requests
-from typing import Any, Dict, List, Optional, Union
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Set, Tuple
 import yaml
 
 import boto3
+from botocore.exceptions import ClientError
+
+from dashboard_api.db import domains
+
+from . import cache
+from .classify import KeyInfo, get_classifier
+from .stac import fetch_stac_datasets
 
 BASE_PATH = os.path.abspath('.')
 config = yaml.load(open(f"{BASE_PATH}/stack/config.yml", 'r'), Loader=yaml.FullLoader)
@@ -16,25 +27,56 @@ DATASETS_JSON_FILEPATH = os.path.join(BASE_PATH, "dashboard_api/db/static/datase
 SITES_JSON_FILEPATH = os.path.join(BASE_PATH, "dashboard_api/db/static/sites")
 
 DATASET_METADATA_FILENAME = os.environ.get("DATASET_METADATA_FILENAME", config.get('DATASET_METADATA_FILENAME'))
+# Listing state of each dataset folder, used by incremental runs
+DATASET_METADATA_STATE_FILENAME = os.environ.get(
+    "DATASET_METADATA_STATE_FILENAME",
+    re.sub(r"(\.json)?$", "-state.json", DATASET_METADATA_FILENAME or "", count=1),
+)
+# Output format of the metadata: `json` (single file), `sharded` (manifest plus
+# one shard per spotlight, see `_write_sharded_metadata`) or `both`
+DATASET_METADATA_FORMAT = os.environ.get("DATASET_METADATA_FORMAT", "both")
+# Encoding of non periodic domains: `list` (all dates) or `rle` (run-length
+# encoded, needs an API that understands it, see
+# `dashboard_api/db/domains.py`)
+DOMAIN_ENCODING = os.environ.get("DOMAIN_ENCODING", "list")
+# Compression of the shards: `gzip` or `none`
+DATASET_METADATA_COMPRESSION = os.environ.get("DATASET_METADATA_COMPRESSION", "gzip")
 STAC_API_URL = config['STAC_API_URL']
 
 s3 = boto3.resource("s3")
 bucket = s3.Bucket(os.environ.get("DATA_BUCKET_NAME", config.get('BUCKET')))
 
+# Number of dataset folders listed concurrently
+MAX_WORKERS = int(os.environ.get("GENERATOR_MAX_WORKERS", 8))
+# Maximum number of series (see `_update_dataset_index`), and of keys without
+# a date, listed incrementally in a dataset folder: folders with more are fully
+# listed at every run
+MAX_SERIES = int(os.environ.get("GENERATOR_MAX_SERIES", 64))
+
 DT_FORMAT = "%Y-%m-%d"
 MT_FORMAT = "%Y%m"
 
+# number of keys of a dataset folder by (date, spotlight ids)
+KeyIndex = Dict[KeyInfo, int]
+
 # Can test this with python -m lambda.dataset_metadata_generator.src.main | jq .
 # From the root directory of this project.
 def handler(event, context):
     """
+    By default only the keys of a dataset folder sorting outside of the
+    ranges listed by previous runs (from the start to the last key of each
+    series) are listed (see `_update_dataset_index`), and only the
+    STAC items dated from the end of the previous domain of their collection
+    are fetched (see `stac.fetch_stac_datasets`). Backfilled keys and items,
+    and deleted ones, are only picked up by a full scan, which should be run
+    periodically (e.g daily) as a reconciliation job with `{"full_scan": true}`.
+
     Params:
     -------
-    event (dict):
+    event (dict): `{"full_scan": true}` to rescan every dataset folder
     content (dict):
 
-    Both params are standard lambda handler invocation params but not used within this
-    lambda's code.
+    Both params are standard lambda handler invocation params.
 
     Returns:
     -------
@@ -45,50 +87,156 @@ def handler(event, context):
     """
 
     # TODO: defined TypedDicts for these!
+    full_scan = bool((event or {}).get("full_scan"))
+    # the previous state tells which folders changed, even for full scans
+    previous_state = _load_state()
+    state = {"prefixes": {}} if full_scan else copy.deepcopy(previous_state)
+
     listed_datasets = config['DATASETS']['STATIC']
     datasets = _gather_json_data(DATASETS_JSON_FILEPATH, filter=listed_datasets)
     if STAC_API_URL:
-        stac_datasets = _fetch_stac_items()
+        stac_datasets = fetch_stac_datasets(
+            STAC_API_URL, state=state.setdefault("stac", {})
+        )
         datasets.extend(stac_datasets)
     sites = _gather_json_data(SITES_JSON_FILEPATH)
 
-    result = _gather_datasets_metadata(datasets, sites)
+    result = _gather_datasets_metadata(datasets, sites, state=state)
     # TODO: Protect from running _not_ in "production" deployment
+    if DATASET_METADATA_FORMAT in ["json", "both"]:
+        bucket.put_object(
+            Body=json.dumps(result), Key=DATASET_METADATA_FILENAME, ContentType="application/json",
+        )
+    if DATASET_METADATA_FORMAT in ["sharded", "both"]:
+        _write_sharded_metadata(result, compression=DATASET_METADATA_COMPRESSION)
+    # the state is written last: if the metadata can't be written, the next
+    # run lists the same keys again
     bucket.put_object(
-        Body=json.dumps(result), Key=DATASET_METADATA_FILENAME, ContentType="application/json",
+        Body=json.dumps(state), Key=DATASET_METADATA_STATE_FILENAME, ContentType="application/json",
     )
+    _invalidate_cache(_changed_folders(previous_state, state))
     return result
 
-def _fetch_stac_items():
-    """ Fetches collections from a STAC catalogue and generates a metadata object for each collection. """
-    stac_response = requests.get(f"{STAC_API_URL}/collections")
-    if stac_response.status_code == 200:
-        stac_collections = json.loads(stac_response.content).get('collections')
-    stac_datasets = []
-    for collection in stac_collections:
-        # TODO: defined TypedDicts for these!
-        stac_dataset = {
-            "id": collection['id'],
-            "name": collection['title'],
-            "type": "raster",
-            "time_unit": "day",
-            "is_periodic": False,
-            "source": {
-                "type": "raster",
-                # For now, don't list any tiles. We will want to mosaic STAC search results.
-                "tiles": []
-            },
-            "info": collection['description'],
-        }
-        stac_datasets.append(stac_dataset)
 
-    return stac_datasets
+def _write_sharded_metadata(result: dict, compression: Optional[str] = "gzip") -> dict:
+    """
+    Writes the metadata as one shard per top level key (`_all`, `global` and
+    each spotlight) plus a `_datasets` shard holding the dataset definitions
+    without their domain, so that the API only downloads what a request needs.
+
+    Shards are written under `{DATASET_METADATA_FILENAME without .json}/`, and
+    named after the sha256 of their (uncompressed) content, so they never
+    change once written. `manifest.json` lists the shards and is written last:
+    readers never see a manifest pointing to missing shards. Shards of previous
+    runs are left in place (they should be expired by a lifecycle rule).
+
+    Returns:
+    --------
+    (dict): the manifest, `{"version": 1, "shards": {name: {key, sha256, size,
+        compression}}}`
+    """
+    prefix = os.path.splitext(DATASET_METADATA_FILENAME)[0]
+    shards = dict(result)
+    shards["_datasets"] = {
+        dataset_id: {k: v for k, v in dataset.items() if k != "domain"}
+        for dataset_id, dataset in result.get("_all", {}).items()
+    }
+
+    manifest: dict = {
+        "version": 1,
+        "generated_at": datetime.datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ"),
+        "shards": {},
+    }
+    for name, shard in shards.items():
+        body = json.dumps(shard, separators=(",", ":")).encode()
+        sha256 = hashlib.sha256(body).hexdigest()
+        key = f"{prefix}/{name}.{sha256[:16]}.json"
+        put_args = {"ContentType": "application/json"}
+        if compression == "gzip":
+            # mtime=0 so that the same content always gives the same object
+            body = gzip.compress(body, mtime=0)
+            key += ".gz"
+            put_args["ContentEncoding"] = "gzip"
+
+        bucket.put_object(Body=body, Key=key, **put_args)
+        manifest["shards"][name] = {
+            "key": key,
+            "sha256": sha256,
+            "size": len(body),
+            "compression": compression if compression == "gzip" else None,
+        }
 
-def _gather_datasets_metadata(datasets: List[dict], sites: List[dict]):
+    bucket.put_object(
+        Body=json.dumps(manifest), Key=f"{prefix}/manifest.json", ContentType="application/json",
+    )
+    return manifest
+
+
+def _load_state() -> dict:
+    """Loads the state of the previous run (empty if no state was found)"""
+    try:
+        response = bucket.Object(DATASET_METADATA_STATE_FILENAME).get()
+        return json.loads(response["Body"].read())
+    except ClientError as e:
+        if e.response["Error"]["Code"] in ["NoSuchKey", "404"]:
+            print("No previous state found, running a full scan")
+            return {"prefixes": {}}
+        raise e
+
+
+def _changed_folders(previous_state: dict, state: dict) -> Set[str]:
+    """Returns the dataset folders whose keys changed since the previous run:
+    keys were added or deleted (their index changed), or keys were written
+    after the latest key of the previous run (e.g. a COG re-uploaded under
+    the same key, only listed by full scans)"""
+    previous = previous_state.get("prefixes", {})
+    folders = set()
+    for name, prefix_state in state.get("prefixes", {}).items():
+        previous_prefix = previous.get(name) or {}
+        if _index_counts(prefix_state) != _index_counts(previous_prefix) or (
+            prefix_state.get("last_modified") or ""
+        ) > (previous_prefix.get("last_modified") or ""):
+            folders.add(prefix_state["folder"])
+    return folders
+
+
+def _index_counts(prefix_state: dict) -> Dict[Tuple[Optional[str], Tuple[str, ...]], int]:
+    """Returns the (order independent) index of a folder's state"""
+    return {
+        (date, tuple(sorted(ids))): count
+        for date, ids, count in prefix_state.get("index", [])
+    }
+
+
+def _invalidate_cache(folders: Set[str]):
+    """Bumps the `/datasets` cache generation, and the generation of the tiles
+    of the dataset folders that changed, so that API responses and tiles
+    cached before this run are no longer served (dated tiles are cached for a
+    long time). Only runs if the lambda has access to the API's memcached
+    cluster (ie. `MEMCACHE_HOST` is set)."""
+    try:
+        client = cache.get_client()
+        if client:
+            namespaces = [cache.DATASETS_NAMESPACE]
+            namespaces += sorted({cache.dataset_namespace(f) for f in folders})
+            print(cache.bump_generations(client, namespaces))
+    except Exception as e:
+        # A failed invalidation must not fail the metadata generation, entries
+        # will expire after `DATASETS_CACHE_TTL` (and `TILES_CACHE_TTL`).
+        print(f"Unable to invalidate the API cache: {e}")
+
+
+def _gather_datasets_metadata(
+    datasets: List[dict], sites: List[dict], state: Optional[dict] = None
+):
     """Reads through the s3 bucket to generate a file that contains
     the datasets for each given spotlight option (_all, global, tk, ny, sf,
     la, be, du, gh) and their respective domain for each spotlight
 
+    Each dataset folder is listed exactly once (folders are listed
+    concurrently, see `MAX_WORKERS`), the global and per-spotlight domains
+    are all derived from the resulting key index.
+
     Params:
     -------
     datasets (List[dict]): list of dataset metadata objects (contains fields
@@ -96,6 +244,8 @@ def _gather_datasets_metadata(datasets: List[dict], sites: List[dict]):
         to generate the result of each of the possible `/datasets` endpoint
         queries.
     sites (List[dict]): list of site metadata objects
+    state (Optional[dict]): listing state of the previous run, updated in
+        place. Every dataset folder is fully listed if not provided.
 
     Returns:
     --------
@@ -105,17 +255,22 @@ def _gather_datasets_metadata(datasets: List[dict], sites: List[dict]):
 
     metadata: Dict[str, dict] = {}
 
+    spotlight_ids = {site["id"]: _site_spotlight_ids(site["id"]) for site in sites}
+    all_spotlight_ids = {i for ids in spotlight_ids.values() for i in ids}
+
+    indexes = _index_datasets(
+        datasets,
+        state if state is not None else {"prefixes": {}},
+        spotlight_ids=all_spotlight_ids,
+    )
+
     for dataset in datasets:
-        if dataset.get("s3_location"):
-            domain_args = {
-                "dataset_folder": dataset["s3_location"],
-                "is_periodic": dataset.get("is_periodic"),
-                "time_unit": dataset.get("time_unit"),
-                "dataset_bucket": dataset.get("s3_bucket"),
-            }
-            domain = _get_dataset_domain(**domain_args)
-            dataset['domain'] = domain
-        
+        index = indexes.get(_dataset_folder(dataset))
+        if index is not None:
+            dataset['domain'] = _get_dataset_domain(
+                index, is_periodic=dataset.get("is_periodic")
+            )
+
         metadata.setdefault("_all", {}).update({dataset["id"]: dataset})
 
         if _is_global_dataset(dataset):
@@ -125,17 +280,21 @@ def _gather_datasets_metadata(datasets: List[dict], sites: List[dict]):
             )
             continue
 
-        for site in sites:
-
-            domain_args["spotlight_id"] = site["id"]
+        # datasets without an S3 folder (e.g. STAC datasets) have no
+        # per-spotlight domain
+        if index is None:
+            continue
 
-            if site["id"] in ["du", "gh"]:
-                domain_args["spotlight_id"] = ["du", "gh", "EUPorts"]
+        for site in sites:
 
             # skip adding dataset to metadata object if no dates were found for the given
             # spotlight (indicates dataset is not valid for that spotlight)
             try:
-                domain = _get_dataset_domain(**domain_args)
+                domain = _get_dataset_domain(
+                    index,
+                    is_periodic=dataset.get("is_periodic"),
+                    spotlight_id=spotlight_ids[site["id"]],
+                )
             except NoKeysFoundForSpotlight:
                 continue
 
@@ -145,6 +304,50 @@ def _gather_datasets_metadata(datasets: List[dict], sites: List[dict]):
     return metadata
 
 
+def _dataset_folder(dataset: dict) -> Optional[Tuple[Optional[str], str, Optional[str]]]:
+    """Returns the (bucket, folder, time unit) to list for a dataset"""
+    if not dataset.get("s3_location"):
+        return None
+    return (dataset.get("s3_bucket"), dataset["s3_location"], dataset.get("time_unit"))
+
+
+def _index_datasets(
+    datasets: List[dict], state: dict, spotlight_ids: Set[str]
+) -> Dict[Tuple[Optional[str], str, Optional[str]], KeyIndex]:
+    """Lists the folders of all the datasets concurrently (each folder is
+    listed once, even if it's used by several datasets) and returns their
+    index by (bucket, folder, time unit)"""
+    folders = sorted(
+        {_dataset_folder(d) for d in datasets if d.get("s3_location")},
+        key=lambda folder: tuple(v or "" for v in folder),
+    )
+    state.setdefault("prefixes", {})
+
+    def _index(folder):
+        dataset_bucket, dataset_folder, time_unit = folder
+        return _update_dataset_index(
+            state,
+            dataset_folder=dataset_folder,
+            time_unit=time_unit,
+            dataset_bucket=dataset_bucket,
+            spotlight_ids=spotlight_ids,
+        )
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        indexes = dict(zip(folders, executor.map(_index, folders)))
+    print(f"Listed {len(folders)} dataset folders in {time.perf_counter() - start:.2f}s")
+    return indexes
+
+
+def _site_spotlight_ids(site_id: str) -> List[str]:
+    """Returns the spotlight ids to match in S3 keys for a given site (EU ports
+    datasets are stored under `EUPorts` as well as under `du` and `gh`)"""
+    if site_id in ["du", "gh"]:
+        return ["du", "gh", "EUPorts"]
+    return [site_id]
+
+
 def _gather_json_data(dirpath: str, filter: List[str] = None) -> List[dict]:
     """Gathers all JSON files from within a diven directory"""
 
@@ -172,121 +375,254 @@ def _is_global_dataset(dataset: dict) -> bool:
 
 
 def _gather_s3_keys(
-    spotlight_id: Optional[Union[str, List]] = None,
     prefix: Optional[str] = "",
-    dataset_bucket: Optional[str] = None
-) -> List[str]:
+    dataset_bucket: Optional[str] = None,
+    start_after: Optional[str] = None,
+    end_before: Optional[str] = None,
+) -> Dict[str, str]:
     """
-    Returns a set of S3 keys. If no args are provided, the keys will represent
-    the entire S3 bucket.
+    Returns the S3 keys under a prefix, and their last modification time
+    (sorted by key). If no args are provided, the keys will represent the
+    entire S3 bucket.
+
     Params:
     -------
-    spotlight_id (Optional[str]):
-        Id of a spotlight to filter keys by
     prefix (Optional[str]):
         S3 Prefix under which to gather keys, used to specifcy a specific
         dataset folder to search within.
+    dataset_bucket (Optional[str]):
+        Bucket to list (defaults to the data bucket)
+    start_after (Optional[str]):
+        Only list the keys that sort after this key
+    end_before (Optional[str]):
+        Stop listing at the first key that doesn't sort before this key
 
     Returns:
     -------
-    set(str)
+    Dict[str, str]: key -> last modification time (`%Y-%m-%dT%H:%M:%SZ`)
 
     """
-    s3_dataset_bucket = bucket if dataset_bucket == None else s3.Bucket(dataset_bucket)
-
-    keys = [x.key for x in s3_dataset_bucket.objects.filter(Prefix=prefix)]
-
-    if not spotlight_id:
-        return keys
+    list_args = {"Bucket": dataset_bucket or bucket.name, "Prefix": prefix}
+    if start_after:
+        list_args["Marker"] = start_after
+
+    # boto3 resources are not thread safe but clients are, folders are listed
+    # concurrently with the client shared by the resources.
+    paginator = s3.meta.client.get_paginator("list_objects")
+    objects = {}
+    for page in paginator.paginate(**list_args):
+        for obj in page.get("Contents", []):
+            if end_before is not None and obj["Key"] >= end_before:
+                return objects
+            objects[obj["Key"]] = obj["LastModified"].strftime("%Y-%m-%dT%H:%M:%SZ")
+    return objects
+
+
+def _index_dataset_keys(
+    keys: List[str],
+    time_unit: Optional[str] = "day",
+    spotlight_ids: Optional[Set[str]] = None,
+) -> KeyIndex:
+    """
+    Returns an index of the keys of a dataset folder.
 
-    if isinstance(spotlight_id, list):
-        spotlight_id = "|".join([s for s in spotlight_id])
+    Params:
+    ------
+    keys (List[str]): keys of the dataset folder
+    time_unit (Optional[str] - one of ["day", "month"]):
+        Wether the {date} object in the S3 filenames should be matched
+        to YYYY_MM_DD (day) or YYYYMM (month)
+    spotlight_ids (Optional[Set[str]]): spotlight ids to look for in the keys
 
-    pattern = re.compile(rf"""[^a-zA-Z0-9]({spotlight_id})[^a-zA-Z0-9]""")
-    return list({key for key in keys if pattern.search(key, re.IGNORECASE,)})
+    Return:
+    ------
+    KeyIndex: (date or None, spotlight ids found in the key) -> number of keys
+    """
+    classifier = get_classifier(time_unit, frozenset(spotlight_ids or ()))
+    index: KeyIndex = {}
+    for key in keys:
+        info = classifier.classify(key)
+        index[info] = index.get(info, 0) + 1
+    return index
 
 
-def _get_dataset_domain(
+def _update_dataset_index(
+    state: dict,
     dataset_folder: str,
-    is_periodic: bool,
-    dataset_bucket: Optional[str] = None,
-    spotlight_id: Optional[Union[str, List]] = None,
     time_unit: Optional[str] = "day",
-):
+    dataset_bucket: Optional[str] = None,
+    spotlight_ids: Optional[Set[str]] = None,
+) -> KeyIndex:
     """
-    Returns a domain for a given dataset as identified by a folder. If a
-    time_unit is passed as a function parameter, the function will assume
-    that the domain is periodic and with only return the min/max dates,
-    otherwise ALL dates available for that dataset/spotlight will be returned.
+    Lists the keys added to a dataset folder since the previous run and
+    merges them into the folder's index.
+
+    Keys are grouped in series by their part before the date (e.g.
+    `bm_500m_daily/VNP46A2_V011_tk_`): the keys of a series sort by date,
+    while the keys of the folder don't (the spotlight id comes first). The
+    keys from the prefix to the last key of each series were listed by the
+    previous runs: only the gaps between these ranges are listed (see
+    `_listing_gaps`), which finds the new keys of each series and the keys of
+    new series (e.g. a new spotlight), wherever they sort in the folder.
+    Keys without a date are recorded, so that they are not counted again.
+
+    Backfilled keys (sorting before the last key of their series), keys of a
+    new series sorting within the range of another series, and deleted keys
+    are only found by a full scan (see `handler`).
+
+    The state of each folder (last key of each series, keys without a date,
+    latest modification time of its keys, time of the run and index) is
+    updated in place. Folders are fully listed if they have no state yet, if
+    the spotlight ids changed since the state was built, or, at every run, if
+    they have more than `MAX_SERIES` series or keys without a date.
 
     Params:
     ------
+    state (dict): listing state of the previous run
     dataset_folder (str): dataset folder to search within
     time_unit (Optional[str]): time_unit from the dataset's metadata json file
-    spotlight_id (Optional[str]): a dictionary containing the
-        `spotlight_id` of a spotlight to restrict the
-        domain search to.
-    time_unit (Optional[str] - one of ["day", "month"]):
-        Wether the {date} object in the S3 filenames should be matched
-        to YYYY_MM_DD (day) or YYYYMM (month)
+    dataset_bucket (Optional[str]): bucket of the dataset
+    spotlight_ids (Optional[Set[str]]): spotlight ids to look for in the keys
 
     Return:
     ------
-    List[datetime]
+    KeyIndex
     """
-    s3_keys_args: Dict[str, Any] = {"prefix": dataset_folder}
-    if spotlight_id:
-        s3_keys_args["spotlight_id"] = spotlight_id
-    if dataset_bucket:
-        s3_keys_args['dataset_bucket'] = dataset_bucket
-
-    keys = _gather_s3_keys(**s3_keys_args)
-    if not keys:
-        raise NoKeysFoundForSpotlight
+    spotlight_ids = spotlight_ids or set()
+    # a folder used with several time units has one state per time unit
+    name = f"{dataset_bucket or bucket.name}/{dataset_folder}#{time_unit}"
+    prefix_state = state.setdefault("prefixes", {}).get(name)
+    if prefix_state and (
+        prefix_state.get("series") is None
+        or prefix_state.get("undated") is None
+        or set(prefix_state["spotlight_ids"]) != spotlight_ids
+    ):
+        prefix_state = None
+
+    classifier = get_classifier(time_unit, frozenset(spotlight_ids))
+    index: KeyIndex = {}
+    last_key = None
+    last_modified = None
+    series: Dict[str, str] = {}
+    undated: Set[str] = set()
+    start = time.perf_counter()
+    if prefix_state:
+        index = {
+            (date, frozenset(ids)): count
+            for date, ids, count in prefix_state["index"]
+        }
+        last_key = prefix_state["last_key"]
+        last_modified = prefix_state.get("last_modified")
+        series = prefix_state["series"]
+        undated = set(prefix_state["undated"])
+        objects: Dict[str, str] = {}
+        for start_after, end_before in _listing_gaps(series):
+            objects.update(
+                _gather_s3_keys(
+                    prefix=dataset_folder,
+                    dataset_bucket=dataset_bucket,
+                    start_after=start_after,
+                    end_before=end_before,
+                )
+            )
+        objects = {k: v for k, v in objects.items() if k not in undated}
+    else:
+        objects = _gather_s3_keys(prefix=dataset_folder, dataset_bucket=dataset_bucket)
+    keys = list(objects)
 
-    dates = []
+    for info, count in _index_dataset_keys(keys, time_unit, spotlight_ids).items():
+        index[info] = index.get(info, 0) + count
 
     for key in keys:
+        prefix = classifier.series(key)
+        if prefix is None:
+            undated.add(key)
+        elif key > series.get(prefix, ""):
+            series[prefix] = key
+
+    print(
+        f"{name}: {len(keys)} new keys (in {len(series)} series) "
+        f"in {time.perf_counter() - start:.2f}s"
+    )
+    incremental = len(series) <= MAX_SERIES and len(undated) <= MAX_SERIES
+    state["prefixes"][name] = {
+        "folder": dataset_folder,
+        "last_key": max([*keys, last_key or ""]) or None,
+        "last_modified": max([*objects.values(), last_modified or ""]) or None,
+        "series": series if incremental else None,
+        "undated": sorted(undated) if incremental else None,
+        "last_run": datetime.datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ"),
+        "time_unit": time_unit,
+        "spotlight_ids": sorted(spotlight_ids),
+        "index": [[date, sorted(ids), count] for (date, ids), count in index.items()],
+    }
+    return index
+
+
+def _listing_gaps(series: Dict[str, str]) -> List[Tuple[Optional[str], Optional[str]]]:
+    """
+    Returns the ranges of keys of a folder to list, given the prefix and the
+    last key of its series: the gaps between the (merged) ranges of keys from
+    the prefix to the last key of each series.
 
-        # matches either dates like: YYYYMM or YYYY_MM_DD
-        pattern = re.compile(
-            r"[^a-zA-Z0-9]((?P<YEAR>\d{4})[_|.](?P<MONTH>\d{2})[_|.](?P<DAY>\d{2}))[^a-zA-Z0-9]"
-        )
-        if time_unit == "month":
-            pattern = re.compile(
-                r"[^a-zA-Z0-9](?P<YEAR>(\d{4}))(?P<MONTH>(\d{2}))[^a-zA-Z0-9]"
-            )
+    Return:
+    ------
+    List[Tuple[Optional[str], Optional[str]]]: (start_after, end_before) of
+        each gap (None: from the first key / to the last key of the folder)
+    """
+    ranges: List[List[str]] = []
+    for prefix, series_last_key in sorted(series.items()):
+        if ranges and prefix <= ranges[-1][1]:
+            ranges[-1][1] = max(ranges[-1][1], series_last_key)
+        else:
+            ranges.append([prefix, series_last_key])
 
-        result = pattern.search(key, re.IGNORECASE,)
+    starts: List[Optional[str]] = [None, *(last for _, last in ranges)]
+    ends: List[Optional[str]] = [*(first for first, _ in ranges), None]
+    return list(zip(starts, ends))
 
-        if not result:
-            continue
 
-        date = None
-        try:
-            date = datetime.datetime(
-                int(result.group("YEAR")),
-                int(result.group("MONTH")),
-                int(result.groupdict().get("DAY", 1)),
-            )
+def _get_dataset_domain(
+    index: KeyIndex,
+    is_periodic: bool,
+    spotlight_id: Optional[List[str]] = None,
+    encoding: Optional[str] = None,
+):
+    """
+    Returns a domain for a given dataset from the index of its keys. If the
+    dataset is periodic the function will only return the min/max dates,
+    otherwise ALL dates available for that dataset/spotlight will be returned.
 
-        except ValueError:
-            # Invalid date value matched - skip date
-            continue
+    Params:
+    ------
+    index (KeyIndex): dataset keys index (see `_index_dataset_keys`)
+    is_periodic (bool): is_periodic from the dataset's metadata json file
+    spotlight_id (Optional[List[str]]): spotlight ids to restrict the
+        domain search to.
+    encoding (Optional[str] - one of ["list", "rle"]): encoding of non periodic
+        domains (defaults to `DOMAIN_ENCODING`)
 
-        # Some files happen to have 6 consecutive digits (likely an ID of sorts)
-        # that sometimes gets matched as a date. This further restriction of
-        # matched timestamps will reduce the number of "false" positives (although
-        # ID's between 201011 and 203011 will slip by)
-        if not datetime.datetime(2010, 1, 1) < date < datetime.datetime(2030, 1, 1):
-            continue
+    Return:
+    ------
+    List[datetime] (or the run-length encoded domain, as a dict)
+    """
+    infos = list(index)
+    if spotlight_id:
+        infos = [info for info in infos if info[1].intersection(spotlight_id)]
 
-        dates.append(date.strftime("%Y-%m-%dT%H:%M:%SZ"))
+    if not infos:
+        raise NoKeysFoundForSpotlight
+
+    dates = [date for date, _ in infos if date]
 
     if is_periodic and len(dates):
         return [min(dates), max(dates)]
 
-    return sorted(set(dates))
+    domain = sorted(set(dates))
+    if (encoding or DOMAIN_ENCODING) == "rle":
+        return domains.encode(domain) or domain
+
+    return domain
 
 
 class NoKeysFoundForSpotlight(Exception):
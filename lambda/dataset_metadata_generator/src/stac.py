@@ -0,0 +1,167 @@
+""" STAC ingestion: datasets (and their domain) from the collections of a STAC API.
+
+STAC datasets have no S3 folder and no tiles (yet): they are global datasets
+(listed in the `_all` and `global` metadata), without per-spotlight domains.
+"""
+import datetime
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterator, List, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Number of collections whose items are fetched concurrently
+MAX_WORKERS = int(os.environ.get("STAC_MAX_WORKERS", 16))
+# Page size of the `/collections/{id}/items` requests
+ITEMS_LIMIT = int(os.environ.get("STAC_ITEMS_LIMIT", 500))
+# Item fields requested (fields extension, ignored by APIs that don't support it)
+ITEMS_FIELDS = "properties.datetime,properties.start_datetime"
+TIMEOUT = 30
+
+
+def get_session(pool_size: int = MAX_WORKERS) -> requests.Session:
+    """Returns a session with a connection pool sized for `pool_size` threads
+    (and retries on throttling or server errors)"""
+    session = requests.Session()
+    retries = Retry(
+        total=3, backoff_factor=0.5, status_forcelist=[429, 500, 502, 503, 504]
+    )
+    adapter = HTTPAdapter(
+        pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retries
+    )
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def _paginate(
+    session: requests.Session, url: str, key: str, params: Optional[Dict] = None
+) -> Iterator[dict]:
+    """Yields the `key` objects (collections, features) of every page,
+    following the `next` links"""
+    while url:
+        response = session.get(url, params=params, timeout=TIMEOUT)
+        response.raise_for_status()
+        body = response.json()
+        yield from body.get(key, [])
+
+        # `next` links contain the query parameters of the next page
+        url, params = None, None
+        for link in body.get("links", []):
+            if link.get("rel") == "next" and link.get("method", "GET") == "GET":
+                url = link["href"]
+                break
+
+
+def _format_date(value: Optional[str]) -> Optional[str]:
+    """Returns a RFC 3339 datetime at the day level (domains are lists of days)"""
+    if not value:
+        return None
+    try:
+        date = datetime.datetime.strptime(value[:10], "%Y-%m-%d")
+    except ValueError:
+        return None
+    return date.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def _item_date(item: dict) -> Optional[str]:
+    """Returns the date of an item (its `datetime`, or `start_datetime` for
+    items with a date range)"""
+    properties = item.get("properties", {})
+    return _format_date(properties.get("datetime") or properties.get("start_datetime"))
+
+
+def _extent_domain(collection: dict) -> List[str]:
+    """Returns the [start, end] of the temporal extent of a collection"""
+    try:
+        interval = collection["extent"]["temporal"]["interval"][0]
+    except (KeyError, IndexError, TypeError):
+        return []
+    dates = [_format_date(value) for value in interval]
+    return [date for date in dates if date]
+
+
+def fetch_collection_domain(
+    session: requests.Session,
+    api_url: str,
+    collection: dict,
+    previous_domain: Optional[List[str]] = None,
+) -> List[str]:
+    """Returns all the dates of the items of a collection. Only the items
+    dated from the last date of `previous_domain` are fetched if provided.
+    Falls back to the previous domain, or to the temporal extent of the
+    collection, if its items can't be fetched."""
+    start = time.perf_counter()
+    url = f"{api_url}/collections/{collection['id']}/items"
+    params = {"limit": ITEMS_LIMIT, "fields": ITEMS_FIELDS}
+    if previous_domain:
+        params["datetime"] = f"{previous_domain[-1]}/.."
+    try:
+        dates = {
+            _item_date(item) for item in _paginate(session, url, "features", params)
+        }
+    except requests.RequestException as e:
+        print(f"Unable to fetch items of {collection['id']}: {e}")
+        return previous_domain or _extent_domain(collection)
+
+    domain = sorted(date for date in dates.union(previous_domain or []) if date)
+    print(
+        f"{collection['id']}: {len(domain)} dates "
+        f"in {time.perf_counter() - start:.2f}s"
+    )
+    return domain
+
+
+def fetch_stac_datasets(
+    api_url: str, max_workers: int = MAX_WORKERS, state: Optional[dict] = None
+) -> List[dict]:
+    """
+    Fetches the collections of a STAC API and generates a metadata object, with
+    its domain, for each collection.
+
+    Collections are listed following the `next` links, then the items of
+    `max_workers` collections are fetched concurrently. Datasets are returned
+    in the order of the collections.
+
+    `state` (collection id -> domain of the previous run) is updated in place:
+    only the items dated from the end of the previous domain of a collection
+    are fetched. Deleted items are only dropped by a full fetch (empty state).
+    """
+    api_url = api_url.rstrip("/")
+    state = state if state is not None else {}
+    session = get_session(max_workers)
+    collections = list(_paginate(session, f"{api_url}/collections", "collections"))
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        domains = executor.map(
+            lambda collection: fetch_collection_domain(
+                session, api_url, collection, state.get(collection["id"])
+            ),
+            collections,
+        )
+
+        stac_datasets = []
+        for collection, domain in zip(collections, domains):
+            state[collection["id"]] = domain
+            # TODO: defined TypedDicts for these!
+            stac_datasets.append(
+                {
+                    "id": collection["id"],
+                    "name": collection.get("title") or collection["id"],
+                    "type": "raster",
+                    "time_unit": "day",
+                    "is_periodic": False,
+                    "domain": domain,
+                    "source": {
+                        "type": "raster",
+                        # For now, don't list any tiles. We will want to mosaic STAC search results.
+                        "tiles": [],
+                    },
+                    "info": collection.get("description", ""),
+                }
+            )
+
+    return stac_datasets
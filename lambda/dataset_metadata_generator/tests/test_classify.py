@@ -0,0 +1,81 @@
+"""Test class for S3 key classification"""
+
+
+def test_classify_day():
+    """Dates and spotlight ids are found in a single scan"""
+    from ..src.classify import KeyClassifier
+
+    classifier = KeyClassifier("day", ["tk", "du", "EUPorts"])
+
+    assert classifier.classify("bm_500m_daily/VNP46A2_V011_tk_2020_03_01_cog.tif") == (
+        "2020-03-01T00:00:00Z",
+        frozenset({"tk"}),
+    )
+    # spotlight ids are case insensitive, and must be surrounded by separators
+    assert classifier.classify("no2/EUPORTS-du-2020.03.01.tif")[1] == frozenset(
+        {"EUPorts", "du"}
+    )
+    assert classifier.classify("no2/tkx_2020_03_01.tif") == (
+        "2020-03-01T00:00:00Z",
+        frozenset(),
+    )
+    # invalid or out of range dates
+    assert classifier.classify("no2/tk_2020_13_01.tif")[0] is None
+    assert classifier.classify("no2/tk_2009_01_01.tif")[0] is None
+    # dates at the start of the key
+    assert classifier.classify("2020_03_01.tif")[0] == "2020-03-01T00:00:00Z"
+
+
+def test_series():
+    """The series of a key is its part before the date"""
+    from ..src.classify import KeyClassifier
+
+    classifier = KeyClassifier("day", ["tk", "du"])
+
+    assert (
+        classifier.series("bm_500m_daily/VNP46A2_V011_tk_2020_03_01_cog.tif")
+        == "bm_500m_daily/VNP46A2_V011_tk_"
+    )
+    assert classifier.series("no2/2020_03_01_du.tif") == "no2/"
+    assert classifier.series("no2/tk.tif") is None
+
+
+def test_classify_month():
+    """Monthly keys are matched to YYYYMM"""
+    from ..src.classify import get_classifier
+
+    classifier = get_classifier("month", frozenset({"ny"}))
+    assert classifier is get_classifier("month", frozenset({"ny"}))
+
+    assert classifier.classify("bmhd_30m_monthly/BMHD_VNP46A2_ny_202001_cog.tif") == (
+        "2020-01-01T00:00:00Z",
+        frozenset({"ny"}),
+    )
+    assert classifier.classify("bmhd_30m_monthly/BMHD_ny_2020_01_01.tif")[0] is None
+    assert classifier.classify("id_123456.tif")[0] is None
+
+
+def test_encode_domain():
+    """Non periodic domains can be run-length encoded"""
+    from ..src.main import _get_dataset_domain, _index_dataset_keys
+
+    keys = [f"no2/no2_2020_01_{day:02d}.tif" for day in range(1, 32) if day != 10]
+    index = _index_dataset_keys(keys, "day")
+
+    assert len(_get_dataset_domain(index, is_periodic=False)) == 30
+    assert _get_dataset_domain(index, is_periodic=False, encoding="rle") == {
+        "encoding": "rle",
+        "runs": [
+            {
+                "start": "2020-01-01T00:00:00Z",
+                "end": "2020-01-31T00:00:00Z",
+                "step": 1,
+                "unit": "day",
+                "exceptions": ["2020-01-10T00:00:00Z"],
+            }
+        ],
+    }
+    assert _get_dataset_domain(index, is_periodic=True, encoding="rle") == [
+        "2020-01-01T00:00:00Z",
+        "2020-01-31T00:00:00Z",
+    ]
@@ -115,3 +115,263 @@ def test_euports_datasets(gather_datasets_metadata, datasets, sites):
         "water-chlorophyll",
         "detections-plane",
     }
+
+
+@mock_s3
+def test_single_listing(gather_datasets_metadata, datasets, sites, monkeypatch):
+    """Each dataset folder is listed once, spotlight domains come from the index"""
+    from ..src import main
+
+    bucket = boto3.resource("s3").Bucket("covid-eo-data")
+    bucket.create()
+    for key in [
+        "xco2-mean/xco2_16day_mean.2019_01_01.tif",
+        "xco2-mean/xco2_16day_mean.2019_06_01.tif",
+        "bmhd_30m_monthly/BMHD_VNP46A2_ny_202001_cog.tif",
+        "bmhd_30m_monthly/BMHD_VNP46A2_EUPorts_202003_cog.tif",
+        "bm_500m_daily/VNP46A2_V011_tk_2020_03_01_cog.tif",
+        "bm_500m_daily/VNP46A2_V011_tk_2020_03_02_cog.tif",
+        "bm_500m_daily/VNP46A2_V011_tkx_2020_03_03_cog.tif",
+        "oc3_chla_anomaly/anomaly-chl-du-2020_01_01.tif",
+    ]:
+        bucket.put_object(Body=b"test", Key=key)
+
+    listed = []
+    gather_s3_keys = main._gather_s3_keys
+
+    def _gather_s3_keys(prefix="", **kwargs):
+        listed.append(prefix)
+        return gather_s3_keys(prefix=prefix, **kwargs)
+
+    monkeypatch.setattr(main, "_gather_s3_keys", _gather_s3_keys)
+
+    content = gather_datasets_metadata(datasets, sites)
+
+    assert sorted(listed) == sorted({d["s3_location"] for d in datasets})
+    assert content["global"]["co2"]["domain"] == [
+        "2019-01-01T00:00:00Z",
+        "2019-06-01T00:00:00Z",
+    ]
+    assert content["tk"]["nightlights-viirs"]["domain"] == [
+        "2020-03-01T00:00:00Z",
+        "2020-03-02T00:00:00Z",
+    ]
+    assert content["ny"]["nightlights-hd"]["domain"] == [
+        "2020-01-01T00:00:00Z",
+        "2020-01-01T00:00:00Z",
+    ]
+    assert content["du"]["nightlights-hd"]["domain"] == [
+        "2020-03-01T00:00:00Z",
+        "2020-03-01T00:00:00Z",
+    ]
+    assert content["du"]["water-chlorophyll"]["domain"] == ["2020-01-01T00:00:00Z"]
+    assert "water-chlorophyll" not in content["tk"]
+
+
+@mock_s3
+def test_incremental_listing(gather_datasets_metadata, datasets, sites):
+    """Keys listed by a previous run are not listed again, new keys are listed
+    even if they sort before the last key of their folder"""
+    bucket = boto3.resource("s3").Bucket("covid-eo-data")
+    bucket.create()
+    keys = [
+        "xco2-mean/xco2_16day_mean.2019_01_01.tif",
+        "bmhd_30m_monthly/BMHD_VNP46A2_ny_202001_cog.tif",
+        "bm_500m_daily/VNP46A2_V011_du_2020_03_01_cog.tif",
+        "bm_500m_daily/VNP46A2_V011_tk_2020_03_01_cog.tif",
+        "oc3_chla_anomaly/anomaly-chl-du-2020_01_01.tif",
+    ]
+    for key in keys:
+        bucket.put_object(Body=b"test", Key=key)
+
+    state = {}
+    gather_datasets_metadata(datasets, sites, state=state)
+    prefix_state = state["prefixes"]["covid-eo-data/bm_500m_daily#day"]
+    assert prefix_state["last_key"] == keys[3]
+    assert prefix_state["series"] == {
+        "bm_500m_daily/VNP46A2_V011_du_": keys[2],
+        "bm_500m_daily/VNP46A2_V011_tk_": keys[3],
+    }
+
+    bucket.put_object(Body=b"test", Key="xco2-mean/xco2_16day_mean.2019_06_01.tif")
+    bucket.put_object(Body=b"test", Key="bm_500m_daily/VNP46A2_V011_tk_2020_03_02_cog.tif")
+    # sorts before the last key of the folder
+    bucket.put_object(Body=b"test", Key="bm_500m_daily/VNP46A2_V011_du_2020_03_02_cog.tif")
+    # the state is the only record of keys listed by previous runs
+    bucket.Object(keys[0]).delete()
+
+    content = gather_datasets_metadata(datasets, sites, state=state)
+    assert content["global"]["co2"]["domain"] == [
+        "2019-01-01T00:00:00Z",
+        "2019-06-01T00:00:00Z",
+    ]
+    assert content["tk"]["nightlights-viirs"]["domain"] == [
+        "2020-03-01T00:00:00Z",
+        "2020-03-02T00:00:00Z",
+    ]
+    assert content["du"]["nightlights-viirs"]["domain"] == [
+        "2020-03-01T00:00:00Z",
+        "2020-03-02T00:00:00Z",
+    ]
+
+    # full scan
+    content = gather_datasets_metadata(datasets, sites)
+    assert content["global"]["co2"]["domain"] == [
+        "2019-06-01T00:00:00Z",
+        "2019-06-01T00:00:00Z",
+    ]
+
+
+@mock_s3
+def test_incremental_new_series(gather_datasets_metadata, datasets, sites):
+    """Keys of new series (e.g. a new spotlight) are listed even if they sort
+    before the last key of their folder, keys without a date are counted once"""
+    from ..src.main import _listing_gaps
+
+    bucket = boto3.resource("s3").Bucket("covid-eo-data")
+    bucket.create()
+    for key in [
+        "xco2-mean/xco2_16day_mean.2019_01_01.tif",
+        "bmhd_30m_monthly/BMHD_VNP46A2_ny_202001_cog.tif",
+        "bm_500m_daily/VNP46A2_V011_du_2020_03_01_cog.tif",
+        "bm_500m_daily/VNP46A2_V011_tk_2020_03_01_cog.tif",
+        "bm_500m_daily/README.md",
+        "oc3_chla_anomaly/anomaly-chl-du-2020_01_01.tif",
+    ]:
+        bucket.put_object(Body=b"test", Key=key)
+
+    state = {}
+    content = gather_datasets_metadata(datasets, sites, state=state)
+    assert "nightlights-viirs" not in content["ny"]
+    prefix_state = state["prefixes"]["covid-eo-data/bm_500m_daily#day"]
+    assert prefix_state["undated"] == ["bm_500m_daily/README.md"]
+    assert _listing_gaps(prefix_state["series"]) == [
+        (None, "bm_500m_daily/VNP46A2_V011_du_"),
+        (
+            "bm_500m_daily/VNP46A2_V011_du_2020_03_01_cog.tif",
+            "bm_500m_daily/VNP46A2_V011_tk_",
+        ),
+        ("bm_500m_daily/VNP46A2_V011_tk_2020_03_01_cog.tif", None),
+    ]
+    index = prefix_state["index"]
+
+    content = gather_datasets_metadata(datasets, sites, state=state)
+    assert state["prefixes"]["covid-eo-data/bm_500m_daily#day"]["index"] == index
+
+    # a new spotlight, between the series of the folder
+    bucket.put_object(Body=b"test", Key="bm_500m_daily/VNP46A2_V011_ny_2020_03_02_cog.tif")
+    # before the first series of the folder
+    bucket.put_object(
+        Body=b"test", Key="bm_500m_daily/VNP46A2_V011_EUPorts_2020_03_02_cog.tif"
+    )
+    content = gather_datasets_metadata(datasets, sites, state=state)
+    assert content["ny"]["nightlights-viirs"]["domain"] == [
+        "2020-03-02T00:00:00Z",
+        "2020-03-02T00:00:00Z",
+    ]
+    assert content["du"]["nightlights-viirs"]["domain"] == [
+        "2020-03-01T00:00:00Z",
+        "2020-03-02T00:00:00Z",
+    ]
+    assert content == gather_datasets_metadata(datasets, sites)
+
+
+@mock_s3
+def test_changed_folders(gather_datasets_metadata, datasets, sites, monkeypatch):
+    """The folders whose keys changed since the previous run are invalidated"""
+    import copy
+
+    from ..src import cache, main
+
+    bucket = boto3.resource("s3").Bucket("covid-eo-data")
+    bucket.create()
+    for key in [
+        "xco2-mean/xco2_16day_mean.2019_01_01.tif",
+        "bmhd_30m_monthly/BMHD_VNP46A2_ny_202001_cog.tif",
+        "bm_500m_daily/VNP46A2_V011_tk_2020_03_01_cog.tif",
+        "oc3_chla_anomaly/anomaly-chl-du-2020_01_01.tif",
+    ]:
+        bucket.put_object(Body=b"test", Key=key)
+
+    previous = {}
+    gather_datasets_metadata(datasets, sites, state=previous)
+    assert main._changed_folders({}, previous) == {
+        d["s3_location"] for d in datasets
+    }
+
+    state = copy.deepcopy(previous)
+    gather_datasets_metadata(datasets, sites, state=state)
+    assert main._changed_folders(previous, state) == set()
+
+    bucket.put_object(Body=b"test", Key="bm_500m_daily/VNP46A2_V011_tk_2020_03_02_cog.tif")
+    state = copy.deepcopy(previous)
+    gather_datasets_metadata(datasets, sites, state=state)
+    assert main._changed_folders(previous, state) == {"bm_500m_daily"}
+
+    # full scan: keys written after the previous run (e.g. re-uploaded COGs)
+    previous = state
+    previous["prefixes"]["covid-eo-data/xco2-mean#day"]["last_modified"] = "2000-01-01T00:00:00Z"
+    state = {}
+    gather_datasets_metadata(datasets, sites, state=state)
+    assert main._changed_folders(previous, state) == {"xco2-mean"}
+
+    generations = {}
+
+    class Client:
+        def add(self, key, value, time=0):
+            if key in generations:
+                return False
+            generations[key] = value
+            return True
+
+        def incr(self, key, value):
+            generations[key] += value
+            return generations[key]
+
+    monkeypatch.setattr(cache, "get_client", Client)
+    main._invalidate_cache({"xco2-mean"})
+    first = dict(generations)
+    main._invalidate_cache({"xco2-mean", "bm_500m_daily"})
+    assert set(first) == {"generation:datasets", "generation:dataset:xco2-mean"}
+    assert generations == {
+        "generation:datasets": first["generation:datasets"] + 1,
+        "generation:dataset:xco2-mean": first["generation:dataset:xco2-mean"] + 1,
+        "generation:dataset:bm_500m_daily": generations["generation:dataset:bm_500m_daily"],
+    }
+
+
+@mock_s3
+def test_sharded_metadata():
+    """Metadata is written as a manifest plus one shard per spotlight"""
+    import gzip
+    import hashlib
+    import json
+
+    from ..src.main import _write_sharded_metadata
+
+    bucket = boto3.resource("s3").Bucket("covid-eo-data")
+    bucket.create()
+    result = {
+        "_all": {"co2": {"id": "co2", "domain": ["2019-01-01T00:00:00Z"]}},
+        "global": {"co2": {"id": "co2", "domain": ["2019-01-01T00:00:00Z"]}},
+        "tk": {"no2": {"domain": ["2020-01-01T00:00:00Z"]}},
+    }
+
+    manifest = _write_sharded_metadata(result)
+    assert set(manifest["shards"]) == {"_all", "_datasets", "global", "tk"}
+    stored = json.loads(
+        bucket.Object("dev-dataset-metadata/manifest.json").get()["Body"].read()
+    )
+    assert stored == manifest
+
+    shard = manifest["shards"]["tk"]
+    body = gzip.decompress(bucket.Object(shard["key"]).get()["Body"].read())
+    assert hashlib.sha256(body).hexdigest() == shard["sha256"]
+    assert json.loads(body) == result["tk"]
+
+    shard = manifest["shards"]["_datasets"]
+    body = gzip.decompress(bucket.Object(shard["key"]).get()["Body"].read())
+    assert json.loads(body) == {"co2": {"id": "co2"}}
+
+    # same content, same shards
+    assert _write_sharded_metadata(result)["shards"] == manifest["shards"]
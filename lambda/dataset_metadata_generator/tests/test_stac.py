@@ -0,0 +1,115 @@
+"""Test class for STAC ingestion, against a local stub STAC API"""
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+COLLECTIONS = [
+    {"id": f"collection-{i}", "title": f"Collection {i}", "description": "stub"}
+    for i in range(5)
+]
+COLLECTIONS.append(
+    {
+        "id": "broken",
+        "description": "items can't be fetched",
+        "extent": {"temporal": {"interval": [["2020-01-01T00:00:00Z", None]]}},
+    }
+)
+
+
+class StubSTAC(BaseHTTPRequestHandler):
+    """Paginates collections (2 per page) and items (`limit` per page)"""
+
+    def log_message(self, *args):
+        pass
+
+    def _page(self, objects, key, limit):
+        url = urlparse(self.path)
+        page = int(parse_qs(url.query).get("page", [0])[0])
+        body = {key: objects[page * limit : (page + 1) * limit], "links": []}
+        if (page + 1) * limit < len(objects):
+            body["links"].append(
+                {
+                    "rel": "next",
+                    "href": f"http://{self.headers['host']}{url.path}?page={page + 1}&limit={limit}",
+                }
+            )
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.end_headers()
+        self.wfile.write(json.dumps(body).encode())
+
+    def do_GET(self):
+        path = urlparse(self.path).path.strip("/").split("/")
+        if path == ["collections"]:
+            return self._page(COLLECTIONS, "collections", 2)
+
+        if path[0] == "collections" and path[2] == "items" and path[1] != "broken":
+            limit = int(parse_qs(urlparse(self.path).query)["limit"][0])
+            items = [
+                {"properties": {"datetime": f"2020-01-{day:02d}T12:00:00Z"}}
+                for day in range(1, 11)
+                for _ in range(2)
+            ]
+            return self._page(items, "features", limit)
+
+        self.send_response(404)
+        self.end_headers()
+
+
+@pytest.fixture
+def stac_api():
+    """Local stub STAC API"""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubSTAC)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/"
+    server.shutdown()
+
+
+def test_fetch_stac_datasets(stac_api, monkeypatch):
+    """Collections and items pages are followed, datasets get a domain"""
+    from ..src import stac
+
+    monkeypatch.setattr(stac, "ITEMS_LIMIT", 3)
+    datasets = stac.fetch_stac_datasets(stac_api, max_workers=4)
+
+    assert [d["id"] for d in datasets] == [c["id"] for c in COLLECTIONS]
+    assert datasets[0]["name"] == "Collection 0"
+    assert datasets[0]["domain"] == [f"2020-01-{day:02d}T00:00:00Z" for day in range(1, 11)]
+    # falls back to the temporal extent of the collection
+    assert datasets[-1]["name"] == "broken"
+    assert datasets[-1]["domain"] == ["2020-01-01T00:00:00Z"]
+
+
+def test_fetch_stac_datasets_incremental(stac_api, monkeypatch):
+    """Only the items dated from the end of the previous domain are fetched"""
+    from ..src import stac
+
+    requests = []
+    paginate = stac._paginate
+
+    def _paginate(session, url, key, params=None):
+        requests.append(params)
+        return paginate(session, url, key, params)
+
+    monkeypatch.setattr(stac, "_paginate", _paginate)
+    state = {
+        "collection-0": ["2019-12-01T00:00:00Z"],
+        "broken": ["2019-12-01T00:00:00Z"],
+    }
+    datasets = stac.fetch_stac_datasets(stac_api, max_workers=1, state=state)
+
+    assert {
+        "limit": stac.ITEMS_LIMIT,
+        "fields": stac.ITEMS_FIELDS,
+        "datetime": "2019-12-01T00:00:00Z/..",
+    } in requests
+    assert datasets[0]["domain"] == ["2019-12-01T00:00:00Z"] + [
+        f"2020-01-{day:02d}T00:00:00Z" for day in range(1, 11)
+    ]
+    assert state["collection-0"] == datasets[0]["domain"]
+    # falls back to the previous domain
+    assert state["broken"] == datasets[-1]["domain"] == ["2019-12-01T00:00:00Z"]
@@ -2,6 +2,18 @@
 
 from mangum import Mangum
 
-from dashboard_api.main import app
+from dashboard_api import keepwarm, warmup
+from dashboard_api.main import app, cache
 
-handler = Mangum(app, enable_lifespan=False)
+# init phase: runs once per lambda container (or before the SnapStart snapshot)
+warmup.warm_up(cache=cache)
+warmup.register_snapshot_hooks(cache)
+
+asgi_handler = Mangum(app, enable_lifespan=False)
+
+
+def handler(event, context):
+    """Handle API Gateway events and keep-warm (scheduled) events."""
+    if keepwarm.is_warm_event(event):
+        return keepwarm.handle(event, context)
+    return asgi_handler(event, context)
@@ -63,7 +63,7 @@ setup(
     author_email="info@developmentseed.org",
     url="https://github.com/developmentseed/dashboard_api",
     license="MIT",
-    packages=find_packages(exclude=["ez_setup", "examples", "tests"]),
+    packages=find_packages(exclude=["ez_setup", "examples", "tests", "benchmarks"]),
     package_data={
         "dashboard_api": ["templates/*.html", "templates/*.xml", "db/static/**/*.json"]
     },
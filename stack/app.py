@@ -126,6 +126,21 @@ class dashboardApiLambdaStack(core.Stack):
                 DATASET_METADATA_FILENAME=dataset_metadata_filename,
             )
         )
+        if config.TILE_STORE:
+            lambda_env["TILE_STORE"] = config.TILE_STORE
+        if config.WARMUP:
+            lambda_env["WARMUP"] = config.WARMUP
+        if config.KEEP_WARM_RATE:
+            lambda_env.update(
+                dict(
+                    KEEP_WARM_MIN=str(config.KEEP_WARM_MIN),
+                    # pings must not use all the reserved concurrency
+                    KEEP_WARM_MAX=str(
+                        max(1, concurrent // 2) if concurrent else config.KEEP_WARM_MAX
+                    ),
+                    KEEP_WARM_FACTOR=str(config.KEEP_WARM_FACTOR),
+                )
+            )
 
         lambda_function_props = dict(
             runtime=aws_lambda.Runtime.PYTHON_3_7,
@@ -149,6 +164,54 @@ class dashboardApiLambdaStack(core.Stack):
         lambda_function.add_to_role_policy(logs_access)
         lambda_function.add_to_role_policy(ec2_network_access)
 
+        if config.TILE_STORE and config.TILE_STORE.startswith("s3://"):
+            tile_store_bucket = config.TILE_STORE[len("s3://"):].split("/")[0]
+            lambda_function.add_to_role_policy(
+                iam.PolicyStatement(
+                    actions=["s3:GetObject", "s3:PutObject"],
+                    resources=[f"arn:aws:s3:::{tile_store_bucket}/*"],
+                )
+            )
+
+        if config.KEEP_WARM_RATE:
+            # the lambda invokes itself concurrently with warm pings (see
+            # `dashboard_api.keepwarm`), as many times as its recent concurrency
+            # (a separate policy: the function's default policy can't refer
+            # to the function itself)
+            iam.Policy(
+                self,
+                f"{id}-keep-warm-policy",
+                roles=[lambda_function.role],
+                statements=[
+                    iam.PolicyStatement(
+                        actions=["lambda:InvokeFunction"],
+                        resources=[lambda_function.function_arn],
+                    ),
+                    iam.PolicyStatement(
+                        actions=[
+                            "cloudwatch:GetMetricStatistics",
+                            "cloudwatch:PutMetricData",
+                        ],
+                        resources=["*"],
+                    ),
+                ],
+            )
+            aws_events.Rule(
+                self,
+                f"{id}-keep-warm",
+                schedule=aws_events.Schedule.rate(
+                    core.Duration.minutes(config.KEEP_WARM_RATE)
+                ),
+                targets=[
+                    aws_events_targets.LambdaFunction(
+                        lambda_function,
+                        event=aws_events.RuleTargetInput.from_object(
+                            {"warmer": {"fanout": True}}
+                        ),
+                    )
+                ],
+            )
+
         # defines an API Gateway Http API resource backed by our "dynamoLambda" function.
         api = apigw.HttpApi(
             self,
@@ -53,3 +53,20 @@ MAX_CONCURRENT: int = 500 if STAGE == "prod" else config['MAX_CONCURRENT']
 CACHE_NODE_TYPE = config['CACHE_NODE_TYPE']
 CACHE_ENGINE = config['CACHE_ENGINE']
 CACHE_NODE_NUM = config['CACHE_NODE_NUM']
+
+# Optional persistent tile store backing the cache (e.g `s3://bucket/tiles`)
+TILE_STORE = config.get('TILE_STORE')
+
+# Warm up steps of the lambda init phase (`clients` if not set, see
+# `dashboard_api.warmup`)
+WARMUP = config.get('WARMUP')
+
+# Keep-warm: every KEEP_WARM_RATE minutes (0 to disable), invoke the lambda
+# concurrently with warm pings, as many times as its recent peak concurrency
+# (times KEEP_WARM_FACTOR, at least KEEP_WARM_MIN and at most half of
+# MAX_CONCURRENT, so that pings don't throttle requests, or KEEP_WARM_MAX
+# without reserved concurrency)
+KEEP_WARM_RATE: int = config.get('KEEP_WARM_RATE') or 0
+KEEP_WARM_MIN: int = config.get('KEEP_WARM_MIN') or 1
+KEEP_WARM_FACTOR: float = config.get('KEEP_WARM_FACTOR') or 1
+KEEP_WARM_MAX: int = config.get('KEEP_WARM_MAX') or 50
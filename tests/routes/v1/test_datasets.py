@@ -2,11 +2,13 @@
 
 
 import json
+from concurrent.futures import ThreadPoolExecutor
 
 import boto3
 from moto import mock_s3
 
 from dashboard_api.core.config import BUCKET
+from dashboard_api.models.static import CachePolicy, DatasetInternal
 
 DATASET_METADATA_FILENAME = "dev-dataset-metadata.json"
 
@@ -68,3 +70,193 @@ def test_incorrect_dataset_id(app):
 
     response = app.get("/v1/datasets/NOT_A_VALID_DATASET")
     assert response.status_code == 404
+
+
+@mock_s3
+def test_sharded_datasets(app):
+    """Only the shards needed by a request are loaded"""
+    import gzip
+    import hashlib
+
+    from dashboard_api.db.static.datasets import datasets
+
+    bucket = _setup_s3(empty=True)
+    dataset = {
+        "id": "co2",
+        "name": "test name",
+        "type": "test type",
+        "source": {"tiles": ["data.tif"], "type": "test type"},
+    }
+    domain = ["2019-01-01T00:00:00Z", "2020-01-01T00:00:00Z"]
+    shards = {
+        "_all": {"co2": {**dataset, "domain": domain}},
+        "_datasets": {"co2": dataset},
+        "global": {"co2": {**dataset, "domain": domain}},
+        "tk": {"co2": {"domain": domain[:1]}},
+    }
+    manifest = {"version": 1, "shards": {}}
+    for name, shard in shards.items():
+        body = json.dumps(shard).encode()
+        key = f"dev-dataset-metadata/{name}.json.gz"
+        bucket.put_object(Body=gzip.compress(body), Key=key)
+        manifest["shards"][name] = {
+            "key": key,
+            "sha256": hashlib.sha256(body).hexdigest(),
+            "compression": "gzip",
+        }
+    bucket.put_object(
+        Body=json.dumps(manifest), Key="dev-dataset-metadata/manifest.json"
+    )
+    datasets.manifest_cache.clear()
+    datasets.shards_cache.clear()
+
+    response = app.get("v1/datasets/global")
+    assert response.status_code == 200
+    content = json.loads(response.content)
+    assert content["datasets"][0]["domain"] == domain
+    assert set(datasets.shards_cache) == {
+        "dev-dataset-metadata/_datasets.json.gz",
+        "dev-dataset-metadata/global.json.gz",
+    }
+
+    datasets.manifest_cache.clear()
+    datasets.shards_cache.clear()
+
+
+def test_datasets_sync():
+    """The manifest is reloaded when the datasets generation changes"""
+    from dashboard_api.db.static.datasets import datasets
+
+    class Cache:
+        generations = [1, 1]
+
+        def get_generations(self, *namespaces):
+            return self.generations
+
+    cache = Cache()
+    datasets.sync(cache)
+    datasets.manifest_cache["manifest"] = {"version": 1, "shards": {}}
+    datasets.sync(cache)
+    assert "manifest" in datasets.manifest_cache
+
+    cache.generations = [1, 2]
+    datasets.sync(cache)
+    assert "manifest" not in datasets.manifest_cache
+    datasets.sync(None)
+    assert datasets.generation == [1, 2]
+
+
+@mock_s3
+def test_datasets_rle_domain(app):
+    """Domains are run-length encoded on request"""
+    _setup_s3()
+    response = app.get("v1/datasets", params={"domain_format": "rle"})
+    assert response.status_code == 200
+    content = json.loads(response.content)
+    co2 = next(d for d in content["datasets"] if d["id"] == "co2")
+    assert co2["domain"] == {
+        "encoding": "rle",
+        "runs": [
+            {
+                "start": "2019-01-01T00:00:00Z",
+                "end": "2020-01-01T00:00:00Z",
+                "step": 12,
+                "unit": "month",
+                "exceptions": None,
+            }
+        ],
+    }
+
+    response = app.get("v1/datasets")
+    co2 = next(d for d in json.loads(response.content)["datasets"] if d["id"] == "co2")
+    assert co2["domain"] == ["2019-01-01T00:00:00Z", "2020-01-01T00:00:00Z"]
+
+
+def test_cache_policy(dataset_manager, monkeypatch):
+    """Tiles of dated COGs are immutable, unless disabled by the dataset."""
+    manager = dataset_manager()
+
+    def dataset(folder, template, **kwargs):
+        return DatasetInternal.parse_obj(
+            {
+                "id": folder,
+                "name": "test name",
+                "type": "raster-timeseries",
+                "s3_location": folder,
+                "source": {
+                    "type": "raster",
+                    "tiles": [f"{{api_url}}/{{z}}/{{x}}/{{y}}@1x?url={template}"],
+                },
+                **kwargs,
+            }
+        )
+
+    datasets = {
+        "MOD13A1.006": dataset(
+            "MOD13A1.006", "https://modis-vi-nasa.s3.amazonaws.com/MOD13A1.006/{date}.tif"
+        ),
+        "xco2-mean": dataset(
+            "xco2-mean",
+            "s3://covid-eo-data/xco2-mean/xco2_16day_mean.{date}.tif",
+            cache_control={"max_age": 60, "immutable": False},
+        ),
+        "bm_500m_daily": dataset(
+            "bm_500m_daily",
+            "s3://covid-eo-data/bm_500m_daily/VNP46A2_V011_{spotlightId}_{date}_cog.tif",
+            cache_control={"max_age": 86400},
+        ),
+    }
+    monkeypatch.setattr(manager, "_data", lambda: datasets)
+
+    dated = "https://modis-vi-nasa.s3.amazonaws.com/MOD13A1.006/2018-01-17.tif"
+    assert manager.cache_policy("MOD13A1.006", dated).immutable
+    assert not manager.cache_policy(
+        "MOD13A1.006", "https://modis-vi-nasa.s3.amazonaws.com/MOD13A1.006/latest.tif"
+    )
+    assert not manager.cache_policy("unknown", dated)
+
+    policy = manager.cache_policy(
+        "xco2-mean", "s3://covid-eo-data/xco2-mean/xco2_16day_mean.2019_01_01.tif"
+    )
+    assert policy.max_age == 60
+    assert not policy.immutable
+
+    policy = manager.cache_policy(
+        "bm_500m_daily",
+        "s3://covid-eo-data/bm_500m_daily/VNP46A2_V011_ny_2020_01_01_cog.tif",
+    )
+    assert policy.max_age == 86400
+    assert policy.immutable
+
+
+def test_cache_policy_reload(dataset_manager, monkeypatch):
+    """Policies are rebuilt without the lock, and not swapped in once dropped."""
+    manager = dataset_manager()
+    calls = []
+
+    def _lock():
+        assert manager.lock.acquire(blocking=False)
+        manager.lock.release()
+
+    def _cache_policies():
+        # other threads can load shards meanwhile
+        with ThreadPoolExecutor(1) as executor:
+            executor.submit(_lock).result()
+        calls.append(manager.policies_version)
+        if len(calls) == 1:
+            manager.policies = None
+            manager.policies_version += 1
+        return {"folder": (CachePolicy(max_age=60), [])}
+
+    monkeypatch.setattr(manager, "_cache_policies", _cache_policies)
+    assert manager.cache_policy("folder").max_age == 60
+    assert manager.policies is None
+
+    assert manager.cache_policy("folder").max_age == 60
+    assert manager.cache_policy("folder").max_age == 60
+    assert len(calls) == 2
+
+    # expired: rebuilt on the next lookup
+    manager.policies = (0, manager.policies[1])
+    assert manager.cache_policy("folder").max_age == 60
+    assert len(calls) == 3
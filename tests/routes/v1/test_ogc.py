@@ -2,12 +2,16 @@
 
 # from typing import Dict
 
-from mock import patch
+import os
+
+from mock import Mock, patch
 
 from ...conftest import mock_rio
 
+FIXTURES = os.path.join(os.path.dirname(__file__), "..", "..", "fixtures")
+
 
-@patch("dashboard_api.api.api_v1.endpoints.ogc.rasterio")
+@patch("rio_tiler.io.cogeo.rasterio")
 def test_wmts(rio, app):
     """test wmts endpoints."""
     rio.open = mock_rio
@@ -29,3 +33,59 @@ def test_wmts(rio, app):
         "http://testserver/v1/{TileMatrix}/{TileCol}/{TileRow}@2x.jpg?url=https"
         in response.content.decode()
     )
+
+
+@patch("rio_tiler.io.cogeo.rasterio")
+def test_wmts_cache(rio, app, monkeypatch):
+    """Capabilities use the COG footprint and are cached with an ETag."""
+    from benchmarks.memcache import InMemoryMemcache
+    from dashboard_api.api import footprint, utils
+    from dashboard_api.db import memcache
+
+    rio.open = Mock(side_effect=mock_rio)
+    footprint._footprints.clear()
+    footprint._bounds.clear()
+    footprint._failures.clear()
+    url = "/v1/WMTSCapabilities.xml?url=https://myurl.com/cog.tif"
+    expected = app.get(url).content
+    assert rio.open.called
+    rio.open.reset_mock()
+
+    computed = []
+    original = footprint.compute
+
+    def compute(url, *args):
+        computed.append(url)
+        return original(url.replace("https://myurl.com", FIXTURES), *args)
+
+    monkeypatch.setattr(footprint, "compute", compute)
+    monkeypatch.setattr(memcache, "Client", InMemoryMemcache)
+    cache = memcache.CacheLayer("localhost")
+    app.app.dependency_overrides[utils.get_cache] = lambda: cache
+    try:
+        footprint._footprints.clear()
+        footprint._bounds.clear()
+        footprint._failures.clear()
+        response = app.get(url)
+        assert response.content == expected
+        etag = response.headers["etag"]
+
+        footprint._footprints.clear()
+        footprint._bounds.clear()
+        footprint._failures.clear()
+        response = app.get(url)
+        assert response.content == expected
+        assert response.headers["etag"] == etag
+        assert len(computed) == 1
+
+        assert response.headers["cache-control"] == "public, max-age=3600"
+
+        response = app.get(
+            url, headers={"If-None-Match": etag, "Accept-Encoding": "gzip"}
+        )
+        assert response.status_code == 304
+        assert "content-encoding" not in response.headers
+        assert not response.raw.read()
+    finally:
+        app.app.dependency_overrides.clear()
+    assert not rio.open.called
@@ -35,3 +35,24 @@ def test_site_id(app):
 
     response = app.get("/v1/sites/be")
     assert response.status_code == 200
+
+
+@mock_s3
+def test_sites_cache(app, monkeypatch):
+    """Cached /sites responses are served as is."""
+    from benchmarks.memcache import InMemoryMemcache
+    from dashboard_api import main
+    from dashboard_api.db import memcache
+
+    _setup_s3()
+    monkeypatch.setattr(memcache, "Client", InMemoryMemcache)
+    monkeypatch.setattr(main, "cache", memcache.CacheLayer("localhost"))
+
+    response = app.get("/v1/sites")
+    assert response.status_code == 200
+    assert "X-Cache" not in response.headers
+
+    cached = app.get("/v1/sites")
+    assert cached.status_code == 200
+    assert cached.headers["X-Cache"] == "HIT"
+    assert cached.json() == response.json()
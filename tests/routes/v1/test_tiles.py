@@ -1,14 +1,18 @@
 """test /v1/tiles endpoints."""
 
+import math
+import os
 from io import BytesIO
 from typing import Dict
 
 import numpy
-from mock import patch
+from mock import Mock, patch
 from rasterio.io import MemoryFile
 
 from ...conftest import mock_rio
 
+FIXTURES = os.path.join(os.path.dirname(__file__), "..", "..", "fixtures")
+
 
 def parse_img(content: bytes) -> Dict:
     with MemoryFile(content) as mem:
@@ -16,9 +20,11 @@ def parse_img(content: bytes) -> Dict:
             return dst.meta
 
 
-@patch("dashboard_api.api.api_v1.endpoints.tiles.cogeo.rasterio")
-def test_tile(rio, app):
+@patch("rio_tiler.io.cogeo.rasterio")
+def test_tile(rio, app, monkeypatch):
     """test tile endpoints."""
+    from dashboard_api.core import config
+
     rio.open = mock_rio
 
     # full tile
@@ -76,3 +82,218 @@ def test_tile(rio, app):
     )
     assert response.status_code == 200
     assert response.headers["content-type"] == "image/png"
+    meta = parse_img(response.content)
+    assert meta["count"] == 1  # paletted
+
+    monkeypatch.setattr(config, "TILE_ENCODING_HEADER", True)
+    compact = app.get(
+        "/v1/8/84/47?url=https://myurl.com/cog.tif&nodata=0&rescale=0,1000&color_map=viridis",
+        headers={"X-Tile-Encoding": "compact"},
+    )
+    assert compact.status_code == 200
+    assert len(compact.content) <= len(response.content)
+
+
+@patch("rio_tiler.io.cogeo.rasterio")
+def test_tile_encoding_header(rio, app, monkeypatch):
+    """The `X-Tile-Encoding` header is ignored unless enabled."""
+    from dashboard_api.api import encoding
+    from dashboard_api.core import config
+
+    rio.open = mock_rio
+    profiles = []
+    creation_options = encoding.creation_options
+
+    def _creation_options(driver, profile):
+        profiles.append(profile)
+        return creation_options(driver, profile)
+
+    monkeypatch.setattr(encoding, "creation_options", _creation_options)
+    url = "/v1/8/84/47?url=https://myurl.com/cog.tif&nodata=0&rescale=0,1000"
+    headers = {"X-Tile-Encoding": "compact"}
+    assert app.get(url, headers=headers).status_code == 200
+    assert profiles == ["fast"]
+
+    monkeypatch.setattr(config, "TILE_ENCODING_HEADER", True)
+    assert app.get(url, headers=headers).status_code == 200
+    assert profiles == ["fast", "compact"]
+
+
+@patch("rio_tiler.io.cogeo.rasterio")
+def test_tile_empty(rio, app, monkeypatch):
+    """Tiles outside the COG footprint are transparent and not read."""
+    from dashboard_api.api import footprint
+
+    rio.open = Mock(side_effect=mock_rio)
+    compute = footprint.compute
+    monkeypatch.setattr(
+        footprint,
+        "compute",
+        lambda url, *args: compute(url.replace("https://myurl.com", FIXTURES), *args),
+    )
+    footprint._footprints.clear()
+    footprint._bounds.clear()
+    footprint._failures.clear()
+
+    response = app.get("/v1/8/10/10?url=https://myurl.com/cog.tif&rescale=0,1000")
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "image/png"
+    with MemoryFile(response.content) as mem:
+        with mem.open() as dst:
+            assert not dst.read_masks().any()
+    assert not rio.open.called
+
+    response = app.get("/v1/8/10/10.jpg?url=https://myurl.com/cog.tif&rescale=0,1000")
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "image/jpg"
+
+    response = app.get("/v1/8/87/48?url=https://myurl.com/cog.tif&rescale=0,1000")
+    assert response.status_code == 200
+    assert rio.open.called
+
+
+@patch("rio_tiler.io.cogeo.rasterio")
+def test_tile_etag(rio, app, monkeypatch):
+    """Tiles have an ETag and the dataset's cache policy, matches are 304."""
+    from dashboard_api.db.static.datasets import _dated_url_pattern, datasets
+    from dashboard_api.models.static import CachePolicy
+
+    rio.open = mock_rio
+    template = "{api_url}/{z}/{x}/{y}?url=https://myurl.com/xco2/cog_{date}.tif"
+    monkeypatch.setattr(
+        datasets,
+        "policies",
+        (
+            math.inf,
+            {
+                "xco2": (
+                    CachePolicy(max_age=86400, stale_while_revalidate=600),
+                    [_dated_url_pattern(template)],
+                )
+            },
+        ),
+    )
+
+    url = "/v1/8/87/48?url=https://myurl.com/cog.tif&rescale=0,1000"
+    response = app.get(url)
+    assert response.status_code == 200
+    assert response.headers["cache-control"] == "public, max-age=3600"
+    etag = response.headers["etag"]
+
+    response = app.get(
+        url, headers={"If-None-Match": f'W/"other", {etag}', "Accept-Encoding": "gzip"}
+    )
+    assert response.status_code == 304
+    assert response.headers["etag"] == etag
+    assert "content-encoding" not in response.headers
+    assert not response.raw.read()
+
+    response = app.get(url, headers={"If-None-Match": '"other"'})
+    assert response.status_code == 200
+
+    response = app.get("/v1/8/87/48?url=https://myurl.com/xco2/cog.tif&rescale=0,1000")
+    assert response.headers["etag"] == etag
+    assert (
+        response.headers["cache-control"]
+        == "public, max-age=86400, stale-while-revalidate=600"
+    )
+
+    # dated COG
+    response = app.get(
+        "/v1/8/87/48?url=https://myurl.com/xco2/cog_2020_01_01.tif&rescale=0,1000"
+    )
+    assert response.headers["cache-control"] == "public, max-age=86400, immutable"
+
+
+@patch("rio_tiler.io.cogeo.rasterio")
+def test_tile_cache_hit(rio, app, monkeypatch):
+    """Cached tiles are served without looking up the COG footprint or policy."""
+    from benchmarks.memcache import InMemoryMemcache
+    from dashboard_api.api import footprint, utils
+    from dashboard_api.db import memcache
+    from dashboard_api.db.static.datasets import datasets
+    from dashboard_api.models.static import CachePolicy
+
+    rio.open = mock_rio
+    lookups = []
+    get_footprint = footprint.get_footprint
+
+    async def _get_footprint(url, cache=None):
+        lookups.append(url)
+        return await get_footprint(url, cache)
+
+    policies = []
+
+    def _cache_policy(folder, url=None):
+        policies.append(url)
+        return CachePolicy(max_age=60)
+
+    monkeypatch.setattr(footprint, "get_footprint", _get_footprint)
+    monkeypatch.setattr(datasets, "cache_policy", _cache_policy)
+    monkeypatch.setattr(memcache, "Client", InMemoryMemcache)
+    cache = memcache.CacheLayer("localhost")
+    app.app.dependency_overrides[utils.get_cache] = lambda: cache
+    try:
+        url = "/v1/8/87/48?url=https://myurl.com/cog.tif&rescale=0,1000"
+        assert app.get(url).status_code == 200
+        assert len(lookups) == 1
+
+        response = app.get(url)
+        assert response.headers["X-Cache"] == "HIT"
+        assert response.headers["cache-control"].startswith("public, max-age=60")
+        assert len(lookups) == 1
+        assert len(policies) == 1
+    finally:
+        app.app.dependency_overrides.clear()
+
+
+@patch("rio_tiler.io.cogeo.rasterio")
+def test_tile_store(rio, app, monkeypatch, tmp_path):
+    """Tiles promoted from the store keep their ETag and cache TTL."""
+    from benchmarks.memcache import InMemoryMemcache
+    from dashboard_api.api import utils
+    from dashboard_api.core import config
+    from dashboard_api.db import memcache
+    from dashboard_api.db.static.datasets import _dated_url_pattern, datasets
+    from dashboard_api.db.store import FileTileStore
+    from dashboard_api.models.static import CachePolicy
+
+    rio.open = mock_rio
+    template = "{api_url}/{z}/{x}/{y}?url=https://myurl.com/xco2/cog_{date}.tif"
+    monkeypatch.setattr(
+        datasets,
+        "policies",
+        (math.inf, {"xco2": (CachePolicy(), [_dated_url_pattern(template)])}),
+    )
+    monkeypatch.setattr(memcache, "Client", InMemoryMemcache)
+    cache = memcache.CacheLayer("localhost", store=FileTileStore(str(tmp_path)))
+    app.app.dependency_overrides[utils.get_cache] = lambda: cache
+    try:
+        url = "/v1/8/87/48?url=https://myurl.com/xco2/cog_2020_01_01.tif&rescale=0,1000"
+        response = app.get(url)
+        assert response.status_code == 200
+        etag = response.headers["etag"]
+
+        # evicted from memcached
+        cache.client.store = {
+            k: v for k, v in cache.client.store.items() if k.startswith("generation:")
+        }
+        timeouts = []
+        set_value = cache.client.set
+
+        def _set(key, value, time=0):
+            timeouts.append(time)
+            return set_value(key, value, time=time)
+
+        monkeypatch.setattr(cache.client, "set", _set)
+        response = app.get(url)
+        assert response.headers["X-Cache"] == "HIT"
+        assert response.headers["etag"] == etag
+        assert len(timeouts) == 1
+        # TTLs over 30 days are sent as timestamps
+        assert timeouts[0] > config.TILES_IMMUTABLE_CACHE_TTL
+
+        (key,) = [k for k in cache.client.store if not k.startswith("generation:")]
+        assert cache.client.get(key)[2] == etag
+    finally:
+        app.app.dependency_overrides.clear()
@@ -0,0 +1,90 @@
+"""Test dashboard_api.db.domains."""
+
+import datetime
+import random
+
+
+def _dates(start, days):
+    start = datetime.datetime.strptime(start, "%Y-%m-%d")
+    return [
+        (start + datetime.timedelta(days=d)).strftime("%Y-%m-%dT%H:%M:%SZ")
+        for d in days
+    ]
+
+
+def test_encode_daily():
+    """Dense daily series are encoded as a few runs."""
+    from dashboard_api.db import domains
+
+    dates = _dates("2019-12-01", [d for d in range(1000) if d not in (40, 500, 501)])
+    dates += _dates("2019-12-01", [1100, 1116, 1132])
+    encoded = domains.encode(dates)
+    assert encoded["runs"] == [
+        {
+            "start": "2019-12-01T00:00:00Z",
+            "end": "2022-08-26T00:00:00Z",
+            "step": 1,
+            "unit": "day",
+            "exceptions": [
+                "2020-01-10T00:00:00Z",
+                "2021-04-14T00:00:00Z",
+                "2021-04-15T00:00:00Z",
+            ],
+        },
+        {
+            "start": "2022-12-05T00:00:00Z",
+            "end": "2023-01-06T00:00:00Z",
+            "step": 16,
+            "unit": "day",
+        },
+    ]
+    assert domains.decode(encoded) == dates
+    assert domains.format_domain(encoded, "list") == dates
+    assert domains.format_domain(dates, "rle") == encoded
+
+
+def test_encode_monthly():
+    """Dates on the first day of each month are encoded in months."""
+    from dashboard_api.db import domains
+
+    dates = [f"{y}-{m:02d}-01T00:00:00Z" for y in (2019, 2020) for m in range(1, 13)]
+    encoded = domains.encode(dates)
+    assert encoded["runs"] == [
+        {
+            "start": "2019-01-01T00:00:00Z",
+            "end": "2020-12-01T00:00:00Z",
+            "step": 1,
+            "unit": "month",
+        }
+    ]
+    assert domains.decode(encoded) == dates
+
+
+def test_roundtrip():
+    """Decoding gives back the encoded dates."""
+    from dashboard_api.db import domains
+
+    rng = random.Random(0)
+    for _ in range(50):
+        dates = sorted(set(_dates("2020-01-01", rng.sample(range(400), 50))))
+        assert domains.decode(domains.encode(dates)) == dates
+
+    assert domains.encode(["2020-01-01T12:00:00Z"]) is None
+    assert domains.format_domain(["2020-01-01T12:00:00Z"], "rle") == [
+        "2020-01-01T12:00:00Z"
+    ]
+
+
+def test_standalone():
+    """The metadata generator imports domains without the API's modules."""
+    import subprocess
+    import sys
+
+    code = (
+        "import sys; from dashboard_api.db import domains; "
+        "print(sorted(m for m in sys.modules if m.startswith('dashboard_api')))"
+    )
+    output = subprocess.check_output([sys.executable, "-c", code], text=True)
+    assert output.strip() == str(
+        ["dashboard_api", "dashboard_api.db", "dashboard_api.db.domains"]
+    )
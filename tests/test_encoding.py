@@ -0,0 +1,63 @@
+"""Test dashboard_api.api.encoding."""
+
+import numpy
+from rasterio.io import MemoryFile
+from rio_tiler.utils import render
+
+
+def _rgba(content: bytes) -> numpy.ndarray:
+    with MemoryFile(content) as mem:
+        with mem.open() as dst:
+            if dst.count == 1 and dst.colormap(1):
+                cmap = dst.colormap(1)
+                lut = numpy.array(
+                    [cmap.get(i, (0, 0, 0, 0)) for i in range(256)], "uint8"
+                )
+                return numpy.moveaxis(lut[dst.read(1)], -1, 0)
+            return dst.read()
+
+
+def test_paletted():
+    """Tiles with a colormap are encoded as paletted PNGs, masked pixels transparent."""
+    from dashboard_api.api import utils
+    from dashboard_api.api.encoding import encode
+
+    tile = numpy.arange(256 * 256, dtype="uint16").reshape(1, 256, 256) % 200
+    tile = tile.astype("uint8")
+    mask = numpy.full((256, 256), 255, dtype="uint8")
+    mask[:, :100] = 0
+
+    content = encode(tile, mask, "PNG", colormap="viridis", ZLEVEL=3)
+    rgba = render(tile, mask, img_format="PNG", colormap=utils.get_cmap("viridis"))
+    assert len(content) < len(rgba)
+
+    paletted, expected = _rgba(content), _rgba(rgba)
+    assert paletted.shape == (4, 256, 256)
+    assert (paletted[3, :, :100] == 0).all()
+    assert (paletted[:, :, 100:] == expected[:, :, 100:]).all()
+
+    # no free palette entry for the masked pixels: RGBA
+    tile[0, 0, 100:] = numpy.arange(156)
+    tile[0, 1, 100:200] = numpy.arange(156, 256)
+    assert _rgba(encode(tile, mask, "PNG", colormap="viridis")).shape[0] == 4
+
+
+def test_constant_tiles():
+    """Empty and uniform tiles are encoded once."""
+    from dashboard_api.api import encoding
+
+    encoding._empty.cache_clear()
+    encoding._uniform.cache_clear()
+
+    tile = numpy.zeros((1, 256, 256), dtype="uint8")
+    empty = numpy.zeros((256, 256), dtype="uint8")
+    full = numpy.full((256, 256), 255, dtype="uint8")
+
+    content = encoding.encode(tile, empty, "PNG", ZLEVEL=3)
+    assert encoding.encode(tile + 5, empty, "PNG", ZLEVEL=3) is content
+    assert (_rgba(content)[-1] == 0).all()
+
+    content = encoding.encode(tile + 7, full, "PNG", colormap="viridis")
+    assert encoding.encode(tile + 7, full, "PNG", colormap="viridis") is content
+    assert encoding.encode(tile + 8, full, "PNG", colormap="viridis") is not content
+    assert encoding._uniform.cache_info().currsize == 2
@@ -0,0 +1,136 @@
+"""Test dashboard_api.core.executors."""
+
+import asyncio
+
+import numpy
+import pytest
+
+
+def test_run_io():
+    """I/O calls run in the I/O threads, in the caller's context."""
+    import threading
+
+    from dashboard_api.core import executors, timing
+
+    def read():
+        with timing.stage("read"):
+            return threading.current_thread().name
+
+    async def request():
+        timings = timing.start_request()
+        name = await executors.run_io(read)
+        return name, timings
+
+    name, timings = asyncio.get_event_loop().run_until_complete(request())
+    assert name.startswith("gdal-io")
+    assert "read" in timings.stages
+
+
+def test_run_cpu(monkeypatch):
+    """CPU-bound calls run in the process pool when CPU_WORKERS is set."""
+    from rio_tiler.utils import render
+
+    from dashboard_api.api import utils
+    from dashboard_api.core import config, executors
+
+    tile = numpy.arange(256 * 256, dtype="uint16").reshape(1, 256, 256)
+    mask = numpy.full((256, 256), 255, dtype="uint8")
+    kwargs = dict(rescale="0,65535", color_formula=None)
+
+    def run():
+        async def _run():
+            # postprocess rescales the tile in place
+            rescaled = await executors.run_cpu(
+                utils.postprocess, tile.copy(), mask, **kwargs
+            )
+            return await executors.run_cpu(
+                render,
+                rescaled,
+                mask,
+                img_format="PNG",
+                colormap=utils.get_cmap("viridis"),
+            )
+
+        return asyncio.get_event_loop().run_until_complete(_run())
+
+    assert executors.cpu_executor() is None
+    in_threads = run()
+
+    monkeypatch.setattr(config, "CPU_WORKERS", 1)
+    executors.shutdown()
+    try:
+        assert executors.cpu_executor() is not None
+        assert run() == in_threads
+    finally:
+        executors.shutdown()
+
+
+def test_run_cpu_shared(monkeypatch):
+    """Tiles are sent to the rendering processes through shared memory."""
+    import os
+
+    from dashboard_api.api import utils
+    from dashboard_api.core import config, executors
+
+    tile = numpy.arange(512 * 512, dtype="float32").reshape(1, 512, 512)
+    mask = numpy.full((512, 512), 255, dtype="uint8")
+    kwargs = dict(
+        img_format="PNG", colormap="viridis", rescale="0,262144", color_formula=None
+    )
+
+    def run():
+        async def _run():
+            # render_tile modifies the tile in place
+            return await executors.run_cpu_shared(
+                utils.render_tile, [tile.copy(), mask], **kwargs
+            )
+
+        return asyncio.get_event_loop().run_until_complete(_run())
+
+    in_threads = run()
+
+    def segments():
+        return {name for name in os.listdir("/dev/shm") if name.startswith("psm_")}
+
+    before = segments()
+    monkeypatch.setattr(config, "CPU_WORKERS", 1)
+    executors.shutdown()
+    try:
+        assert run() == in_threads
+        assert segments() == before
+
+        async def fail():
+            await executors.run_cpu_shared(utils.render_tile, [tile], img_format="?")
+
+        with pytest.raises(Exception):
+            asyncio.get_event_loop().run_until_complete(fail())
+        assert segments() == before
+    finally:
+        executors.shutdown()
+
+
+def crash_once(path):
+    """Kill the worker process on the first call."""
+    import os
+
+    if not os.path.exists(path):
+        open(path, "w").close()
+        os._exit(1)
+    return os.getpid()
+
+
+def test_broken_cpu_executor(monkeypatch, tmp_path):
+    """The process pool is replaced when a worker dies, the call is retried."""
+    from dashboard_api.core import config, executors
+
+    monkeypatch.setattr(config, "CPU_WORKERS", 1)
+    executors.shutdown()
+    try:
+        executor = executors.cpu_executor()
+        pid = asyncio.get_event_loop().run_until_complete(
+            executors.run_cpu(crash_once, str(tmp_path / "crashed"))
+        )
+        assert pid
+        assert executors.cpu_executor() is not executor
+    finally:
+        executors.shutdown()
@@ -0,0 +1,154 @@
+"""Test dashboard_api.api.footprint."""
+
+import os
+
+import mercantile
+import numpy
+import rasterio
+from rasterio.transform import from_origin
+
+FIXTURE = os.path.join(os.path.dirname(__file__), "fixtures", "cog.tif")
+
+
+def test_footprint(tmp_path):
+    """Tiles outside the bounds or the valid data of a COG don't intersect it."""
+    from dashboard_api.api.footprint import Footprint, compute
+
+    path = str(tmp_path / "nodata.tif")
+    data = numpy.ones((1, 512, 512), dtype="uint8")
+    data[:, :, 256:] = 0  # no data east of -59.744
+    with rasterio.open(
+        path,
+        "w",
+        driver="GTiff",
+        dtype="uint8",
+        count=1,
+        height=512,
+        width=512,
+        crs="EPSG:4326",
+        transform=from_origin(-60, 10, 0.001, 0.001),
+        nodata=0,
+        tiled=True,
+    ) as dst:
+        dst.write(data)
+        dst.build_overviews([2, 4, 8])
+
+    fp = compute(path, size=64)
+    assert fp.mask.shape == (64, 64)
+    assert Footprint.from_dict(fp.to_dict()).mask.tolist() == fp.mask.tolist()
+
+    west = mercantile.tile(-59.9, 9.8, 12)
+    east = mercantile.tile(-59.55, 9.8, 12)
+    assert fp.intersects(west.x, west.y, west.z)
+    assert not fp.intersects(east.x, east.y, east.z)
+    assert fp.intersects(east.x, east.y, east.z, use_mask=False)
+    assert fp.intersects(0, 0, 1)
+    assert not fp.intersects(1, 1, 1)
+
+    assert compute(path, size=0).mask is None
+    assert compute(path, size=64, max_pixels=512 * 511).mask is None
+    # no nodata: bounds only
+    assert compute(FIXTURE).mask is None
+
+
+def test_footprint_small_area(tmp_path):
+    """Small valid areas, missing from the overviews, are in the mask."""
+    from dashboard_api.api.footprint import compute
+
+    path = str(tmp_path / "patch.tif")
+    data = numpy.zeros((1, 2048, 2000), dtype="uint8")
+    data[:, 1500:1503, 1200:1203] = 1
+    with rasterio.open(
+        path,
+        "w",
+        driver="GTiff",
+        dtype="uint8",
+        count=1,
+        height=2048,
+        width=2000,
+        crs="EPSG:4326",
+        transform=from_origin(-60, 10, 0.0001, 0.0001),
+        nodata=0,
+        tiled=True,
+    ) as dst:
+        dst.write(data)
+        dst.build_overviews([2, 4, 8, 16, 32])
+
+    fp = compute(path, size=64)
+    assert fp.mask.shape == (64, 63)
+    assert fp.mask.sum() == 1
+    assert fp.mask[1500 // 32, 1200 // 32]
+
+    patch = mercantile.tile(-60 + 1201 * 0.0001, 10 - 1501 * 0.0001, 14)
+    empty = mercantile.tile(-60 + 100 * 0.0001, 10 - 100 * 0.0001, 14)
+    assert fp.intersects(patch.x, patch.y, patch.z)
+    assert not fp.intersects(empty.x, empty.y, empty.z)
+
+
+def test_footprint_failure(monkeypatch):
+    """Footprints that can't be computed aren't retried by every request."""
+    import asyncio
+
+    from dashboard_api.api import footprint
+
+    calls = []
+
+    def compute(url, *args):
+        calls.append(url)
+        raise IOError("not a COG")
+
+    monkeypatch.setattr(footprint, "compute", compute)
+    monkeypatch.setattr(footprint, "_failures", footprint.TTLCache(16, 60))
+    for _ in range(2):
+        fp = asyncio.get_event_loop().run_until_complete(
+            footprint.get_footprint("s3://bucket/broken.tif")
+        )
+        assert fp is None
+    assert calls == ["s3://bucket/broken.tif"]
+
+
+def test_footprint_background(monkeypatch, tmp_path):
+    """Masks are computed in the background, footprints have their bounds until then."""
+    import asyncio
+
+    from dashboard_api.api import footprint
+    from dashboard_api.core import executors
+
+    path = str(tmp_path / "nodata.tif")
+    data = numpy.ones((1, 512, 512), dtype="uint8")
+    data[:, :, 256:] = 0
+    with rasterio.open(
+        path,
+        "w",
+        driver="GTiff",
+        dtype="uint8",
+        count=1,
+        height=512,
+        width=512,
+        crs="EPSG:4326",
+        transform=from_origin(-60, 10, 0.001, 0.001),
+        nodata=0,
+        tiled=True,
+    ) as dst:
+        dst.write(data)
+
+    monkeypatch.setattr(footprint, "_footprints", footprint.TTLCache(16, 60))
+    monkeypatch.setattr(footprint, "_bounds", footprint.TTLCache(16, 60))
+    loop = asyncio.get_event_loop()
+
+    fp = loop.run_until_complete(footprint.get_footprint(path, mask=False))
+    assert fp.mask is None
+    assert not footprint._pending
+    assert path in footprint._bounds
+
+    fp = loop.run_until_complete(footprint.get_footprint(path))
+    assert fp.mask is None
+    # the background executor has a single worker
+    executors.background_executor().submit(int).result()
+    assert not footprint._pending
+
+    fp = loop.run_until_complete(footprint.get_footprint(path))
+    assert fp.mask is not None
+    east = mercantile.tile(-59.55, 9.8, 12)
+    assert not fp.intersects(east.x, east.y, east.z)
+    assert path not in footprint._bounds
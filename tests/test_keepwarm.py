@@ -0,0 +1,101 @@
+"""Test dashboard_api.keepwarm."""
+
+import datetime
+
+
+def test_target_concurrency():
+    """The recent and previous day peaks are scaled and clamped."""
+    from dashboard_api.keepwarm import target_concurrency
+
+    assert target_concurrency([], [], minimum=1, maximum=50, factor=1) == 1
+    assert target_concurrency([3, 7], [2], minimum=1, maximum=50, factor=1) == 7
+    assert target_concurrency([3], [10], minimum=1, maximum=50, factor=1.5) == 15
+    assert target_concurrency([3], [10], minimum=1, maximum=8, factor=1) == 8
+
+
+def test_concurrency_from_metrics():
+    """Concurrency is read from the function's ConcurrentExecutions metric,
+    without the warm pings."""
+    from dashboard_api.keepwarm import concurrency_from_metrics, publish_pings
+
+    class CloudWatch:
+        def __init__(self):
+            self.calls = []
+            self.pings = []
+
+        def get_metric_statistics(self, **kwargs):
+            self.calls.append(kwargs)
+            start = kwargs["StartTime"]
+            if kwargs["MetricName"] == "WarmPings":
+                return {"Datapoints": self.pings}
+            value = 4 if start > now - datetime.timedelta(hours=1) else 9
+            return {
+                "Datapoints": [
+                    {"Timestamp": start, "Maximum": value},
+                    {"Timestamp": start + datetime.timedelta(minutes=1), "Maximum": 1},
+                ]
+            }
+
+        def put_metric_data(self, Namespace, MetricData):
+            for data in MetricData:
+                self.pings.append(
+                    {"Timestamp": data["Timestamp"], "Maximum": data["Value"]}
+                )
+
+    now = datetime.datetime(2021, 6, 1, 7, 0)
+    cloudwatch = CloudWatch()
+    assert concurrency_from_metrics("api", now=now, cloudwatch=cloudwatch) == 9
+    functions = [c["Dimensions"][0]["Value"] for c in cloudwatch.calls]
+    assert functions == ["api"] * 4
+    assert cloudwatch.calls[2]["StartTime"] == now - datetime.timedelta(days=1)
+
+    # the pings of the previous day's fan out don't count
+    publish_pings("api", 8, now=now - datetime.timedelta(days=1), cloudwatch=cloudwatch)
+    assert concurrency_from_metrics("api", now=now, cloudwatch=cloudwatch) == 4
+
+
+def test_fan_out():
+    """Concurrent pings are answered by distinct containers."""
+    from dashboard_api.keepwarm import fan_out
+
+    responses = iter(
+        [
+            {"container": "a", "cold": True},
+            {"container": "b", "cold": False},
+            None,
+            {"container": "a", "cold": True},
+        ]
+    )
+
+    def send(hold):
+        response = next(responses)
+        if response is None:
+            raise ConnectionError()
+        return response
+
+    assert fan_out(4, send, hold=0) == dict(pings=4, containers=2, cold=1, errors=1)
+    assert fan_out(0, send)["pings"] == 0
+
+
+def test_warm_route(app):
+    """The `/_warm` route answers warm pings."""
+    response = app.get("/_warm")
+    assert response.status_code == 200
+    body = response.json()
+    assert set(body) == {"container", "cold", "uptime"}
+
+    assert app.get("/_warm").json()["container"] == body["container"]
+    assert app.get("/_warm").json()["cold"] is False
+
+
+def test_handle_ping():
+    """Warm ping events are handled without the ASGI app."""
+    from dashboard_api.keepwarm import handle, is_warm_event
+
+    event = {"warmer": {"hold": 0}}
+    assert is_warm_event(event)
+    assert not is_warm_event({"httpMethod": "GET", "path": "/v1/datasets"})
+    assert "container" in handle(event)
+    assert handle({"warmer": {"fanout": True, "concurrency": 1}}) == dict(
+        concurrency=1, pings=0, containers=0, cold=0, errors=0
+    )
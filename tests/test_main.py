@@ -19,3 +19,78 @@ def test_index(app):
     assert response.status_code == 200
     assert response.headers["content-type"] == "text/html; charset=utf-8"
     assert response.headers["content-encoding"] == "gzip"
+
+
+def test_metrics(app, monkeypatch):
+    """Test /metrics endpoint."""
+    from dashboard_api.core import config, metrics
+
+    assert app.get("/metrics").status_code == 404
+    monkeypatch.setattr(config, "METRICS_TOKEN", "secret")
+    assert app.get("/metrics").status_code == 401
+    response = app.get("/metrics", headers={"Authorization": "Bearer other"})
+    assert response.status_code == 401
+
+    requests = metrics.registry.counter("test_requests_total", "Test counter.")
+    requests.inc(keyspace="tiles", result="hit")
+    latency = metrics.registry.histogram("test_seconds", "Test histogram.", [0.1, 1])
+    latency.observe(0.5, keyspace="tiles")
+
+    response = app.get("/metrics", headers={"Authorization": "Bearer secret"})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    body = response.content.decode()
+    assert "# TYPE test_requests_total counter" in body
+    assert 'test_requests_total{keyspace="tiles",result="hit"} 1' in body
+    assert 'test_seconds_bucket{keyspace="tiles",le="0.1"} 0' in body
+    assert 'test_seconds_bucket{keyspace="tiles",le="1"} 1' in body
+    assert 'test_seconds_count{keyspace="tiles"} 1' in body
+
+
+def test_server_timing(app, monkeypatch):
+    """Every response has a `Server-Timing` header and is recorded by route."""
+    from dashboard_api.core import config, timing
+
+    assert timing.get_timings() is None
+    with timing.stage("outside"):
+        pass
+
+    response = app.get("/ping")
+    assert response.status_code == 200
+    assert "total;dur=" in response.headers["server-timing"]
+
+    monkeypatch.setattr(config, "METRICS_TOKEN", "secret")
+    response = app.get("/metrics", headers={"Authorization": "Bearer secret"})
+    body = response.content.decode()
+    assert (
+        'http_request_duration_seconds_count{method="GET",route="ping",status="200"}'
+        in body
+    )
+
+
+def test_gzip_bodyless():
+    """Empty and 304 responses are sent without a (gzipped) body."""
+    from starlette.applications import Starlette
+    from starlette.responses import Response
+    from starlette.testclient import TestClient
+
+    from dashboard_api.core.compression import GZipMiddleware
+
+    gzipped = Starlette()
+    gzipped.add_middleware(GZipMiddleware, minimum_size=0)
+
+    @gzipped.route("/{status:int}")
+    def respond(request):
+        status = request.path_params["status"]
+        return Response(b"" if status != 200 else b"data", status_code=status)
+
+    client = TestClient(gzipped)
+    for status in (204, 304):
+        response = client.get(f"/{status}", headers={"Accept-Encoding": "gzip"})
+        assert response.status_code == status
+        assert "content-encoding" not in response.headers
+        assert not response.raw.read()
+
+    response = client.get("/200", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.content == b"data"
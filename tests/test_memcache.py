@@ -0,0 +1,146 @@
+"""Test dashboard_api.db.memcache."""
+
+import pytest
+
+from benchmarks.memcache import InMemoryMemcache
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    """CacheLayer backed by an in-memory client."""
+    from dashboard_api.db import memcache
+
+    monkeypatch.setattr(memcache, "Client", InMemoryMemcache)
+    return memcache.CacheLayer("localhost")
+
+
+def test_versioned_key(cache):
+    """Bumping a namespace changes the keys that depend on it."""
+    from dashboard_api.db.memcache import (
+        DATASETS_NAMESPACE,
+        bump_generations,
+        dataset_namespace,
+    )
+
+    tile_key = cache.versioned_key("tile", dataset_namespace("xco2-mean"))
+    datasets_key = cache.versioned_key("datasets", DATASETS_NAMESPACE)
+    assert tile_key == cache.versioned_key("tile", dataset_namespace("xco2-mean"))
+
+    bump_generations(cache, datasets=["xco2-mean"])
+    assert cache.versioned_key("tile", dataset_namespace("xco2-mean")) != tile_key
+    assert cache.versioned_key("datasets", DATASETS_NAMESPACE) == datasets_key
+
+    bump_generations(cache, everything=True)
+    assert cache.versioned_key("datasets", DATASETS_NAMESPACE) != datasets_key
+
+
+def test_evicted_generation(cache, monkeypatch):
+    """A lost generation counter never goes back to a previous value."""
+    from dashboard_api.db import memcache
+
+    monkeypatch.setattr(memcache.time, "time", lambda: 1000.0)
+    cache.bump_generation(memcache.site_namespace("tk"))
+    cache.bump_generation(memcache.site_namespace("tk"))
+    (before,) = cache.get_generations(memcache.site_namespace("tk"))
+    assert before == 1000001
+
+    cache.client.delete("generation:site:tk")
+    monkeypatch.setattr(memcache.time, "time", lambda: 1001.0)
+    (after,) = cache.get_generations(memcache.site_namespace("tk"))
+    assert after > before
+
+
+def test_persistent_store(monkeypatch, tmp_path):
+    """Tiles missing from memcached are promoted from the persistent store."""
+    from dashboard_api.db import memcache
+    from dashboard_api.db.store import FileTileStore, TileStore, get_tile_store
+    from dashboard_api.ressources.enums import ImageType
+    from dashboard_api.ressources.responses import get_etag
+
+    monkeypatch.setattr(memcache, "Client", InMemoryMemcache)
+    store = get_tile_store(f"file://{tmp_path}")
+    assert isinstance(store, FileTileStore)
+    cache = memcache.CacheLayer("localhost", store=store)
+
+    assert cache.set_persistent_image_cache("abcdef", (b"\x89PNG\n", ImageType.png))
+    assert not cache.client.get("abcdef")
+    assert cache.get_image_from_cache("abcdef", use_store=False) is None
+
+    content, ext, etag = cache.get_image_from_cache("abcdef")
+    assert content == b"\x89PNG\n"
+    assert ext == ImageType.png
+    assert etag == get_etag(content)
+    # promoted with its ETag, for the TTL of the tile
+    assert cache.client.get("abcdef") == (content, ext, etag)
+    times = []
+    monkeypatch.setattr(cache.client, "set", lambda k, v, time: times.append(time))
+    assert cache.get_persistent_image("abcdef", timeout=3600)[2] == etag
+    assert times == [3600]
+    control = "public, max-age=60"
+    assert cache.get_persistent_image("abcdef", cache_control=control)[3] == control
+
+    assert store.get("unknown") is None
+
+    with pytest.raises(TypeError):
+        TileStore()
+
+
+def test_cache_metrics(cache):
+    """Cache operations are recorded by keyspace."""
+    from dashboard_api.core import metrics
+    from dashboard_api.ressources.enums import ImageType
+
+    before = metrics.registry.snapshot()
+    assert cache.get_image_from_cache("tile") is None
+    assert cache.set_image_cache("tile", (b"image", ImageType.png))
+    assert cache.get_image_from_cache("tile") == (b"image", ImageType.png)
+    assert cache.get_dataset_from_cache("site", keyspace="sites") is None
+    changes = metrics.diff(before, metrics.registry.snapshot())
+
+    assert (
+        changes['cache_requests_total{keyspace="tiles",result="miss",tier="memcached"}']
+        == 1
+    )
+    assert (
+        changes['cache_requests_total{keyspace="tiles",result="hit",tier="memcached"}']
+        == 1
+    )
+    assert (
+        changes['cache_requests_total{keyspace="sites",result="miss",tier="memcached"}']
+        == 1
+    )
+    assert changes['cache_value_bytes_sum{keyspace="tiles"}'] == 5
+
+
+def test_image_etag(cache):
+    """ETags and Cache-Control headers are cached with the tiles."""
+    from dashboard_api.ressources.enums import ImageType
+    from dashboard_api.ressources.responses import get_etag
+
+    etag = get_etag(b"image")
+    assert cache.set_image_cache("tile", (b"image", ImageType.png), etag=etag)
+    assert cache.get_image_from_cache("tile") == (b"image", ImageType.png, etag)
+
+    control = "public, max-age=60"
+    cache.set_image_cache(
+        "tile", (b"image", ImageType.png), etag=etag, cache_control=control
+    )
+    assert cache.get_image_from_cache("tile") == (
+        b"image",
+        ImageType.png,
+        etag,
+        control,
+    )
+
+
+def test_long_ttl(cache, monkeypatch):
+    """TTLs longer than 30 days are sent to memcached as timestamps."""
+    from dashboard_api.db import memcache
+    from dashboard_api.ressources.enums import ImageType
+
+    times = []
+    monkeypatch.setattr(cache.client, "set", lambda k, v, time: times.append(time))
+    monkeypatch.setattr(memcache.time, "time", lambda: 1000.0)
+    cache.set_image_cache("tile", (b"image", ImageType.png), timeout=3600)
+    cache.set_image_cache("tile", (b"image", ImageType.png), timeout=31536000)
+    assert times == [3600, 31537000]
@@ -0,0 +1,69 @@
+"""Test dashboard_api.core.profiling."""
+
+import json
+import os
+
+
+def test_sampler():
+    """Samples are exported in the speedscope format."""
+    import time
+
+    from dashboard_api.core.profiling import Sampler
+
+    def busy():
+        end = time.perf_counter() + 0.05
+        while time.perf_counter() < end:
+            pass
+
+    sampler = Sampler(0.001)
+    sampler.start()
+    busy()
+    sampler.stop()
+
+    profile = sampler.speedscope("test")
+    assert profile["name"] == "test"
+    names = [frame["name"] for frame in profile["shared"]["frames"]]
+    assert "busy" in names
+    for p in profile["profiles"]:
+        assert p["type"] == "sampled"
+        assert len(p["samples"]) == len(p["weights"])
+        assert all(i < len(names) for stack in p["samples"] for i in stack)
+
+
+def test_signed_request(app, monkeypatch, tmp_path):
+    """Requests with a valid signature are profiled."""
+    from dashboard_api.core import config, profiling
+
+    monkeypatch.setattr(config, "PROFILE_LOCATION", str(tmp_path))
+    monkeypatch.setattr(config, "PROFILE_SECRET", "secret")
+
+    response = app.get("/ping", headers={"X-Profile-Signature": "invalid"})
+    assert response.status_code == 200
+    assert not os.listdir(tmp_path)
+
+    signature = profiling.sign("/ping")
+    response = app.get("/ping", headers={"X-Profile-Signature": signature})
+    assert response.status_code == 200
+    (profile,) = os.listdir(tmp_path / "ping")
+    assert profile.endswith(".speedscope.json")
+    with open(tmp_path / "ping" / profile) as f:
+        assert json.load(f)["name"] == "ping GET /ping?"
+
+
+def test_signature_expiry(monkeypatch):
+    """Signatures cover the request and expire."""
+    import time
+
+    from dashboard_api.core import config, profiling
+
+    monkeypatch.setattr(config, "PROFILE_SECRET", "secret")
+    signature = profiling.sign("/ping", "a=1")
+    assert profiling.verify(signature, "/ping", "a=1")
+    assert not profiling.verify(signature, "/ping", "a=2")
+    assert not profiling.verify("invalid", "/ping", "a=1")
+
+    expires, _, digest = signature.partition(".")
+    assert not profiling.verify(f"{int(expires) + 3600}.{digest}", "/ping", "a=1")
+
+    expired = profiling.sign("/ping", "a=1", expires=int(time.time()) - 1)
+    assert not profiling.verify(expired, "/ping", "a=1")
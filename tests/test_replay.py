@@ -0,0 +1,69 @@
+"""Test benchmarks.replay."""
+
+import json
+
+
+def test_parse_line():
+    """Requests are parsed from ALB, API Gateway and API logs."""
+    from benchmarks.replay import parse_line
+
+    alb = (
+        "https 2021-06-19T17:26:21.500000Z app/my-lb/50dc6c495c0c9188 "
+        "192.168.131.39:2817 10.0.0.1:80 0.000 0.001 0.000 200 200 34 366 "
+        '"GET https://api.example.com:443/v1/8/87/48@1x?url=s3://bucket/cog.tif HTTP/1.1" '
+        '"curl/7.46.0" ECDHE-RSA-AES128-GCM-SHA256 TLSv1.2'
+    )
+    request = parse_line(alb)
+    assert request.route == "tile"
+    assert request.method == "GET"
+    assert request.url == "/v1/8/87/48@1x?url=s3://bucket/cog.tif"
+    assert request.time == 1624123581.5
+
+    apigw = json.dumps(
+        {
+            "requestId": "abc",
+            "httpMethod": "GET",
+            "path": "/v1/datasets/be",
+            "requestTimeEpoch": 1624123581000,
+            "status": "200",
+        }
+    )
+    request = parse_line(apigw)
+    assert request.route == "get_dataset"
+    assert request.url == "/v1/datasets/be"
+    assert request.time == 1624123581
+
+    api = "2021-06-19T17:26:21.500Z\t{}".format(
+        json.dumps(
+            {
+                "time": 1624123581.5,
+                "method": "GET",
+                "path": "/v1/tilejson.json",
+                "query": "url=s3://bucket/cog.tif",
+                "route": "tilejson",
+            }
+        )
+    )
+    request = parse_line(api)
+    assert request.route == "tilejson"
+    assert request.url == "/v1/tilejson.json?url=s3://bucket/cog.tif"
+
+    # not a /v1 endpoint, or not a request
+    assert not parse_line(apigw.replace("/v1/datasets/be", "/ping"))
+    assert not parse_line("START RequestId: abc Version: $LATEST")
+
+
+def test_report():
+    """Latencies, errors and cache hits are summarized by route."""
+    from benchmarks.replay import Result, report
+
+    results = [
+        Result("tile", 0.1, 0, 200, "HIT"),
+        Result("tile", 0.3, 0.05, 200, None),
+        Result("get_sites", 0.2, 0, 500, None),
+    ]
+    summary = report(results, elapsed=1)
+    assert summary["all"]["requests"] == 3
+    assert summary["tile"]["hit_rate"] == 0.5
+    assert summary["tile"]["max_lag"] == 50
+    assert summary["get_sites"]["errors"] == 1
@@ -0,0 +1,54 @@
+"""Test dashboard_api.warmup."""
+
+import boto3
+import pytest
+from moto import mock_s3
+
+from dashboard_api.core.config import BUCKET
+
+
+def test_get_steps():
+    """Steps are selected by the WARMUP setting."""
+    from dashboard_api.warmup import STEPS, get_steps
+
+    assert get_steps("all") == list(STEPS)
+    assert get_steps("none") == []
+    assert get_steps("gdal, metadata") == ["gdal", "metadata"]
+    with pytest.raises(ValueError):
+        get_steps("gdal,jit")
+
+
+@mock_s3
+def test_warm_up(monkeypatch):
+    """Steps load the colormaps, metadata and clients; failures are skipped."""
+    from dashboard_api import warmup
+    from dashboard_api.api import utils
+    from dashboard_api.db.static.sites import sites
+    from dashboard_api.db.utils import s3_client
+
+    boto3.resource("s3").Bucket(BUCKET).create()
+    s3_client.cache_clear()
+    utils.get_cmap.cache_clear()
+    sites.sites_cache.clear()
+
+    def fail(cache):
+        raise RuntimeError("no GDAL")
+
+    monkeypatch.setitem(warmup.STEPS, "gdal", fail)
+    durations = warmup.warm_up()
+    assert list(durations) == list(warmup.STEPS)
+    assert durations["gdal"] is None
+    assert all(durations[step] is not None for step in list(durations)[1:])
+
+    assert utils.get_cmap.cache_info().currsize == len(utils.COLOR_MAP_NAMES)
+    assert "sites" in sites.sites_cache
+    client = s3_client()
+
+    warmup.after_restore()
+    assert s3_client() is not client
+
+    # self links are added per request, not to the loaded sites
+    api_url = "http://localhost"
+    for _ in range(2):
+        site = sites.get_all(api_url).sites[0]
+        assert [link.rel for link in site.links].count("self") == 1